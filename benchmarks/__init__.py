@@ -0,0 +1,7 @@
+"""Offline benchmarks of the requests_whaor request hot path.
+
+The benchmarks send requests through a local SOCKS5 stand-in for the rotating proxy to a local
+HTTP target, so they run with no network, no TOR and no Docker. Run them with:
+
+    python -m benchmarks.run --output benchmarks/results/latest.json
+"""
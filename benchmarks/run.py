@@ -0,0 +1,337 @@
+"""Benchmark Requestor.get throughput, latency and memory against local stand-in servers.
+
+Usage:
+    python -m benchmarks.run [--concurrency 1 8 32] [--requests 500] [--scenarios fast slow_body]
+        [--output results.json] [--compare baseline.json] [--threshold 0.2]
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import json
+import os
+from pathlib import Path
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Sequence
+from urllib.parse import urlencode
+
+from loguru import logger
+from pydantic import BaseModel as Base
+from requests_whaor.core import Requestor
+from requests_whaor.retry import RetryPolicy
+from requests_whaor.session import SessionOptions
+
+from .servers import serve, SOCKS5Server, TargetServer
+
+RESULTS_DIRECTORY = Path(__file__).parent / "results"
+
+
+class Scenario(Base):
+    """A benchmark workload.
+
+    Attributes:
+        name (str): Name of the scenario.
+        description (str): What the scenario measures.
+        query (Dict[str, Any]): Faults the target server injects, see TargetHandler.
+    """
+
+    name: str
+    description: str
+    query: Dict[str, Any] = dict()
+
+    def url(self, base_url: str) -> str:
+        """Return the url to request from a target server."""
+        return f"{base_url}?{urlencode(self.query)}" if self.query else base_url
+
+
+SCENARIOS = [
+    Scenario(name="fast", description="Tiny bodies with no delay, the pure hot path overhead."),
+    Scenario(name="latency", description="50ms server latency.", query={"latency": 0.05}),
+    Scenario(name="errors", description="10% retried 503 responses.", query={"error_rate": 0.1}),
+    Scenario(
+        name="slow_body",
+        description="64KiB bodies sent in 8 chunks, 5ms apart.",
+        query={"size": 65536, "chunks": 8, "chunk_delay": 0.005},
+    ),
+    Scenario(name="large_body", description="1MiB bodies.", query={"size": 1048576}),
+]
+
+
+def percentile(samples: Sequence[float], fraction: float) -> Optional[float]:
+    """Return the nearest rank percentile of the samples, None if there are none."""
+    if not samples:
+        return None
+
+    ordered = sorted(samples)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def create_requestor(proxy: SOCKS5Server, concurrency: int) -> Requestor:
+    """Create a requestor which sends requests through the SOCKS5 stand-in."""
+    return Requestor(
+        onions=[],
+        onion_balancer=proxy,
+        timeout=30,
+        max_retries=3,
+        session_options=SessionOptions.sized_for(1, concurrency),
+        retry_policy=RetryPolicy(max_attempts=3, backoff_base=0, budget_rate=None),
+    )
+
+
+def send_requests(requestor: Requestor, url: str, concurrency: int, count: int) -> List[float]:
+    """Send count requests from concurrency threads.
+
+    Returns:
+        List[float]: The latency of each request which got a successful response.
+    """
+
+    def timed_get(_: int) -> Optional[float]:
+        start = time.perf_counter()
+        response = requestor.get(url)
+
+        return time.perf_counter() - start if response is not None and response.ok else None
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = executor.map(timed_get, range(count))
+
+        return [latency for latency in latencies if latency is not None]
+
+
+def run_scenario(
+    scenario: Scenario,
+    proxy: SOCKS5Server,
+    target: TargetServer,
+    concurrency: int,
+    count: int,
+    trace_memory: bool = True,
+) -> Dict[str, Any]:
+    """Benchmark a scenario at a level of concurrency.
+
+    The timed pass runs without memory tracing, since tracemalloc slows allocations down.
+    A second, traced pass of the same size measures the peak memory the requests allocate.
+
+    Args:
+        scenario (Scenario): The workload.
+        proxy (SOCKS5Server): The running SOCKS5 stand-in.
+        target (TargetServer): The running target server.
+        concurrency (int): Number of threads sending requests.
+        count (int): Number of requests to send.
+        trace_memory (bool): If True measure peak memory with a second pass.
+
+    Returns:
+        Dict[str, Any]: The results.
+    """
+    url = scenario.url(target.url)
+    requestor = create_requestor(proxy, concurrency)
+
+    try:
+        # Warm up the keep-alive connection pool.
+        send_requests(requestor, url, concurrency, concurrency)
+        requestor.metrics = type(requestor.metrics)()
+
+        start = time.perf_counter()
+        latencies = send_requests(requestor, url, concurrency, count)
+        duration = time.perf_counter() - start
+
+        snapshot = requestor.metrics.snapshot()
+        peak_memory = None
+
+        if trace_memory:
+            tracemalloc.start()
+            send_requests(requestor, url, concurrency, count)
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    finally:
+        requestor.close()
+
+    return {
+        "scenario": scenario.name,
+        "concurrency": concurrency,
+        "requests": count,
+        "succeeded": len(latencies),
+        "duration": duration,
+        "throughput": len(latencies) / duration,
+        "latency": {
+            "mean": sum(latencies) / len(latencies) if latencies else None,
+            "p50": percentile(latencies, 0.5),
+            "p90": percentile(latencies, 0.9),
+            "p99": percentile(latencies, 0.99),
+            "max": max(latencies, default=None),
+        },
+        "retries": sum(snapshot["retries"].values()),
+        "failures": sum(snapshot["failures"].values()),
+        "received_bytes": snapshot["received_bytes"],
+        "peak_memory": peak_memory,
+    }
+
+
+def run(
+    scenarios: Sequence[Scenario],
+    concurrency_levels: Sequence[int],
+    count: int,
+    trace_memory: bool = True,
+) -> Dict[str, Any]:
+    """Run every scenario at every level of concurrency against fresh stand-in servers.
+
+    Returns:
+        Dict[str, Any]: Metadata about the run and a list of results.
+    """
+    proxy, target = SOCKS5Server(), TargetServer()
+    serve(proxy)
+    serve(target)
+
+    results = []
+
+    try:
+        for scenario in scenarios:
+            for concurrency in concurrency_levels:
+                result = run_scenario(scenario, proxy, target, concurrency, count, trace_memory)
+                results.append(result)
+
+                print(format_result(result), flush=True)
+
+    finally:
+        for server in (proxy, target):
+            server.shutdown()
+            server.server_close()
+
+    return {"metadata": metadata(), "results": results}
+
+
+def metadata() -> Dict[str, Any]:
+    """Return information about the environment the benchmarks ran in."""
+    try:
+        from importlib.metadata import version  # pylint: disable=import-outside-toplevel
+
+        package_version = version("requests-whaor")
+    except Exception:  # pylint: disable=broad-except
+        package_version = None
+
+    return {
+        "version": package_version,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def _milliseconds(seconds: Optional[float]) -> str:
+    """Format seconds as milliseconds."""
+    return "-" if seconds is None else f"{seconds * 1000:.1f}ms"
+
+
+def format_result(result: Dict[str, Any]) -> str:
+    """Format a result as a single line."""
+    memory = result["peak_memory"]
+
+    return (
+        f"{result['scenario']:<12} c={result['concurrency']:<4} "
+        f"{result['throughput']:>8.1f} req/s  "
+        f"p50 {_milliseconds(result['latency']['p50']):>9}  "
+        f"p99 {_milliseconds(result['latency']['p99']):>9}  "
+        f"retries {result['retries']:<4} "
+        f"peak {'-' if memory is None else f'{memory / 2 ** 20:.1f}MiB'}"
+    )
+
+
+def _change(new: Optional[float], old: Optional[float]) -> Optional[float]:
+    """Return the relative change from old to new, None if either is missing or old is 0."""
+    if new is None or not old:
+        return None
+
+    return new / old - 1
+
+
+def _percent(change: Optional[float]) -> str:
+    """Format a relative change as a signed percentage."""
+    return "n/a" if change is None else f"{change:+.1%}"
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Compare two benchmark runs.
+
+    Changes from a throughput of 0, or from or to a missing p99 latency, e.g. in a run where
+    every request failed, are reported as n/a and not counted as regressions.
+
+    Args:
+        current (Dict[str, Any]): The new run.
+        baseline (Dict[str, Any]): The run to compare against.
+        threshold (float): Relative change in throughput or p99 latency counted as a regression.
+
+    Returns:
+        List[str]: A description of each regression.
+    """
+    previous = {
+        (result["scenario"], result["concurrency"]): result for result in baseline["results"]
+    }
+    regressions = []
+
+    for result in current["results"]:
+        key = (result["scenario"], result["concurrency"])
+        old = previous.get(key)
+
+        if old is None:
+            continue
+
+        throughput = _change(result["throughput"], old["throughput"])
+        p99 = _change(result["latency"]["p99"], old["latency"]["p99"])
+
+        print(f"{key[0]:<12} c={key[1]:<4} throughput {_percent(throughput)}  p99 {_percent(p99)}")
+
+        if throughput is not None and throughput < -threshold:
+            regressions.append(f"{key[0]} c={key[1]} throughput dropped {-throughput:.1%}.")
+
+        if p99 is not None and p99 > threshold:
+            regressions.append(f"{key[0]} c={key[1]} p99 latency rose {p99:.1%}.")
+
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Run the benchmarks from the command line.
+
+    Returns:
+        int: Exit status, 1 if a regression against the baseline was found.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument(
+        "--scenarios",
+        nargs="+",
+        choices=[scenario.name for scenario in SCENARIOS],
+        default=[scenario.name for scenario in SCENARIOS],
+    )
+    parser.add_argument("--no-memory", action="store_true", help="Skip the memory pass.")
+    parser.add_argument("--output", type=Path, default=RESULTS_DIRECTORY / "latest.json")
+    parser.add_argument("--compare", type=Path, help="Results file to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    logger.disable("requests_whaor")
+
+    scenarios = [scenario for scenario in SCENARIOS if scenario.name in args.scenarios]
+    results = run(scenarios, args.concurrency, args.requests, trace_memory=not args.no_memory)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {args.output}")
+
+    if args.compare is None:
+        return 0
+
+    regressions = compare(results, json.loads(args.compare.read_text()), args.threshold)
+
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+"""Local stand-ins for the rotating proxy and the target web server."""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import select
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import Dict
+from urllib.parse import parse_qs, urlparse
+
+SOCKS_VERSION = 5
+
+
+class SOCKS5Handler(socketserver.BaseRequestHandler):
+    """Handles a single SOCKS5 CONNECT request without authentication."""
+
+    def _read(self, size: int) -> bytes:
+        """Read exactly size bytes from the client."""
+        data = b""
+
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+
+            if not chunk:
+                raise ConnectionError("SOCKS5 client disconnected.")
+
+            data += chunk
+
+        return data
+
+    def _read_address(self, address_type: int) -> str:
+        """Read the destination host of a CONNECT request."""
+        if address_type == 1:
+            return socket.inet_ntop(socket.AF_INET, self._read(4))
+
+        if address_type == 4:
+            return socket.inet_ntop(socket.AF_INET6, self._read(16))
+
+        return self._read(self._read(1)[0]).decode()
+
+    def handle(self) -> None:
+        """Negotiate the SOCKS5 handshake then relay data until either side closes."""
+        _, methods = self._read(2)
+        self._read(methods)
+        self.request.sendall(bytes([SOCKS_VERSION, 0]))
+
+        _, command, _, address_type = self._read(4)
+        host = self._read_address(address_type)
+        (port,) = struct.unpack(">H", self._read(2))
+
+        if command != 1:
+            self.request.sendall(bytes([SOCKS_VERSION, 7, 0, 1]) + bytes(6))
+            return
+
+        try:
+            remote = socket.create_connection((host, port))
+        except OSError:
+            self.request.sendall(bytes([SOCKS_VERSION, 5, 0, 1]) + bytes(6))
+            return
+
+        self.request.sendall(bytes([SOCKS_VERSION, 0, 0, 1]) + bytes(6))
+
+        # Relay small writes immediately, like HAProxy does, instead of waiting on Nagle.
+        for sock in (self.request, remote):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        with remote:
+            self._relay(self.request, remote)
+
+    @staticmethod
+    def _relay(client: socket.socket, remote: socket.socket) -> None:
+        """Copy data between both sockets until either side closes."""
+        peers = {client: remote, remote: client}
+
+        while True:
+            readable, _, _ = select.select(list(peers), [], [])
+
+            for sock in readable:
+                try:
+                    data = sock.recv(65536)
+                except OSError:
+                    return
+
+                if not data:
+                    return
+
+                peers[sock].sendall(data)
+
+
+class SOCKS5Server(socketserver.ThreadingTCPServer):
+    """Minimal SOCKS5 proxy standing in for the HAProxy and TOR rotating proxy."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> "SOCKS5Server":
+        """SOCKS5Server __init__ method.
+
+        Args:
+            host (str): Interface to listen on.
+            port (int): Port to listen on, 0 picks a free port.
+        """
+        super().__init__((host, port), SOCKS5Handler)
+
+    @property
+    def address(self) -> str:
+        """Return socks5 address to proxy requests through."""
+        host, port = self.server_address[:2]
+        return f"socks5://{host}:{port}"
+
+    @property
+    def proxies(self) -> Dict[str, str]:
+        """Return proxies to mount onto a requests session."""
+        return {"http": self.address, "https": self.address}
+
+
+class TargetHandler(BaseHTTPRequestHandler):
+    """Responds to GET requests with faults injected from the query string.
+
+    Query parameters:
+        latency: Seconds to wait before sending the response headers.
+        error_rate: Fraction of responses sent with the error status. Errors are spread
+            evenly over the servers requests, e.g. every tenth response for 0.1, so runs are
+            repeatable.
+        status: Status of the injected errors, defaults to 503.
+        size: Size of the response body in bytes.
+        chunks: Number of chunks the body is sent in.
+        chunk_delay: Seconds to wait before sending each chunk, to simulate a slow body.
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self) -> None:  # noqa: N802
+        """Send the response described by the query string."""
+        query = {key: values[-1] for key, values in parse_qs(urlparse(self.path).query).items()}
+
+        latency = float(query.get("latency", 0))
+        error_rate = float(query.get("error_rate", 0))
+        size = int(query.get("size", 2))
+        chunks = max(int(query.get("chunks", 1)), 1)
+        chunk_delay = float(query.get("chunk_delay", 0))
+
+        if latency:
+            time.sleep(latency)
+
+        status = int(query.get("status", 503)) if self.server.inject_error(error_rate) else 200
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+
+        chunk_size = -(-size // chunks)
+
+        for offset in range(0, size, chunk_size):
+            if chunk_delay:
+                time.sleep(chunk_delay)
+
+            self.wfile.write(b"x" * min(chunk_size, size - offset))
+
+    def log_message(self, *args) -> None:  # noqa: ANN002
+        """Silence request logging."""
+
+
+class TargetServer(ThreadingHTTPServer):
+    """Local HTTP server the benchmarked requests are sent to."""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> "TargetServer":
+        """Initialize the TargetServer.
+
+        Args:
+            host (str): Interface to listen on.
+            port (int): Port to listen on, 0 picks a free port.
+        """
+        super().__init__((host, port), TargetHandler)
+
+        self._requests = 0
+        self._lock = threading.Lock()
+
+    def inject_error(self, error_rate: float) -> bool:
+        """Return whether the next response should be an error, deterministically.
+
+        Args:
+            error_rate (float): Fraction of responses sent with an error.
+
+        Returns:
+            bool: True whenever the error count due so far goes up by one.
+        """
+        with self._lock:
+            self._requests += 1
+            count = self._requests
+
+        return int(count * error_rate) > int((count - 1) * error_rate)
+
+    @property
+    def url(self) -> str:
+        """Return the servers base url."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+
+def serve(server: socketserver.BaseServer) -> threading.Thread:
+    """Serve requests from a background thread until the servers shutdown method is called.
+
+    Args:
+        server (socketserver.BaseServer): The server.
+
+    Returns:
+        threading.Thread: The serving thread.
+    """
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    return thread
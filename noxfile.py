@@ -52,3 +52,10 @@ def docs(session):
     session.install("pydoc-markdown", "mkdocs-material", "mkdocs-mermaid2-plugin")
     session.run("python", "examples/burnit.py")
     session.run("pydoc-markdown", "pydoc-markdown.yml", "--server", "--open")
+
+
+@nox.session
+def benchmarks(session):
+    session.install("poetry")
+    session.run("poetry", "install")
+    session.run("poetry", "run", "python", "-m", "benchmarks.run", *session.posargs)
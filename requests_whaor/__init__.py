@@ -1,7 +1,39 @@
 """Requests With High Availability Onion Router."""
 
+from requests_whaor.aio import AsyncRequestsWhaor
+from requests_whaor.bans import BodyBanDetector, Quarantine, StatusBanDetector
+from requests_whaor.cache import ResponseCache
+from requests_whaor.coalesce import SingleFlight
 from requests_whaor.core import RequestsWhaor
+from requests_whaor.download import DownloadReport
+from requests_whaor.hedge import HedgePolicy
+from requests_whaor.retry import RetryPolicy
+from requests_whaor.runtime import DockerRuntime, FakeRuntime, LocalProcessRuntime
+from requests_whaor.scheduler import HostLimits, Scheduler
+from requests_whaor.stream import ResumableStream, StreamError
+from requests_whaor.timeouts import AdaptiveTimeouts
+from requests_whaor.tor_cache import TorCache
 
-__all__ = ["RequestsWhaor"]
+__all__ = [
+    "AdaptiveTimeouts",
+    "AsyncRequestsWhaor",
+    "BodyBanDetector",
+    "DockerRuntime",
+    "DownloadReport",
+    "FakeRuntime",
+    "HedgePolicy",
+    "HostLimits",
+    "LocalProcessRuntime",
+    "Quarantine",
+    "RequestsWhaor",
+    "ResponseCache",
+    "ResumableStream",
+    "RetryPolicy",
+    "Scheduler",
+    "SingleFlight",
+    "StatusBanDetector",
+    "StreamError",
+    "TorCache",
+]
 
 __version__ = "0.2.1"
@@ -0,0 +1,266 @@
+"""This module provides asyncio requests_whaor functionality."""
+
+import asyncio
+from contextlib import asynccontextmanager
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+from loguru import logger
+
+from .balancer import Balancer
+from .circuit import OnionCircuit
+from .core import RequestsWhaor
+from .metrics import RequestEvent, RequestorMetrics
+from .retry import RetryPolicy
+from .runtime import ContainerRuntime
+from .scheduler import Scheduler
+from .tor_cache import TorCache
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
+
+class AsyncRequestor:
+    """Makes proxied web requests via a rotating proxy TOR network from an asyncio event loop."""
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        onions: List[OnionCircuit],
+        onion_balancer: Balancer,
+        timeout: int,
+        max_retries: int,
+        max_concurrency: int = 100,
+        keep_alive: Optional[int] = 60,
+        retry_policy: Optional[RetryPolicy] = None,
+        scheduler: Optional[Scheduler] = None,
+    ) -> "AsyncRequestor":
+        """Initialize the AsyncRequestor.
+
+        Args:
+            onions (List[OnionCircuit]): List of TOR containers.
+            onion_balancer (Balancer): Balancer instances connected to TOR containers
+                on the same network.
+            timeout (int): Requests timeout.
+            max_retries (int): Max number of time to retry on bad response or connection error.
+            max_concurrency (int): Max number of requests in flight at the same time.
+            keep_alive (Optional[int]): Seconds an idle connection to the balancer is kept
+                alive. None keeps connections alive indefinitely.
+            retry_policy (Optional[RetryPolicy]): Decides which failures are retried and when.
+                Defaults to a policy making up to max_retries attempts.
+            scheduler (Optional[Scheduler]): If set, every attempt waits its turn within the
+                per host limits. It can be shared with a Requestor.
+
+        Raises:
+            ImportError: If httpx with socks support is not installed.
+        """
+        if httpx is None:
+            raise ImportError(
+                "AsyncRequestor requires httpx, install it with the requests-whaor[async] extra."
+            )
+
+        self.timeout = timeout
+        self.onions = onions
+        self.onion_balancer = onion_balancer
+        self.max_retries = max_retries
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=max_retries)
+        self.max_concurrency = max_concurrency
+        self.scheduler = scheduler
+
+        self.metrics = RequestorMetrics()
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(
+                proxy=self.rotating_proxy,
+                limits=httpx.Limits(
+                    max_connections=max_concurrency,
+                    max_keepalive_connections=max_concurrency,
+                    keepalive_expiry=keep_alive,
+                ),
+            ),
+            timeout=timeout,
+        )
+
+    @property
+    def rotating_proxy(self) -> str:
+        """Rotating proxy frontend input address."""
+        return self.onion_balancer.address
+
+    @asynccontextmanager
+    async def _schedule(self, url: str) -> AsyncIterator[None]:
+        """Hold the urls scheduler slot, if there is a scheduler."""
+        if self.scheduler is None:
+            yield
+            return
+
+        async with self.scheduler.async_slot(url):
+            yield
+
+    async def get(self, url: str, **kwargs) -> Optional["httpx.Response"]:  # noqa: ANN003
+        """Async counterpart of Requestor.get.
+
+        Sends the get request through the rotating proxy, retrying on connection failures and
+        retryable status_codes with the same retry policy as Requestor.get. Backing off never
+        blocks the event loop, and each attempt waits for a free slot on the concurrency
+        semaphore, so at most max_concurrency requests are in flight. With a scheduler, an
+        attempt first waits its turn for the host, without holding a semaphore slot.
+
+        Args:
+            url (str): url to send the get request.
+            **kwargs: keyword arguments to pass to httpx.AsyncClient.get() method.
+
+        Returns:
+            Response: If a successful or terminal response is found else None.
+        """
+        kwargs.pop("proxies", None)
+        kwargs.pop("timeout", None)
+
+        attempt = 0
+        reasons = []
+
+        while True:
+            attempt += 1
+            start = time.monotonic()
+
+            try:
+                async with self._schedule(url), self.semaphore:
+                    start = time.monotonic()
+
+                    with self.metrics.track():
+                        response = await self.client.get(url, timeout=self.timeout, **kwargs)
+
+                self.metrics.record(
+                    RequestEvent(
+                        url=url,
+                        status_code=response.status_code,
+                        total=time.monotonic() - start,
+                        received_bytes=len(response.content),
+                    )
+                )
+
+                if self.scheduler is not None:
+                    self.scheduler.observe(url, response.status_code, response.headers)
+
+                if response.is_success or not self.retry_policy.is_retryable(response.status_code):
+                    response.retries = attempt - 1
+                    response.retry_reasons = reasons
+                    return response
+
+                reasons.append(str(response.status_code))
+
+            except httpx.TransportError as error:
+                self.metrics.record(
+                    RequestEvent(
+                        url=url, error=type(error).__name__, total=time.monotonic() - start
+                    )
+                )
+                reasons.append(type(error).__name__)
+                logger.error(error)
+
+            if not self.retry_policy.should_retry(attempt):
+                break
+
+            self.metrics.record_retry(reasons[-1])
+
+            delay = self.retry_policy.backoff(attempt)
+            logger.debug(f"Retrying in {delay:.2f} seconds after {reasons[-1]}.")
+            await asyncio.sleep(delay)
+
+        logger.debug(f"Giving up on {url} after {attempt} attempts: {', '.join(reasons)}.")
+
+        return None
+
+    async def close(self) -> None:
+        """Close the async client connections."""
+        await self.client.aclose()
+
+
+@asynccontextmanager
+async def AsyncRequestsWhaor(  # pylint: disable=invalid-name, too-many-arguments
+    onion_count: int = 5,
+    start_with_threads: bool = True,
+    max_threads: Optional[int] = None,
+    timeout: int = 5,
+    show_log: bool = False,
+    max_retries: int = 5,
+    max_concurrency: int = 100,
+    keep_alive: Optional[int] = 60,
+    retry_policy: Optional[RetryPolicy] = None,
+    runtime: Optional[ContainerRuntime] = None,
+    scheduler: Optional[Scheduler] = None,
+    startup_threads: Optional[int] = None,
+    torrc_options: Optional[Dict[str, str]] = None,
+    tor_cache: Optional[TorCache] = None,
+    circuits_per_container: int = 1,
+) -> AsyncIterator[AsyncRequestor]:
+    """Async context manager which starts n amount of tor nodes behind a round robin proxy.
+
+    The containers are started and stopped in a worker thread so the event loop is never
+    blocked.
+
+    Args:
+        onion_count (int): Number of TOR circuits to spin up.
+        start_with_threads (bool): If True uses treads to spin up containers.
+        max_threads (Optional[int]): Max number of threads to use when spinning up containers,
+            unless startup_threads is set. Also sizes the underlying requestors connection
+            pools.
+        timeout (int): Requests timeout.
+        show_log (bool): If True shows the containers logs.
+        max_retries (int): Max number of time to retry on bad response or connection error.
+        max_concurrency (int): Max number of requests in flight at the same time.
+        keep_alive (Optional[int]): Seconds an idle connection to the balancer is kept alive.
+        retry_policy (Optional[RetryPolicy]): Decides which failures are retried and when.
+            Defaults to a policy making up to max_retries attempts.
+        runtime (Optional[ContainerRuntime]): Runtime to run TOR and HAProxy on. Defaults to
+            Docker.
+        scheduler (Optional[Scheduler]): If set, requests are rate limited and queued fairly
+            per host.
+        startup_threads (Optional[int]): Max number of threads starting and stopping the TOR
+            containers. Defaults to max_threads, or onion_count capped at MAX_STARTUP_THREADS.
+        torrc_options (Optional[Dict[str, str]]): Extra options of the shared torrc.
+        tor_cache (Optional[TorCache]): If set, TOR containers start from its cached directory
+            documents.
+        circuits_per_container (int): Number of isolated SOCKS ports each TOR container
+            serves, each registered as its own balancer server.
+
+    Yields:
+        AsyncRequestor: Makes proxied web requests via a rotating proxy TOR network.
+    """
+    loop = asyncio.get_running_loop()
+
+    requests_whaor = RequestsWhaor(
+        onion_count=onion_count,
+        start_with_threads=start_with_threads,
+        max_threads=max_threads,
+        timeout=timeout,
+        show_log=show_log,
+        max_retries=max_retries,
+        runtime=runtime,
+        startup_threads=startup_threads,
+        torrc_options=torrc_options,
+        tor_cache=tor_cache,
+        circuits_per_container=circuits_per_container,
+    )
+    requestor = await loop.run_in_executor(None, requests_whaor.__enter__)
+
+    try:
+        async_requestor = AsyncRequestor(
+            onions=requestor.onions,
+            onion_balancer=requestor.onion_balancer,
+            timeout=timeout,
+            max_retries=max_retries,
+            max_concurrency=max_concurrency,
+            keep_alive=keep_alive,
+            retry_policy=retry_policy,
+            scheduler=scheduler,
+        )
+
+        try:
+            yield async_requestor
+
+        finally:
+            await async_requestor.close()
+
+    finally:
+        await loop.run_in_executor(None, requests_whaor.__exit__, None, None, None)
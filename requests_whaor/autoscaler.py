@@ -0,0 +1,245 @@
+"""This module provides a background autoscaler for the pool of TOR circuits."""
+
+import math
+import threading
+import time
+from typing import Any, Dict, Optional, TYPE_CHECKING
+
+from loguru import logger
+from pydantic import BaseModel as Base, validator
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .core import Requestor
+
+
+class AutoscalerOptions(Base):
+    """Handles options for the onion pool autoscaler.
+
+    The pool scales up when any of the high water marks is crossed and scales down only when
+    every load signal is below its low water mark. The gap between the marks, the number of
+    consecutive checks required and the cooldowns keep the pool from flapping.
+
+    Attributes:
+        min_onions (int): Min number of onions to scale down to.
+        max_onions (int): Max number of onions to scale up to.
+        interval (float): Seconds between each check of the load signals.
+        consecutive_checks (int): Number of consecutive checks a decision must hold for.
+        scale_up_cooldown (float): Seconds to wait after scaling before scaling up again.
+        scale_down_cooldown (float): Seconds to wait after scaling before scaling down again.
+        scale_up_ratio (float): Fraction of the pool to add when scaling up, at least one.
+        scale_down_step (int): Number of onions to remove when scaling down.
+        max_queue (int): Scale up when more connections than this are queued on the balancer.
+        sessions_high (float): Scale up above this many active sessions per onion.
+        sessions_low (float): Scale down below this many active sessions per onion.
+        connect_time_high (float): Scale up above this average balancer connect time in ms.
+        connect_time_low (float): Scale down below this average balancer connect time in ms.
+        latency_high (float): Scale up above this average request latency in seconds.
+        latency_low (float): Scale down below this average request latency in seconds.
+        error_rate_high (float): Scale up above this rate of failed request attempts.
+        error_rate_low (float): Scale down below this rate of failed request attempts.
+    """
+
+    min_onions: int = 1
+    max_onions: int = 10
+
+    interval: float = 5
+    consecutive_checks: int = 3
+    scale_up_cooldown: float = 30
+    scale_down_cooldown: float = 120
+    scale_up_ratio: float = 0.5
+    scale_down_step: int = 1
+
+    max_queue: int = 0
+    sessions_high: float = 8
+    sessions_low: float = 2
+    connect_time_high: float = 500
+    connect_time_low: float = 200
+    latency_high: float = 10
+    latency_low: float = 3
+    error_rate_high: float = 0.25
+    error_rate_low: float = 0.05
+
+    @validator("max_onions")
+    def _max_onions_must_fit_min(  # pylint: disable=no-self-argument,no-self-use
+        cls, max_onions: int, values: Dict[str, Any]
+    ) -> int:
+        """Check the pool can be scaled between min_onions and max_onions."""
+        if max_onions < values.get("min_onions", 1):
+            raise ValueError("max_onions must be at least min_onions.")
+
+        return max_onions
+
+
+class LoadSignals(Base):
+    """Snapshot of the load signals the autoscaler decides on.
+
+    Attributes:
+        onion_count (int): Number of onions in the pool.
+        queue (int): Connections queued on the balancer waiting for a free server.
+        sessions_per_onion (float): Average active sessions per onion.
+        connect_time (float): Average balancer connect time to the onions in ms.
+        latency (Optional[float]): Average request latency seen by the requestor in seconds.
+        error_rate (Optional[float]): Rate of failed request attempts seen by the requestor.
+        completed (int): Number of request attempts completed since the previous check.
+    """
+
+    onion_count: int
+    queue: int
+    sessions_per_onion: float
+    connect_time: float
+    latency: Optional[float]
+    error_rate: Optional[float]
+    completed: int
+
+
+class Autoscaler:
+    """Background thread which scales the pool of onions to the load."""
+
+    def __init__(self, requestor: "Requestor", options: AutoscalerOptions) -> "Autoscaler":
+        """Autoscaler __init__ method.
+
+        Args:
+            requestor (Requestor): Requestor whose pool of onions is scaled.
+            options (AutoscalerOptions): Autoscaler options object.
+        """
+        self.requestor = requestor
+        self.options = options
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_scaled = 0.0
+        self._streak = 0
+        self._completed = 0
+
+    def read_signals(self) -> LoadSignals:
+        """Read the current load signals from the balancer and the requestor."""
+        stats = self.requestor.onion_balancer.stats(max_age=0)
+        routed = list(stats.servers.values())
+
+        metrics = self.requestor.metrics
+        completed = metrics.latencies["total"].count
+        completed, self._completed = completed - self._completed, completed
+
+        return LoadSignals(
+            onion_count=len(self.requestor.onions),
+            queue=stats.backend.queue,
+            sessions_per_onion=sum(row.sessions for row in routed) / max(len(routed), 1),
+            connect_time=sum(row.connect_time for row in routed) / max(len(routed), 1),
+            latency=metrics.latency.value,
+            error_rate=metrics.error_rate.value,
+            completed=completed,
+        )
+
+    def decide(self, signals: LoadSignals) -> int:
+        """Return the direction the pool should scale in for a set of load signals.
+
+        The latency and error rate are averages which only change when requests complete, so
+        they are ignored when none did since the previous check, rather than acting on the
+        stale averages of an idle pool.
+
+        Args:
+            signals (LoadSignals): Current load signals.
+
+        Returns:
+            int: 1 to scale up, -1 to scale down and 0 to hold.
+        """
+        options = self.options
+        latency, error_rate = (
+            (signals.latency, signals.error_rate) if signals.completed else (0, 0)
+        )
+
+        if any(
+            (
+                signals.queue > options.max_queue,
+                signals.sessions_per_onion > options.sessions_high,
+                signals.connect_time > options.connect_time_high,
+                (latency or 0) > options.latency_high,
+                (error_rate or 0) > options.error_rate_high,
+            )
+        ):
+            return 1
+
+        if all(
+            (
+                signals.queue == 0,
+                signals.sessions_per_onion < options.sessions_low,
+                signals.connect_time < options.connect_time_low,
+                (latency or 0) < options.latency_low,
+                (error_rate or 0) < options.error_rate_low,
+            )
+        ):
+            return -1
+
+        return 0
+
+    def target(self, signals: LoadSignals, direction: int) -> int:
+        """Return the number of onions to scale to, within the min and max bounds.
+
+        Args:
+            signals (LoadSignals): Current load signals.
+            direction (int): 1 to scale up, -1 to scale down.
+
+        Returns:
+            int: Number of onions.
+        """
+        if direction > 0:
+            step = max(math.ceil(signals.onion_count * self.options.scale_up_ratio), 1)
+        else:
+            step = -self.options.scale_down_step
+
+        return min(
+            max(signals.onion_count + step, self.options.min_onions), self.options.max_onions
+        )
+
+    def check(self) -> None:
+        """Read the load signals once and scale the pool if a decision has held long enough."""
+        signals = self.read_signals()
+        direction = self.decide(signals)
+
+        # Count consecutive checks in the same direction, resetting when it changes.
+        if direction == 0 or (self._streak > 0) != (direction > 0):
+            self._streak = direction
+        else:
+            self._streak += direction
+
+        cooldown = (
+            self.options.scale_up_cooldown if direction > 0 else self.options.scale_down_cooldown
+        )
+        target = self.target(signals, direction) if direction else signals.onion_count
+
+        if any(
+            (
+                abs(self._streak) < self.options.consecutive_checks,
+                time.monotonic() - self._last_scaled < cooldown,
+                target == signals.onion_count,
+            )
+        ):
+            return
+
+        logger.info(f"Autoscaling from {signals.onion_count} to {target} onions. {signals}")
+
+        self.requestor.scale_to(target)
+        self._last_scaled = time.monotonic()
+        self._streak = 0
+
+    def _run(self) -> None:
+        """Check the load signals every interval until stopped."""
+        while not self._stop.wait(self.options.interval):
+            try:
+                self.check()
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error(f"Autoscaler check failed: {error}")
+
+    def start(self) -> None:
+        """Start the autoscaler thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="whaor-autoscaler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the autoscaler thread, waiting for any scaling in progress to finish."""
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
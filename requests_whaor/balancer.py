@@ -1,21 +1,29 @@
 """This module provides objects for managing the network balancer."""
 
 from contextlib import contextmanager
-from typing import Dict, List
+import csv
+import threading
+import time
+from typing import Any, Callable, ClassVar, Dict, List, Optional, Tuple, Union
 
-from docker.models.containers import Container
 from loguru import logger
 from pydantic import BaseModel as Base
+from pydantic import Field, validator
+from pydantic.fields import ModelField
 
-from .circuit import OnionCircuit
+from .circuit import OnionCircuit, SOCKS_PORT
 from .client import ContainerBase, ContainerOptions
-from .mount import MountFile, MountPoint
+from .mount import MountPoint
+from .network import Network
+from .runtime import default_runtime, RuntimeContainer
 
 HAPROXY_IMAGE = "haproxy:2.2.3"
 
+HAPROXY_CONFIG_PATH = "/usr/local/etc/haproxy/haproxy.cfg"
+
 
 class HAProxyOptions(Base):
-    """Handles options for HAProxy docker instance.
+    """Handles options for HAProxy container instance.
 
     Attributes:
         max_connections (int): Maximum per-process number of concurrent connections.
@@ -29,7 +37,31 @@ class HAProxyOptions(Base):
         backend_name (str): Name of Backend section.
         dashboard_bind_port (int): Port to open to reach the HAProxy dashboard.
         dashboard_refresh_rate (int): Refresh rate of the HAProxy dashboard page.
-        onions (List[Container]): Each onion container that is connected to the whaornet.
+        runtime_api_port (int): Port to open to reach the HAProxy runtime API, on the
+            local interface only.
+        bind_interface (str): Interface HAProxy binds its ports to.
+        onions (List[RuntimeContainer]): The runtime handle of each onion container that is
+            connected to the whaornet.
+        addresses (Dict[str, str]): The host:port each onion server connects to, keyed by
+            server name. Onions without an address are reached by their container name on the
+            whaornet.
+        circuits_per_onion (int): Number of SOCKS ports each onion serves. Each port is its own
+            server, named after the onion with the port index appended when there are several.
+        spare_slots (int): Number of disabled server slots onions can be added to at runtime.
+        spare_prefix (str): Name prefix of the spare server slots.
+        balance (str): Load balancing algorithm, one of roundrobin, static-rr, leastconn,
+            first or random.
+        random_draws (int): Number of servers the random algorithm draws, picking the least
+            loaded one.
+        check_interval (int): Milliseconds between two health checks of a server.
+        check_rise (int): Consecutive successful health checks to consider a server UP.
+        check_fall (int): Consecutive failed health checks to consider a server DOWN.
+        socks_check (bool): If True health checks perform a SOCKS5 handshake and CONNECT
+            through the onion, instead of only opening a TCP connection. This marks onions
+            which accept connections but can't build circuits as DOWN.
+        socks_check_host (str): Host the SOCKS5 health check connects to through the onion.
+        socks_check_port (int): Port the SOCKS5 health check connects to through the onion.
+        socks_check_timeout (int): Max number of seconds a SOCKS5 health check can take.
     """
 
     max_connections: int = 4096
@@ -46,30 +78,212 @@ class HAProxyOptions(Base):
     dashboard_bind_port: int = 9999
     dashboard_refresh_rate: int = 2
 
-    onions: List[Container]
+    runtime_api_port: int = 9998
+
+    bind_interface: str = "*"
+
+    onions: List[RuntimeContainer]
+    addresses: Dict[str, str] = dict()
+
+    circuits_per_onion: int = 1
+
+    spare_slots: int = 0
+    spare_prefix: str = "spare"
+
+    balance: str = "roundrobin"
+    random_draws: int = 2
+
+    check_interval: int = 2000
+    check_rise: int = 2
+    check_fall: int = 3
+
+    socks_check: bool = False
+    socks_check_host: str = "check.torproject.org"
+    socks_check_port: int = 443
+    socks_check_timeout: int = 10
 
     class Config:
         """Pydantic Configuration."""
 
         arbitrary_types_allowed = True
 
+    @validator("balance")
+    def _balance_must_be_supported(  # pylint: disable=no-self-argument,no-self-use
+        cls, balance: str
+    ) -> str:
+        """Check if the balance algorithm can be used in tcp mode."""
+        if balance in ("roundrobin", "static-rr", "leastconn", "first", "random"):
+            return balance
+
+        raise ValueError(f"{balance} is not a supported balance algorithm.")
+
+    @property
+    def socks_connect_request(self) -> str:
+        """Hex encoded SOCKS5 CONNECT request to the socks check host and port."""
+        host = self.socks_check_host.encode()
+        request = bytes([5, 1, 0, 3, len(host)]) + host + self.socks_check_port.to_bytes(2, "big")
+
+        return request.hex()
+
+    def server_names(self, onion_name: str) -> List[str]:
+        """Return the names of the servers routing to each SOCKS port of an onion."""
+        if self.circuits_per_onion == 1:
+            return [onion_name]
+
+        return [f"{onion_name}-{index}" for index in range(1, self.circuits_per_onion + 1)]
+
+    def template_variables(self) -> Dict[str, Any]:
+        """Return the variables to render the haproxy.cfg template with."""
+        onion_servers = [
+            (server, self.addresses.get(server, f"{onion.name}:{SOCKS_PORT + index}"))
+            for onion in self.onions
+            for index, server in enumerate(self.server_names(onion.name))
+        ]
+
+        return {
+            **self.dict(),
+            "onion_servers": onion_servers,
+            "socks_connect_request": self.socks_connect_request,
+        }
+
     @property
     def ports(self) -> List[int]:
         """Ports which will be used to expose on the local network."""
         return [self.listen_host_port, self.dashboard_bind_port]
 
+    @property
+    def servers(self) -> Dict[str, Optional[str]]:
+        """Return each server name mapped to the onion container it routes to."""
+        servers = {
+            server: onion.name for onion in self.onions for server in self.server_names(onion.name)
+        }
+        servers.update({f"{self.spare_prefix}{i}": None for i in range(1, self.spare_slots + 1)})
+
+        return servers
+
+
+class ServerStats(Base):
+    """Typed statistics of a single HAProxy server, parsed from a `show stat` CSV row.
+
+    Attributes:
+        server (str): Name of the server slot.
+        onion (Optional[str]): Name of the onion container the slot routes to, None if free.
+        status (str): Server status e.g. UP, DOWN, DRAIN or MAINT. Servers changing state
+            report a transition e.g. UP 1/3.
+        check_status (str): Result of the last health check e.g. L4OK or L4TOUT.
+        sessions (int): Current sessions.
+        max_sessions (int): Max concurrent sessions seen.
+        total_sessions (int): Total sessions since HAProxy started.
+        queue (int): Connections queued waiting for the server.
+        max_queue (int): Max queued connections seen.
+        queue_time (int): Average time spent in the queue over the last 1024 connections in ms.
+        connect_time (int): Average connect time over the last 1024 connections in ms.
+        response_time (int): Average response time over the last 1024 connections in ms.
+        total_time (int): Average total session time over the last 1024 connections in ms.
+        connection_errors (int): Failed attempts to connect to the server.
+        response_errors (int): Connections aborted by the server.
+        retries (int): Connection retries to the server.
+        redispatches (int): Connections redispatched away from the server.
+        bytes_in (int): Bytes sent to the server.
+        bytes_out (int): Bytes received from the server.
+        last_change (int): Seconds since the last status change.
+    """
+
+    server: str = Field(alias="svname")
+    onion: Optional[str]
+    status: str = ""
+    check_status: str = ""
+
+    sessions: int = Field(0, alias="scur")
+    max_sessions: int = Field(0, alias="smax")
+    total_sessions: int = Field(0, alias="stot")
+
+    queue: int = Field(0, alias="qcur")
+    max_queue: int = Field(0, alias="qmax")
+
+    queue_time: int = Field(0, alias="qtime")
+    connect_time: int = Field(0, alias="ctime")
+    response_time: int = Field(0, alias="rtime")
+    total_time: int = Field(0, alias="ttime")
+
+    connection_errors: int = Field(0, alias="econ")
+    response_errors: int = Field(0, alias="eresp")
+    retries: int = Field(0, alias="wretr")
+    redispatches: int = Field(0, alias="wredis")
+
+    bytes_in: int = Field(0, alias="bin")
+    bytes_out: int = Field(0, alias="bout")
+
+    last_change: int = Field(0, alias="lastchg")
+
+    class Config:
+        """Pydantic Configuration."""
+
+        allow_population_by_field_name = True
+
+    @validator("*", pre=True)
+    def _empty_is_default(  # pylint: disable=no-self-argument,no-self-use
+        cls, value: Optional[str], field: ModelField
+    ) -> Union[str, int, None]:
+        """Use the fields default for statistics which HAProxy leaves empty."""
+        return field.default if value == "" else value
+
+    @property
+    def is_up(self) -> bool:
+        """Return True if the server passes its health check."""
+        return self.status.startswith("UP")
+
+
+class BalancerStats(Base):
+    """Point in time statistics of the balancer.
+
+    Attributes:
+        read_at (float): Monotonic time the statistics were read at.
+        backend (ServerStats): Totals of the onion backend, its queue holds connections waiting
+            for any free server.
+        servers (Dict[str, ServerStats]): Statistics of each routed onion server, keyed by
+            server name.
+    """
+
+    read_at: float
+    backend: ServerStats
+    servers: Dict[str, ServerStats]
+
+    def slowest(self, count: int = 1) -> List[ServerStats]:
+        """Return the onion servers with the highest average connect time.
+
+        Args:
+            count (int): Number of servers to return.
+
+        Returns:
+            List[ServerStats]: The slowest servers, slowest first.
+        """
+        return sorted(self.servers.values(), key=lambda stats: -stats.connect_time)[:count]
+
 
 class Balancer(ContainerBase):
     """HAProxy Load Balancer.
 
     Attributes:
+        slot_lock (ClassVar[threading.Lock]): Held while claiming free server slots.
         haproxy_options (HAProxyOptions): HAProxy options object.
         container_options (ContainerOptions): Container options for the HA proxy instance.
+        servers (Dict[str, Optional[str]]): Each server slot mapped to the name of the onion
+            container it routes to, or None if the slot is free.
+        last_stats (Optional[BalancerStats]): The most recently read statistics.
     """
 
+    slot_lock: ClassVar[threading.Lock] = threading.Lock()
+
     haproxy_options: HAProxyOptions
 
-    container_options: ContainerOptions = ContainerOptions(image=HAPROXY_IMAGE)
+    container_options: ContainerOptions = ContainerOptions(
+        image=HAPROXY_IMAGE, command=["haproxy", "-f", HAPROXY_CONFIG_PATH]
+    )
+
+    servers: Dict[str, Optional[str]] = dict()
+
+    last_stats: Optional[BalancerStats]
 
     class Config:
         """Pydantic Configuration."""
@@ -94,13 +308,241 @@ class Balancer(ContainerBase):
             "https": self.address,
         }
 
-    def add_mount_point(self, mount: MountFile) -> None:
-        """Mount a volume into the HAProxy container.
+    def runtime_command(self, command: str) -> str:
+        """Send a command to the HAProxy runtime API.
+
+        Args:
+            command (str): Runtime API command e.g. `show stat`.
+
+        Returns:
+            str: The command output.
+        """
+        port = self.haproxy_options.runtime_api_port
+
+        with self.runtime.open_connection(self.container, port, timeout=1) as sock:
+            sock.sendall(f"{command}\n".encode())
+
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+
+        return b"".join(chunks).decode()
+
+    def read_stats(self) -> List[Dict[str, str]]:
+        """Read the HAProxy statistics of each proxy and server.
+
+        Returns:
+            List[Dict[str, str]]: A row of statistics for each proxy and server.
+        """
+        output = self.runtime_command("show stat")
+        return list(csv.DictReader(output.lstrip("# ").splitlines()))
+
+    def server_stats(self) -> Dict[str, ServerStats]:
+        """Read the HAProxy statistics of each onion server slot.
+
+        Returns:
+            Dict[str, ServerStats]: Statistics keyed by server name, including free slots.
+        """
+        return {
+            row["svname"]: ServerStats(**row, onion=self.servers.get(row["svname"]))
+            for row in self.read_stats()
+            if row["pxname"] == self.haproxy_options.backend_name
+        }
+
+    def stats(self, max_age: float = 1) -> BalancerStats:
+        """Return the balancers statistics, only reading them again once they are stale.
+
+        Reading the statistics is a single runtime API round trip, so polling this on an
+        interval is cheap, and callers sharing the balancer reuse one reading within max_age.
+
+        Args:
+            max_age (float): Max number of seconds old the returned statistics can be.
+
+        Returns:
+            BalancerStats: Statistics of the backend and each routed onion server.
+        """
+        last_stats = self.last_stats
+
+        if last_stats is not None and time.monotonic() - last_stats.read_at <= max_age:
+            return last_stats
+
+        rows = self.server_stats()
+
+        self.last_stats = BalancerStats(
+            read_at=time.monotonic(),
+            backend=rows["BACKEND"],
+            servers={stats.server: stats for stats in rows.values() if stats.onion},
+        )
+
+        return self.last_stats
+
+    def set_server_state(self, server: str, state: str) -> None:
+        """Change the administrative state of an onion server.
+
+        Args:
+            server (str): Name of the server.
+            state (str): One of ready, drain or maint.
+
+        Raises:
+            ValueError: If HAProxy rejects the state change.
+        """
+        logger.debug(f"Setting {server} state to {state}.")
+        output = self.runtime_command(
+            f"set server {self.haproxy_options.backend_name}/{server} state {state}"
+        ).strip()
+
+        if output:
+            raise ValueError(output)
+
+    def _wait_for_server(
+        self, server: str, condition: Callable[[ServerStats], bool], timeout: float
+    ) -> bool:
+        """Poll a servers statistics until the condition is met or the timeout passes."""
+        deadline = time.monotonic() + timeout
+
+        while time.monotonic() < deadline:
+            if condition(self.server_stats()[server]):
+                return True
+
+            time.sleep(self.ready_poll_interval)
+
+        return False
+
+    def wait_until_drained(self, server: str, timeout: float) -> bool:
+        """Block until an onion server has no active sessions left.
+
+        Args:
+            server (str): Name of the server.
+            timeout (float): Max number of seconds to wait.
+
+        Returns:
+            bool: True if the server was drained before the timeout.
+        """
+        return self._wait_for_server(server, lambda stats: stats.sessions == 0, timeout)
+
+    def wait_until_up(self, server: str, timeout: float) -> bool:
+        """Block until an onion server passes its health check.
+
+        Args:
+            server (str): Name of the server.
+            timeout (float): Max number of seconds to wait.
+
+        Returns:
+            bool: True if the server was UP before the timeout.
+        """
+        return self._wait_for_server(server, lambda stats: stats.is_up, timeout)
+
+    def server_names(self, container_name: str) -> List[str]:
+        """Return the names of the server slots routing to an onion container.
+
+        Args:
+            container_name (str): Name of the onion container.
+
+        Returns:
+            List[str]: Name of each server, one per SOCKS port of the container.
+
+        Raises:
+            KeyError: If no server slot routes to the container.
+        """
+        servers = [server for server, onion in self.servers.items() if onion == container_name]
+
+        if not servers:
+            raise KeyError(f"{container_name} is not routed to by the balancer.")
+
+        return servers
+
+    def add_servers(
+        self, container_name: str, addresses: List[Tuple[str, int]], timeout: float
+    ) -> List[str]:
+        """Route to an onion container through free server slots, without reloading HAProxy.
 
         Args:
-            mount (MountFile): File to mount between the container and local file system.
+            container_name (str): Name of the onion container.
+            addresses (List[Tuple[str, int]]): Ip address and port of each of the onion
+                containers SOCKS ports on the whaornet network, each gets its own slot.
+            timeout (float): Max number of seconds to wait for the servers to pass their health
+                check.
+
+        Returns:
+            List[str]: Name of each server slot.
+
+        Raises:
+            ValueError: If there are not enough free server slots left.
         """
-        self.container_options.mounts.append(mount.mount)
+        with self.slot_lock:  # Onions added concurrently must not claim the same slots.
+            free = [server for server, onion in self.servers.items() if onion is None]
+
+            if len(free) < len(addresses):
+                raise ValueError("No free server slots left on the balancer.")
+
+            servers = free[: len(addresses)]
+
+            for server in servers:
+                self.servers[server] = container_name
+
+        backend = self.haproxy_options.backend_name
+
+        try:
+            for server, (host, port) in zip(servers, addresses):
+                self.runtime_command(f"set server {backend}/{server} addr {host} port {port}")
+                self.set_server_state(server, "ready")
+
+        except Exception:
+            for server in servers:
+                self.servers[server] = None
+            raise
+
+        deadline = time.monotonic() + timeout
+
+        for server in servers:
+            if not self.wait_until_up(server, max(deadline - time.monotonic(), 0)):
+                logger.warning(f"{container_name} did not pass its health check on {server}.")
+
+        logger.debug(f"Routing to {container_name} through {', '.join(servers)}.")
+
+        return servers
+
+    def remove_servers(self, container_name: str, timeout: float) -> List[str]:
+        """Drain an onion containers server slots and free them, without reloading HAProxy.
+
+        Args:
+            container_name (str): Name of the onion container.
+            timeout (float): Max number of seconds to wait for active sessions to finish.
+
+        Returns:
+            List[str]: Name of each freed server slot.
+        """
+        servers = self.server_names(container_name)
+
+        for server in servers:
+            self.set_server_state(server, "drain")
+
+        deadline = time.monotonic() + timeout
+
+        for server in servers:
+            if not self.wait_until_drained(server, max(deadline - time.monotonic(), 0)):
+                logger.warning(f"{server} still has active sessions, removing anyway.")
+
+            self.set_server_state(server, "maint")
+            self.servers[server] = None
+
+        logger.debug(f"Stopped routing to {container_name} through {', '.join(servers)}.")
+
+        return servers
+
+    def is_ready(self) -> bool:
+        """Check if the runtime API is up and every onion server passes its health check."""
+        try:
+            stats = self.server_stats()
+        except OSError:
+            return False
+
+        servers = [stats[server] for server, onion in self.servers.items() if onion]
+
+        return bool(servers) and all(row.is_up for row in servers)
 
     def display_settings(self) -> None:
         """Log config settings to stdout."""
@@ -115,32 +557,71 @@ class Balancer(ContainerBase):
 
 @contextmanager
 # pylint: disable=invalid-name
-def OnionBalancer(onions: List[OnionCircuit], show_log: bool = False) -> Balancer:
-    """Context manager which yields a started instance of an HAProxy docker container.
+def OnionBalancer(
+    onions: List[OnionCircuit],
+    show_log: bool = False,
+    max_onions: Optional[int] = None,
+    network: Optional[Network] = None,
+    **options,  # noqa: ANN003
+) -> Balancer:
+    """Context manager which yields a started instance of an HAProxy container.
 
     Args:
         onions (List[OnionCircuit]): List of tor containers to load balance requests across.
         show_log (bool): If True shows the HAProxies logs on start and stop.
+        max_onions (Optional[int]): Max number of onions the balancer can route to, leaving
+            spare server slots to add onions at runtime. Defaults to the number of onions.
+            Each onion takes one slot per SOCKS port.
+        network (Optional[Network]): Network the onions are connected to. The balancer runs on
+            the same runtime, is created connected to the network and reaches each onion at its
+            address on it. Without a network onions are reached by container name on the
+            default runtime.
+        **options: HAProxyOptions fields, e.g. balance or socks_check. circuits_per_onion
+            defaults to the number of SOCKS ports of the first onion.
 
     Yields:
-        Balancer: A started instance of a HAProxy docker container.
+        Balancer: A started instance of a HAProxy container.
     """
-    haproxy_options = HAProxyOptions(onions=onions)
+    runtime = default_runtime() if network is None else network.runtime
+    options.setdefault("circuits_per_onion", onions[0].circuits if onions else 1)
+
+    haproxy_options = HAProxyOptions(
+        onions=[onion.container for onion in onions],
+        bind_interface=runtime.listen_interface,
+        **options,
+    )
+    haproxy_options.spare_slots = (
+        max((max_onions or 0) - len(onions), 0) * haproxy_options.circuits_per_onion
+    )
+
+    if network is not None:
+        for onion in onions:
+            servers = haproxy_options.server_names(onion.container_name)
+
+            for server, socks_port in zip(servers, onion.socks_ports):
+                host, port = network.container_address(onion.container, socks_port)
+                haproxy_options.addresses[server] = f"{host}:{port}"
 
     with MountPoint(
         template_name="haproxy.cfg",
-        target_path="/usr/local/etc/haproxy/haproxy.cfg",
-        template_variables=haproxy_options.dict(),
+        target_path=HAPROXY_CONFIG_PATH,
+        template_variables=haproxy_options.template_variables(),
     ) as mount_point:
 
         try:
-            balancer = Balancer(haproxy_options=haproxy_options)
+            balancer = Balancer(
+                haproxy_options=haproxy_options,
+                servers=haproxy_options.servers,
+                runtime=runtime,
+            )
             balancer.add_mount_point(mount_point)
 
             for port in haproxy_options.ports:
                 balancer.expose_port(port)
 
-            balancer.start(show_log=show_log)
+            balancer.expose_port(haproxy_options.runtime_api_port, interface="127.0.0.1")
+
+            balancer.start(show_log=show_log, network=None if network is None else network.handle)
             balancer.display_settings()
 
             yield balancer
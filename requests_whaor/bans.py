@@ -0,0 +1,192 @@
+"""This module provides ban detection and per circuit quarantine."""
+
+from abc import ABC, abstractmethod
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Sequence, Set, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+from .metrics import CounterMap
+
+BAN_STATUSES = (403, 429)
+"""* Status codes targets commonly answer a blocked exit with."""
+
+BAN_PATTERNS = (
+    r"captcha",
+    r"access denied",
+    r"attention required",
+    r"unusual traffic",
+    r"are you a robot",
+)
+"""* Case insensitive patterns of common block and CAPTCHA pages."""
+
+BAN_PAGE_STATUSES = (403, 429, 503)
+"""* Status codes block and CAPTCHA pages are commonly served with."""
+
+
+class BanDetector(ABC):
+    """Decides whether a response means its exit was banned by the target.
+
+    Subclasses implement detect. A detector must not consume the body of a streamed response.
+    """
+
+    @abstractmethod
+    def detect(self, response: requests.models.Response) -> Optional[str]:
+        """Check a response for a ban.
+
+        Args:
+            response (requests.models.Response): The response.
+
+        Returns:
+            Optional[str]: The reason the exit looks banned, None if it does not.
+        """
+
+
+class StatusBanDetector(BanDetector):
+    """Detects bans from the response status code."""
+
+    def __init__(self, statuses: Sequence[int] = BAN_STATUSES) -> "StatusBanDetector":
+        """Initialize the StatusBanDetector.
+
+        Args:
+            statuses (Sequence[int]): Status codes which mean the exit is banned.
+        """
+        self.statuses = frozenset(statuses)
+
+    def detect(self, response: requests.models.Response) -> Optional[str]:
+        """Return the status code as the reason if it is a ban status."""
+        if response.status_code in self.statuses:
+            return str(response.status_code)
+
+        return None
+
+
+class BodyBanDetector(BanDetector):
+    """Detects block and CAPTCHA pages from patterns in the start of the response body.
+
+    Only bodies of responses with one of the statuses are searched, so ordinary pages which
+    happen to mention the patterns are not taken for bans.
+    """
+
+    def __init__(
+        self,
+        patterns: Sequence[str] = BAN_PATTERNS,
+        max_bytes: int = 65536,
+        statuses: Optional[Sequence[int]] = BAN_PAGE_STATUSES,
+    ) -> "BodyBanDetector":
+        """Initialize the BodyBanDetector.
+
+        Args:
+            patterns (Sequence[str]): Case insensitive regular expressions of ban pages.
+            max_bytes (int): Number of bytes at the start of the body which are searched.
+            statuses (Optional[Sequence[int]]): Status codes of the responses whose body is
+                searched. None to search every response, e.g. for targets serving CAPTCHA
+                pages with a 200.
+        """
+        self.pattern = re.compile("|".join(f"(?:{pattern})" for pattern in patterns), re.I)
+        self.max_bytes = max_bytes
+        self.statuses = None if statuses is None else frozenset(statuses)
+
+    def detect(self, response: requests.models.Response) -> Optional[str]:
+        """Return the matched text as the reason if the body looks like a ban page."""
+        if self.statuses is not None and response.status_code not in self.statuses:
+            return None
+
+        if not response._content_consumed:  # pylint: disable=protected-access
+            return None
+
+        content = (response.content or b"")[: self.max_bytes]
+        match = self.pattern.search(content.decode(response.encoding or "utf-8", "replace"))
+
+        return None if match is None else match.group(0).lower()
+
+
+def default_ban_detectors() -> Tuple[BanDetector, ...]:
+    """Return the detectors used when none are given, ban statuses and ban pages."""
+    return StatusBanDetector(), BodyBanDetector()
+
+
+class Quarantine:
+    """Keeps banned circuits out of rotation for the hosts which banned them.
+
+    A circuit banned by one host is still used for every other host. Bans expire after a fixed
+    duration, by which time the circuit has usually been renewed onto a new exit.
+
+    Attributes:
+        detectors (Tuple[BanDetector, ...]): Detectors applied to every response.
+        duration (float): Seconds a banned circuit is kept out of rotation for the host.
+        counts (CounterMap): Number of bans by reason.
+    """
+
+    def __init__(
+        self, detectors: Optional[Iterable[BanDetector]] = None, duration: float = 300
+    ) -> "Quarantine":
+        """Quarantine __init__ method.
+
+        Args:
+            detectors (Optional[Iterable[BanDetector]]): Detectors applied to every response.
+                Defaults to default_ban_detectors.
+            duration (float): Seconds a banned circuit is kept out of rotation for the host.
+        """
+        self.detectors = default_ban_detectors() if detectors is None else tuple(detectors)
+        self.duration = duration
+        self.counts = CounterMap()
+
+        self._bans: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        """Return the hostname bans of url are kept under."""
+        return (urlsplit(url).hostname or "").lower()
+
+    def detect(self, response: requests.models.Response) -> Optional[str]:
+        """Return the reason the first detector which sees a ban gives, None if none do."""
+        for detector in self.detectors:
+            reason = detector.detect(response)
+
+            if reason is not None:
+                return reason
+
+        return None
+
+    def ban(self, circuit: str, url: str, reason: str = "banned") -> None:
+        """Take a circuit out of rotation for the urls host.
+
+        Args:
+            circuit (str): Container name of the banned circuit.
+            url (str): A url of the host which banned it.
+            reason (str): Why it was banned.
+        """
+        with self._lock:
+            self._bans[(circuit, self.host_of(url))] = time.monotonic() + self.duration
+
+        self.counts.inc(reason)
+
+    def banned(self, url: str) -> Set[str]:
+        """Return the container names of the circuits banned by the urls host."""
+        host = self.host_of(url)
+        now = time.monotonic()
+
+        with self._lock:
+            expired = [key for key, expires_at in self._bans.items() if expires_at <= now]
+
+            for key in expired:
+                del self._bans[key]
+
+            return {circuit for circuit, banned_host in self._bans if banned_host == host}
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the ban counts and the circuits currently banned per host."""
+        now = time.monotonic()
+        hosts: Dict[str, Dict[str, float]] = {}
+
+        with self._lock:
+            for (circuit, host), expires_at in self._bans.items():
+                if expires_at > now:
+                    hosts.setdefault(host, {})[circuit] = expires_at - now
+
+        return {"counts": self.counts.snapshot(), "hosts": hosts}
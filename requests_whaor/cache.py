@@ -0,0 +1,450 @@
+"""This module provides an HTTP response cache for the requestors."""
+
+from collections import OrderedDict
+from datetime import timedelta
+from email.utils import parsedate_to_datetime
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Mapping, Optional
+
+from pydantic import BaseModel as Base
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from .metrics import CounterMap
+
+CACHEABLE_STATUSES = frozenset({200, 203, 204, 300, 301, 308, 404, 405, 410, 414, 501})
+"""* Statuses which can be cached without explicit freshness, as listed by RFC 9111."""
+
+HEURISTIC_FRACTION = 0.1
+"""* Fraction of the time since Last-Modified a response without explicit freshness is fresh."""
+
+HEURISTIC_MAX = 86400
+"""* Max number of seconds a response is heuristically fresh for."""
+
+
+def parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    """Parse a Cache-Control header into its directives.
+
+    Args:
+        value (Optional[str]): The header value.
+
+    Returns:
+        Dict[str, Optional[str]]: Lower cased directive names mapped to their value, None for
+            directives without one.
+    """
+    directives = {}
+
+    for directive in (value or "").split(","):
+        name, _, argument = directive.strip().partition("=")
+
+        if name:
+            directives[name.lower()] = argument.strip('"') or None
+
+    return directives
+
+
+def parse_http_date(value: Optional[str]) -> Optional[float]:
+    """Parse an HTTP date header into unix time, None if it is missing or invalid."""
+    if not value:
+        return None
+
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class CacheEntry(Base):
+    """A cached response.
+
+    Attributes:
+        url (str): The responses url.
+        status_code (int): Response status code.
+        reason (Optional[str]): Response reason phrase.
+        headers (Dict[str, str]): Response headers.
+        content (bytes): Response body.
+        vary (Dict[str, Optional[str]]): Values of the request headers the response varies on.
+        stored_at (float): Unix time the response was received or last revalidated.
+        expires_at (float): Unix time the response becomes stale.
+    """
+
+    url: str
+    status_code: int
+    reason: Optional[str]
+    headers: Dict[str, str]
+    content: bytes
+    vary: Dict[str, Optional[str]] = dict()
+    stored_at: float
+    expires_at: float
+
+    @property
+    def size(self) -> int:
+        """Return the approximate number of bytes the entry holds."""
+        return len(self.content) + sum(
+            len(key) + len(value) for key, value in self.headers.items()
+        )
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        """Check if the entry can be served without revalidating it."""
+        return (time.time() if now is None else now) < self.expires_at
+
+    @property
+    def validators(self) -> Dict[str, str]:
+        """Return the conditional request headers which revalidate the entry."""
+        headers = CaseInsensitiveDict(self.headers)
+        validators = {}
+
+        if "ETag" in headers:
+            validators["If-None-Match"] = headers["ETag"]
+
+        if "Last-Modified" in headers:
+            validators["If-Modified-Since"] = headers["Last-Modified"]
+
+        return validators
+
+    def matches(self, request_headers: Mapping[str, str]) -> bool:
+        """Check if the entry can be served for a request with these headers."""
+        request_headers = CaseInsensitiveDict(request_headers)
+        return all(request_headers.get(name) == value for name, value in self.vary.items())
+
+    def to_response(self) -> requests.models.Response:
+        """Return the entry as a requests response."""
+        response = requests.models.Response()
+        response.status_code = self.status_code
+        response.reason = self.reason
+        response.headers = CaseInsensitiveDict(self.headers)
+        response._content = self.content  # pylint: disable=protected-access
+        response.url = self.url
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.elapsed = timedelta(0)
+
+        return response
+
+
+class MemoryStore:
+    """Thread safe in memory LRU store of cache entries, capped by bytes."""
+
+    def __init__(self, max_bytes: int) -> "MemoryStore":
+        """Initialize the MemoryStore.
+
+        Args:
+            max_bytes (int): Max number of bytes to hold. The least recently used entries
+                are evicted first, entries larger than this aren't held at all.
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Return an entry, marking it as most recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+            return entry
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        """Store an entry, evicting the least recently used entries to make room."""
+        with self._lock:
+            self._pop(key)
+
+            if entry.size > self.max_bytes:
+                return
+
+            self._entries[key] = entry
+            self.size += entry.size
+
+            while self.size > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def delete(self, key: str) -> None:
+        """Remove an entry."""
+        with self._lock:
+            self._pop(key)
+
+    def _pop(self, key: str) -> None:
+        """Remove an entry, the lock must be held."""
+        entry = self._entries.pop(key, None)
+
+        if entry is not None:
+            self.size -= entry.size
+
+    def __len__(self) -> int:
+        """Return the number of entries held."""
+        return len(self._entries)
+
+
+class SQLiteStore:
+    """Thread safe on disk store of cache entries, which survives restarts."""
+
+    def __init__(self, path: str) -> "SQLiteStore":
+        """Initialize the SQLiteStore.
+
+        Args:
+            path (str): Path of the sqlite database file, created if it doesn't exist.
+        """
+        self.path = path
+
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses"
+            " (key TEXT PRIMARY KEY, entry TEXT NOT NULL, content BLOB NOT NULL)"
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Return an entry."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT entry, content FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        entry, content = row
+        return CacheEntry(**json.loads(entry), content=content)
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        """Store an entry."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+                (key, entry.json(exclude={"content"}), entry.content),
+            )
+
+    def delete(self, key: str) -> None:
+        """Remove an entry."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
+
+
+class ResponseCache:
+    """Opt in cache of GET responses, shared by every thread of a requestor.
+
+    Responses are cached as allowed by their Cache-Control, Expires and Last-Modified headers.
+    Stale responses with an ETag or Last-Modified validator are revalidated with a conditional
+    request, so an unchanged page costs a 304 instead of its whole body. Entries are held in an
+    in memory LRU tier capped by bytes, and optionally written through to a sqlite file.
+
+    Attributes:
+        counts (CounterMap): Number of hits, misses, revalidated and stored responses.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 2**20,
+        path: Optional[str] = None,
+        ttl: Optional[float] = None,
+        cacheable_statuses: Iterable[int] = CACHEABLE_STATUSES,
+    ) -> "ResponseCache":
+        """Initialize the ResponseCache.
+
+        Args:
+            max_bytes (int): Max number of bytes the in memory tier holds.
+            path (Optional[str]): If set, entries are also stored in a sqlite file at this path.
+            ttl (Optional[float]): If set, responses are fresh for this many seconds regardless
+                of their headers, though no-store responses are still never cached.
+            cacheable_statuses (Iterable[int]): Statuses which are cached.
+        """
+        self.ttl = ttl
+        self.cacheable_statuses = frozenset(cacheable_statuses)
+
+        self.memory = MemoryStore(max_bytes)
+        self.disk = None if path is None else SQLiteStore(path)
+        self.counts = CounterMap()
+
+    @staticmethod
+    def key(url: str, params: Optional[Mapping[str, str]] = None) -> str:
+        """Return the cache key of a GET request."""
+        return requests.Request("GET", url, params=params).prepare().url
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Return a cached entry, from memory first then from disk.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            Optional[CacheEntry]: The entry, fresh or stale, None if it isn't cached.
+        """
+        entry = self.memory.get(key)
+
+        if entry is None and self.disk is not None:
+            entry = self.disk.get(key)
+
+            if entry is not None:
+                self.memory.set(key, entry)
+
+        return entry
+
+    def freshness(self, response: requests.models.Response, ttl: Optional[float]) -> float:
+        """Return the number of seconds a response is fresh for.
+
+        Args:
+            response (requests.models.Response): The response.
+            ttl (Optional[float]): Explicit freshness overriding the responses headers.
+
+        Returns:
+            float: Seconds the response is fresh for, zero if it must be revalidated first.
+        """
+        ttl = self.ttl if ttl is None else ttl
+
+        if ttl is not None:
+            return ttl
+
+        headers = response.headers
+        directives = parse_cache_control(headers.get("Cache-Control"))
+        try:
+            age = max(float(headers.get("Age") or 0), 0)
+        except ValueError:
+            age = 0
+
+        if "no-cache" in directives:
+            return 0
+
+        if directives.get("max-age"):
+            try:
+                return max(float(directives["max-age"]) - age, 0)
+            except ValueError:
+                return 0
+
+        date = parse_http_date(headers.get("Date")) or time.time()
+        expires = parse_http_date(headers.get("Expires"))
+
+        if "Expires" in headers:
+            return max((expires or 0) - date - age, 0)
+
+        last_modified = parse_http_date(headers.get("Last-Modified"))
+
+        if last_modified is not None:
+            return min(max(date - last_modified, 0) * HEURISTIC_FRACTION, HEURISTIC_MAX)
+
+        return 0
+
+    def store(
+        self,
+        key: str,
+        response: requests.models.Response,
+        request_headers: Mapping[str, str],
+        ttl: Optional[float] = None,
+    ) -> bool:
+        """Cache a response, if its status and headers allow it.
+
+        Args:
+            key (str): The cache key.
+            response (requests.models.Response): The response, with its body read.
+            request_headers (Mapping[str, str]): Headers the request was sent with.
+            ttl (Optional[float]): Explicit freshness overriding the responses headers.
+
+        Returns:
+            bool: True if the response was cached.
+        """
+        headers = response.headers
+        vary = [name.strip() for name in headers.get("Vary", "").split(",") if name.strip()]
+        freshness = self.freshness(response, ttl)
+
+        if any(
+            (
+                response.status_code not in self.cacheable_statuses,
+                "no-store" in parse_cache_control(headers.get("Cache-Control")),
+                "*" in vary,
+            )
+        ):
+            return False
+
+        now = time.time()
+        entry = CacheEntry(
+            url=response.url or key,
+            status_code=response.status_code,
+            reason=response.reason,
+            headers=dict(headers),
+            content=response.content,
+            vary={name: CaseInsensitiveDict(request_headers).get(name) for name in vary},
+            stored_at=now,
+            expires_at=now + freshness,
+        )
+
+        if not freshness and not entry.validators:
+            return False
+
+        self._set(key, entry)
+        self.counts.inc("stored")
+
+        return True
+
+    def revalidated(
+        self,
+        key: str,
+        entry: CacheEntry,
+        response: requests.models.Response,
+        ttl: Optional[float] = None,
+    ) -> CacheEntry:
+        """Refresh a stale entry after the server answered its conditional request with 304.
+
+        Args:
+            key (str): The cache key.
+            entry (CacheEntry): The stale entry.
+            response (requests.models.Response): The 304 response.
+            ttl (Optional[float]): Explicit freshness overriding the responses headers.
+
+        Returns:
+            CacheEntry: The refreshed entry.
+        """
+        headers = {**entry.headers, **response.headers}
+        merged = entry.to_response()
+        merged.headers = CaseInsensitiveDict(headers)
+
+        now = time.time()
+        entry = entry.copy(
+            update={
+                "headers": headers,
+                "stored_at": now,
+                "expires_at": now + self.freshness(merged, ttl),
+            }
+        )
+
+        self._set(key, entry)
+        self.counts.inc("revalidated")
+
+        return entry
+
+    def _set(self, key: str, entry: CacheEntry) -> None:
+        """Write an entry to every tier."""
+        self.memory.set(key, entry)
+
+        if self.disk is not None:
+            self.disk.set(key, entry)
+
+    def delete(self, key: str) -> None:
+        """Remove an entry from every tier."""
+        self.memory.delete(key)
+
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def snapshot(self) -> Dict[str, float]:
+        """Return the hit, miss, revalidated and stored counts and the memory tier size."""
+        return {
+            **self.counts.snapshot(),
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory.size,
+        }
+
+    def close(self) -> None:
+        """Close the on disk tier."""
+        if self.disk is not None:
+            self.disk.close()
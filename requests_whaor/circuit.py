@@ -1,22 +1,209 @@
-"""This module provides objects for managing TOR docker instances."""
+"""This module provides objects for managing TOR container instances."""
 
 from concurrent.futures import as_completed, ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import ContextManager, List, Optional
+import secrets
+import time
+from typing import ClassVar, ContextManager, Dict, List, Optional
+
+from loguru import logger
+from pydantic import Field, validator
 
 from .client import ContainerBase, ContainerOptions
+from .control import CONTROL_PORT, hash_password, NEWNYM_RATE_LIMIT, TorController
+from .mount import MountFile, MountPoint
+from .network import Network
+from .runtime import ContainerRuntime, default_runtime
+from .tor_cache import TorCache
 
 TOR_IMAGE = "osminogin/tor-simple:0.4.3.6"
 
+TORRC_PATH = "/etc/tor/torrc"
+
+SOCKS_PORT = 9050
+
+SOCKS_ISOLATION = ("IsolateDestAddr", "IsolateSOCKSAuth")
+"""* Isolation flags of each SOCKS port when a container serves more than one."""
+
 
 class OnionCircuit(ContainerBase):
-    """A TOR Docker Container Object.
+    """A TOR Container Object.
 
     Attributes:
+        bootstrapped_message (ClassVar[str]): Log message TOR prints once it can build circuits.
+        circuits (int): Number of SOCKS ports the container serves, from SOCKS_PORT up. Streams
+            on different ports never share a circuit, so each port is an independent circuit.
         container_options (ContainerOptions): Container Options for TOR docker instance.
+        control_password (str): Password of the TOR control port.
+        last_newnym (Optional[float]): Monotonic time of the last NEWNYM signal.
+        socks_host_port (Optional[int]): Local port the circuits SOCKS port is published on.
     """
 
-    container_options: ContainerOptions = ContainerOptions(image=TOR_IMAGE)
+    bootstrapped_message: ClassVar[str] = "Bootstrapped 100%"
+
+    circuits: int = 1
+    container_options: ContainerOptions = ContainerOptions(
+        image=TOR_IMAGE, data_dir="/var/lib/tor"
+    )
+    control_password: str = Field(default_factory=lambda: secrets.token_hex(16))
+    last_newnym: Optional[float]
+    socks_host_port: Optional[int]
+
+    def __init__(self, **data) -> None:  # noqa: ANN003
+        """Initialize the OnionCircuit.
+
+        Starts TOR with an authenticated control port, which is reachable on the whaornet
+        network and published on the local interface. The SOCKS port is published on the
+        local interface as well, so requests can bypass the balancer. Ports and the data
+        directory are placeholders filled in by the runtime, which is why the SOCKS ports are
+        set on the command line rather than in the shared torrc.
+        """
+        super().__init__(**data)
+
+        flags = "".join(f" {flag}" for flag in SOCKS_ISOLATION) if self.circuits > 1 else ""
+        socks_ports = []
+
+        for port in self.socks_ports:
+            socks_ports += ["--SocksPort", f"{{interface}}:{{ports[{port}]}}{flags}"]
+
+        self.container_options.command = [
+            "tor",
+            "-f",
+            TORRC_PATH,
+            "--ignore-missing-torrc",
+            *socks_ports,
+            "--ControlPort",
+            f"{{interface}}:{{ports[{CONTROL_PORT}]}}",
+            "--HashedControlPassword",
+            hash_password(self.control_password),
+            "--DataDirectory",
+            "{data_dir}",
+        ]
+        self.publish_port(CONTROL_PORT)
+
+        for port in self.socks_ports:
+            self.publish_port(port)
+
+    @validator("circuits")
+    def _circuits_must_fit_below_control_port(  # pylint: disable=no-self-argument,no-self-use
+        cls, circuits: int
+    ) -> int:
+        """Check the SOCKS ports don't run into the control port."""
+        if 1 <= circuits <= CONTROL_PORT - SOCKS_PORT:
+            return circuits
+
+        raise ValueError(f"circuits must be between 1 and {CONTROL_PORT - SOCKS_PORT}.")
+
+    @property
+    def socks_ports(self) -> List[int]:
+        """Return the container ports of each of the circuits SOCKS ports."""
+        return [SOCKS_PORT + index for index in range(self.circuits)]
+
+    @property
+    def address(self) -> str:
+        """Return the socks5 address of the circuits first SOCKS port on the local interface."""
+        if self.socks_host_port is None:
+            self.socks_host_port = self.host_port(SOCKS_PORT)
+
+        return f"socks5://localhost:{self.socks_host_port}"
+
+    @property
+    def proxies(self) -> Dict[str, str]:
+        """Return proxies to mount onto a requests session to bypass the balancer."""
+        return {
+            "http": self.address,
+            "https": self.address,
+        }
+
+    def restart(self) -> None:
+        """Restart the container instance."""
+        super().restart()
+        self.socks_host_port = None  # Published ports can change on restart.
+
+    @property
+    def controller(self) -> TorController:
+        """Return a client for the circuits TOR control port, connected through the runtime."""
+        return TorController(
+            "127.0.0.1",
+            self.host_port(CONTROL_PORT),
+            self.control_password,
+            connect=lambda timeout: self.runtime.open_connection(
+                self.container, CONTROL_PORT, timeout
+            ),
+        )
+
+    def renew_identity(self) -> bool:
+        """Signal TOR to switch to clean circuits, giving new requests a new exit ip address.
+
+        TOR only honours one NEWNYM signal every NEWNYM_RATE_LIMIT seconds, so circuits which
+        were renewed too recently are skipped.
+
+        Returns:
+            bool: True if the signal was sent.
+        """
+        now = time.monotonic()
+
+        if self.last_newnym is not None and now - self.last_newnym < NEWNYM_RATE_LIMIT:
+            logger.debug(f"Skipping NEWNYM for {self.container_name}, renewed too recently.")
+            return False
+
+        self.controller.signal("NEWNYM")
+        self.last_newnym = now
+
+        return True
+
+    def is_ready(self) -> bool:
+        """Check if TOR has finished bootstrapping since the container was last (re)started."""
+        logs = self.runtime.logs(self.container, since=self.started_at)
+        return self.bootstrapped_message in logs
+
+
+@contextmanager
+# pylint: disable=invalid-name
+def TorrcMountPoint(options: Optional[Dict[str, str]] = None) -> ContextManager[MountFile]:
+    """Context manager which yields the rendered torrc shared by every TOR container.
+
+    Args:
+        options (Optional[Dict[str, str]]): Extra torrc options, e.g. {"ExitNodes": "{de}"}.
+
+    Yields:
+        MountFile: The torrc, to mount into TOR containers.
+    """
+    with MountPoint(
+        template_name="torrc",
+        target_path=TORRC_PATH,
+        template_variables={"options": list((options or {}).items())},
+    ) as mount_point:
+        yield mount_point
+
+
+def create_onion(
+    runtime: ContainerRuntime,
+    torrc: Optional[MountFile] = None,
+    seed: Optional[Dict[str, bytes]] = None,
+    circuits: int = 1,
+) -> OnionCircuit:
+    """Create a TOR container, not started yet.
+
+    Args:
+        runtime (ContainerRuntime): Runtime to start the container on.
+        torrc (Optional[MountFile]): Rendered torrc to mount into the container.
+        seed (Optional[Dict[str, bytes]]): Directory documents copied into the data directory
+            before TOR starts, so it bootstraps without downloading them, see TorCache.
+        circuits (int): Number of isolated SOCKS ports the container serves.
+
+    Returns:
+        OnionCircuit: The TOR container.
+    """
+    onion = OnionCircuit(runtime=runtime, circuits=circuits)
+
+    if torrc is not None:
+        onion.add_mount_point(torrc)
+
+    if seed:
+        onion.container_options.files = seed
+
+    return onion
 
 
 @contextmanager
@@ -26,28 +213,72 @@ def OnionCircuits(  # pylint: disable=invalid-name
     max_threads: int = 2,
     thread_pool_timeout: Optional[int] = None,
     show_log: bool = False,
+    runtime: Optional[ContainerRuntime] = None,
+    network: Optional[Network] = None,
+    torrc: Optional[MountFile] = None,
+    tor_cache: Optional[TorCache] = None,
+    circuits_per_container: int = 1,
 ) -> ContextManager[List[OnionCircuit]]:
     """Context manager which yields a list of started TOR containers.
 
-    Takes care of starting and stopping multiple docker container instances of TOR.
+    Takes care of starting and stopping multiple container instances of TOR.
 
     Args:
-        onion_count (int): Number of TOR docker container instances to start.
+        onion_count (int): Number of TOR container instances to start.
         start_with_threads (bool): If True uses threads to start up the containers.
         max_threads (int): Max number of threads to use to start up the containers.
         thread_pool_timeout (Optional[int]): Timeout for ThreadPoolExecutor.
         show_log (bool): If True shows the containers logs.
+        runtime (Optional[ContainerRuntime]): Runtime to start the containers on. Defaults to
+            the networks runtime, or Docker without a network.
+        network (Optional[Network]): Network the containers are created connected to.
+        torrc (Optional[MountFile]): Rendered torrc to mount. Defaults to a default torrc.
+        tor_cache (Optional[TorCache]): If set, containers start from its cached directory
+            documents.
+        circuits_per_container (int): Number of isolated SOCKS ports each container serves.
+            Circuits are far cheaper than TOR processes, so this raises the number of distinct
+            circuits the pool has without raising its memory use in step.
 
     Yields:
         List[OnionCircuit]: A list of started OnionCircuit objects.
     """
-    onion_circuits = [OnionCircuit() for _ in range(onion_count)]
+    if torrc is None:
+        with TorrcMountPoint() as default_torrc, OnionCircuits(
+            onion_count,
+            startup_with_threads=startup_with_threads,
+            max_threads=max_threads,
+            thread_pool_timeout=thread_pool_timeout,
+            show_log=show_log,
+            runtime=runtime,
+            network=network,
+            torrc=default_torrc,
+            tor_cache=tor_cache,
+            circuits_per_container=circuits_per_container,
+        ) as onion_circuits:
+            yield onion_circuits
+
+        return
+
+    if runtime is None:
+        runtime = default_runtime() if network is None else network.runtime
+
+    handle = None if network is None else network.handle
+
+    # Loaded once, every circuit shares the same documents.
+    seed = None if tor_cache is None else tor_cache.load()
+    onion_circuits = [
+        create_onion(runtime, torrc, seed, circuits_per_container) for _ in range(onion_count)
+    ]
+
+    if seed:
+        logger.debug(f"Seeding {onion_count} onions with cached directory documents.")
 
     try:
         if startup_with_threads:
             with ThreadPoolExecutor(max_workers=max_threads) as executor:
                 futures = [
-                    executor.submit(circuit.start, show_log=show_log) for circuit in onion_circuits
+                    executor.submit(circuit.start, show_log=show_log, network=handle)
+                    for circuit in onion_circuits
                 ]
 
                 for future in as_completed(futures, timeout=thread_pool_timeout):
@@ -55,20 +286,21 @@ def OnionCircuits(  # pylint: disable=invalid-name
 
         else:
             for circuit in onion_circuits:
-                circuit.start(show_log=show_log)
+                circuit.start(show_log=show_log, network=handle)
 
         yield onion_circuits
 
     finally:
-        if startup_with_threads:
+        # Circuits which failed to start, or never got to, have no container to stop.
+        started = [circuit for circuit in onion_circuits if circuit.container is not None]
+
+        if startup_with_threads and started:
             with ThreadPoolExecutor(max_workers=max_threads) as executor:
-                futures = [
-                    executor.submit(circuit.stop, show_log=show_log) for circuit in onion_circuits
-                ]
+                futures = [executor.submit(circuit.stop, show_log=show_log) for circuit in started]
 
                 for future in as_completed(futures, thread_pool_timeout):
                     future.result()
 
         else:
-            for circuit in onion_circuits:
+            for circuit in started:
                 circuit.stop(show_log=show_log)
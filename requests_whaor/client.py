@@ -1,37 +1,29 @@
-"""This module provides base objects to manage docker containers."""
+"""This module provides base objects to manage containers."""
 
 from tempfile import _TemporaryFileWrapper as TemporaryFile
-from typing import ClassVar, Dict, List, Optional
+import time
+from typing import Any, ClassVar, Dict, List, Optional, Sequence, TYPE_CHECKING
 
-import docker
-from docker.client import DockerClient
 from docker.models.containers import Container
 from docker.types import Mount as DockerMount
 from loguru import logger
 from pydantic import BaseModel as Base
+from pydantic import Field
 
+from .runtime import (
+    ContainerHandle,
+    ContainerRuntime,
+    default_runtime,
+    RuntimeContainer,
+    RuntimeNetwork,
+)
 
-class Client(Base):
-    """A Docker Client.
-
-    Provides the methods to connect to a docker engine.
-
-    Attributes:
-        client (ClassVar[DockerClient]): A shared docker client session.
-    """
+if TYPE_CHECKING:  # pragma: no cover
+    from .mount import MountFile
 
-    client: ClassVar[DockerClient] = None
 
-    @classmethod
-    def get_client(cls) -> DockerClient:
-        """Return the docker client."""
-        if cls.client is None:
-            cls.client = docker.from_env()
-
-        cls.client.ping()
-        logger.debug("Docker connection successful.")
-
-        return cls.client
+class Client(Base):
+    """Base of the objects managed through a container runtime."""
 
     class Config:
         """Pydantic Configuration."""
@@ -40,13 +32,15 @@ class Client(Base):
         json_encoders = {
             TemporaryFile: lambda temp: temp.name,
             Container: lambda container: container.name,
+            ContainerHandle: lambda container: container.name,
+            ContainerRuntime: lambda runtime: runtime.name,
         }
 
 
 class ContainerOptions(Base):
-    """Docker Container Options.
+    """Container Options.
 
-    Provides common options needed to start a docker container.
+    Provides common options needed to start a container.
 
     Attributes:
         container_timeout (ClassVar[int]): Timeout in seconds to wait for the container
@@ -55,8 +49,16 @@ class ContainerOptions(Base):
         auto_remove (bool): Enable auto-removal of the container on daemon side when the
             container’s process exits.
         detach (bool): Run container in the background and return a Container object.
+        command (Optional[List[str]]): Command to run instead of the images default command.
+            `{ports[n]}`, `{data_dir}` and `{interface}` are replaced by the runtime with the
+            port container port n listens on, the data directory and the listen interface.
+        data_dir (Optional[str]): Data directory inside the container. Runtimes which don't
+            isolate the file system use a directory of their own instead.
+        files (Dict[str, bytes]): Files written into the data directory before the container
+            starts, by file name.
         mounts (List[DockerMount]): Specification for mounts to be added to the container.
-        ports (Dict[int, int]): Ports to bind inside the container.
+        ports (Dict[int, Any]): Ports to bind inside the container, mapped to a host port or
+            a (host interface, host port) tuple. A host port of None picks a random free port.
     """
 
     container_timeout: ClassVar[int] = 5
@@ -64,20 +66,30 @@ class ContainerOptions(Base):
     image: Optional[str]
     auto_remove: bool = True
     detach: bool = True
+    command: Optional[List[str]]
+    data_dir: Optional[str]
+    files: Dict[str, bytes] = dict()
     mounts: List[DockerMount] = list()
-    ports: Dict[int, int] = dict()
+    ports: Dict[int, Any] = dict()
 
 
 class ContainerBase(Client):
-    """Docker Container Base with default options and commonly used methods.
+    """Container Base with default options and commonly used methods.
 
     Attributes:
+        ready_poll_interval (ClassVar[float]): Seconds to wait between readiness checks.
+        runtime (ContainerRuntime): Runtime the container runs on. Defaults to Docker.
         container_options (ContainerOptions): ContainerOptions Object.
-        container (Optional[Container]): Holds an instance of a initiated docker container.
+        container (Optional[RuntimeContainer]): Holds the runtimes handle of the started container.
+        started_at (Optional[int]): Unix time the container was last started or restarted.
     """
 
+    ready_poll_interval: ClassVar[float] = 0.25
+
+    runtime: ContainerRuntime = Field(default_factory=default_runtime)
     container_options: ContainerOptions = ContainerOptions()
-    container: Optional[Container]
+    container: Optional[RuntimeContainer]
+    started_at: Optional[int]
 
     @property
     def container_id(self) -> str:
@@ -100,27 +112,70 @@ class ContainerBase(Client):
         return self.container_options.container_timeout
 
     def show_follow_logs_command(self) -> None:
-        """Print log message with docker container logs command."""
+        """Print log message with the command which follows the containers logs."""
         logger.info(f"Run the following command to show ({self.container_name}) containers logs.")
-        logger.info(f"docker container logs -f {self.container_name}")
+        logger.info(self.runtime.follow_logs_command(self.container))
 
-    def expose_port(self, port: int) -> None:
+    def expose_port(self, port: int, interface: Optional[str] = None) -> None:
         """Add ports to expose to the container options.
 
         Args:
             port (int): The port to expose.
+            interface (Optional[str]): Host interface to bind to. Defaults to all interfaces.
+        """
+        self.container_options.ports[port] = port if interface is None else (interface, port)
+
+    def publish_port(self, port: int) -> None:
+        """Publish a container port on a random free port of the local interface.
+
+        Args:
+            port (int): The container port to publish.
+        """
+        self.container_options.ports[port] = ("127.0.0.1", None)
+
+    def host_port(self, port: int) -> int:
+        """Return the host port a published container port is bound to.
+
+        Args:
+            port (int): The published container port.
+
+        Returns:
+            int: The host port.
         """
-        self.container_options.ports[port] = port
+        return self.runtime.host_port(self.container, port)
 
-    def start(self, show_log: bool = False) -> None:
+    def add_mount_point(self, mount: "MountFile") -> None:
+        """Mount a file into the container.
+
+        Args:
+            mount (MountFile): File to mount between the container and local file system.
+        """
+        self.container_options.mounts.append(mount.mount)
+
+    def read_data_files(self, names: Sequence[str]) -> Dict[str, bytes]:
+        """Read files from the containers data directory.
+
+        Args:
+            names (Sequence[str]): Names of the files.
+
+        Returns:
+            Dict[str, bytes]: Content of the files which exist, by name.
+        """
+        return self.runtime.read_files(self.container, self.container_options.data_dir, names)
+
+    def start(self, show_log: bool = False, network: Optional[RuntimeNetwork] = None) -> None:
         """Start a container instance.
 
         Args:
             show_log (bool): If True shows the containers logs.
+            network (Optional[RuntimeNetwork]): Network handle to create the container
+                connected to, saving a separate connect call per container.
         """
-        client = self.get_client()
+        self.started_at = int(time.time())
+        self.container = self.runtime.run(self.container_options, network=network)
 
-        self.container = client.containers.run(**self.container_options.dict())
+        # The files are in the data directory now, don't hold on to them.
+        self.container_options.files = dict()
 
         logger.debug(f"Running container {self.container_name} {self.container_short_id}.")
 
@@ -130,13 +185,41 @@ class ContainerBase(Client):
     def restart(self) -> None:
         """Restart the container instance."""
         logger.debug(f"Restarting container {self.container_name} {self.container_short_id}.")
-        self.container.restart(timeout=self.container_timeout)
+        self.started_at = int(time.time())
+        self.runtime.restart(self.container, timeout=self.container_timeout)
+
+    def is_ready(self) -> bool:
+        """Check if the container instance is ready to be used."""
+        return self.runtime.status(self.container) == "running"
+
+    def wait_until_ready(self, timeout: float) -> float:
+        """Block until the container instance is ready to be used.
+
+        Args:
+            timeout (float): Max number of seconds to wait.
+
+        Returns:
+            float: Number of seconds it took for the container to become ready.
+
+        Raises:
+            TimeoutError: If the container is not ready before the timeout.
+        """
+        start = time.monotonic()
+
+        while not self.is_ready():
+            if time.monotonic() - start > timeout:
+                raise TimeoutError(f"{self.container_name} was not ready after {timeout} seconds.")
+
+            time.sleep(self.ready_poll_interval)
+
+        elapsed = time.monotonic() - start
+        logger.debug(f"Container {self.container_name} ready after {elapsed:.2f} seconds.")
+
+        return elapsed
 
     def print_logs(self) -> None:
         """Print the container instance logs."""
-        self.container.reload()
-
-        for line in self.container.logs().decode().split("\n"):
+        for line in self.runtime.logs(self.container).split("\n"):
             logger.debug(line)
 
     def stop(self, show_log: bool = False) -> None:
@@ -150,6 +233,6 @@ class ContainerBase(Client):
         if show_log:
             self.print_logs()
 
-        self.container.stop(timeout=self.container_timeout)
+        self.runtime.stop(self.container, timeout=self.container_timeout)
 
         logger.debug(f"Container {self.container_name} {self.container_short_id} Destroyed.")
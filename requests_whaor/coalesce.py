@@ -0,0 +1,131 @@
+"""This module provides single flight coalescing of identical in flight requests."""
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Mapping, Optional, TypeVar
+
+import requests
+
+from .metrics import CounterMap
+
+Result = TypeVar("Result")
+
+COALESCED_ARGUMENTS = ("params", "headers", "allow_redirects", "verify", "cert")
+"""* Request arguments a request can be coalesced with, any other argument prevents it."""
+
+
+def request_key(method: str, url: str, kwargs: Mapping[str, Any]) -> Optional[Hashable]:
+    """Return the key identical requests share, the default key function.
+
+    Requests share a key when their method, url, params, headers, allow_redirects, verify and
+    cert are equal. Requests with any other argument, e.g. stream, a body, auth, cookies or
+    hooks, are never coalesced, since it may change their response.
+
+    Args:
+        method (str): The request method.
+        url (str): The request url.
+        kwargs (Mapping[str, Any]): Keyword arguments the request is sent with.
+
+    Returns:
+        Optional[Hashable]: The key, None if the request should not be coalesced.
+    """
+    if any(
+        value is not None
+        for argument, value in kwargs.items()
+        if argument not in COALESCED_ARGUMENTS
+    ):
+        return None
+
+    prepared = requests.Request(method, url, params=kwargs.get("params")).prepare()
+    headers = frozenset(
+        (name.lower(), value) for name, value in (kwargs.get("headers") or {}).items()
+    )
+
+    options = tuple(kwargs.get(argument) for argument in ("allow_redirects", "verify", "cert"))
+
+    return method, prepared.url, headers, options
+
+
+class _Call:
+    """A request in flight, which the callers sharing its key wait on."""
+
+    def __init__(self) -> "_Call":
+        """_Call __init__ method."""
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesces identical concurrent calls into one.
+
+    The first caller of a key runs the call. Callers arriving with the same key while it is in
+    flight wait for it and share its result, or its exception, instead of sending a duplicate
+    request over another TOR circuit. Once the call finishes the key is forgotten, so later
+    callers run it again.
+
+    Attributes:
+        key (Callable[[str, str, Mapping[str, Any]], Optional[Hashable]]): Returns the key of a
+            request from its method, url and keyword arguments, or None to not coalesce it.
+        counts (CounterMap): Number of calls which ran and which were coalesced.
+    """
+
+    def __init__(
+        self, key: Callable[[str, str, Mapping[str, Any]], Optional[Hashable]] = request_key
+    ) -> "SingleFlight":
+        """Initialize the SingleFlight.
+
+        Args:
+            key (Callable[[str, str, Mapping[str, Any]], Optional[Hashable]]): Key function.
+        """
+        self.key = key
+        self.counts = CounterMap()
+
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        """Return the number of distinct calls in flight."""
+        return len(self._calls)
+
+    def do(self, key: Hashable, function: Callable[[], Result]) -> Result:
+        """Run a call, or wait for the identical call in flight and share its outcome.
+
+        Args:
+            key (Hashable): Key of the call.
+            function (Callable[[], Result]): The call.
+
+        Returns:
+            Result: What the call returned. Every caller sharing a call gets the same object.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            self.counts.inc("coalesced")
+            call.done.wait()
+
+            if call.error is not None:
+                raise call.error
+
+            return call.result
+
+        self.counts.inc("executed")
+
+        try:
+            call.result = function()
+            return call.result
+
+        except BaseException as error:
+            call.error = error
+            raise
+
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+            call.done.set()
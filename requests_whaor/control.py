@@ -0,0 +1,128 @@
+"""This module provides a minimal client for the TOR control protocol."""
+
+import hashlib
+import os
+import socket
+from typing import Callable, List, Optional
+
+from loguru import logger
+
+CONTROL_PORT = 9151
+
+NEWNYM_RATE_LIMIT = 10
+"""* Seconds TOR waits between two NEWNYM signals before it honours another one."""
+
+
+def hash_password(password: str, salt: Optional[bytes] = None) -> str:
+    """Hash a control port password the same way `tor --hash-password` does.
+
+    Args:
+        password (str): Password to hash.
+        salt (Optional[bytes]): 8 byte salt, randomly generated when None.
+
+    Returns:
+        str: Value for the HashedControlPassword TOR option.
+    """
+    salt = salt if salt is not None else os.urandom(8)
+    indicator = 0x60  # Iterated and salted S2K with 65536 bytes hashed (RFC 2440).
+    count = (16 + (indicator & 15)) << ((indicator >> 4) + 6)
+
+    secret = salt + password.encode()
+    digest = hashlib.sha1()  # nosec - required by the TOR S2K specification.
+
+    while count > 0:
+        chunk = secret[:count]
+        digest.update(chunk)
+        count -= len(chunk)
+
+    return f"16:{(salt + bytes([indicator])).hex().upper()}{digest.hexdigest().upper()}"
+
+
+class ControlError(Exception):
+    """Raised when the TOR control port rejects a command."""
+
+
+class TorController:
+    """Sends commands to the authenticated control port of a TOR instance."""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        password: str,
+        timeout: float = 5,
+        connect: Optional[Callable[[float], socket.socket]] = None,
+    ) -> "TorController":
+        """Initialize the TorController.
+
+        Args:
+            host (str): Control port host.
+            port (int): Control port.
+            password (str): Control port password.
+            timeout (float): Socket timeout in seconds.
+            connect (Optional[Callable[[float], socket.socket]]): Opens a connection to the
+                control port given the timeout. Defaults to connecting to host and port.
+        """
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self.connect = connect or (
+            lambda timeout: socket.create_connection((self.host, self.port), timeout=timeout)
+        )
+
+    @staticmethod
+    def _read_reply(stream: socket.SocketIO) -> List[str]:
+        """Read one, possibly multi line, reply from the control port."""
+        lines = []
+
+        while True:
+            line = stream.readline().decode().rstrip("\r\n")
+
+            if not line:
+                raise ControlError("Control port closed the connection.")
+
+            lines.append(line)
+
+            if line[3:4] == " ":
+                return lines
+
+    def send(self, *commands: str) -> List[str]:
+        """Authenticate and send commands over a fresh control connection.
+
+        Args:
+            *commands (str): Commands to send after authenticating.
+
+        Returns:
+            List[str]: Last reply line for each command.
+
+        Raises:
+            ControlError: If any command is not answered with a 250 status.
+        """
+        replies = []
+        password = self.password.replace("\\", "\\\\").replace('"', '\\"')
+
+        with self.connect(self.timeout) as sock:
+            stream = sock.makefile("rwb")
+
+            for command in (f'AUTHENTICATE "{password}"', *commands, "QUIT"):
+                stream.write(f"{command}\r\n".encode())
+                stream.flush()
+
+                reply = self._read_reply(stream)[-1]
+
+                if not reply.startswith("250"):
+                    raise ControlError(f"{command.split()[0]} failed: {reply}")
+
+                replies.append(reply)
+
+        return replies[1:-1]
+
+    def signal(self, name: str) -> None:
+        """Send a signal to the TOR instance.
+
+        Args:
+            name (str): Name of the signal e.g. NEWNYM.
+        """
+        logger.debug(f"Sending SIGNAL {name} to {self.host}:{self.port}.")
+        self.send(f"SIGNAL {name}")
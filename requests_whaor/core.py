@@ -1,39 +1,122 @@
 """This module provides core requests_whaor functionality."""
 
-from concurrent.futures import as_completed, ThreadPoolExecutor
-from contextlib import contextmanager, ExitStack
-import random
+from concurrent.futures import as_completed, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager, ExitStack, nullcontext
+import os
+import threading
 import time
-from typing import Dict, List, Optional
+from typing import (
+    AbstractSet,
+    Any,
+    ContextManager,
+    Dict,
+    Hashable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 from loguru import logger
+from more_itertools import chunked
 import requests
 from requests.exceptions import (  # pylint: disable=redefined-builtin
     ConnectionError,
+    ConnectTimeout,
     ProxyError,
+    ReadTimeout,
     Timeout,
 )
+from requests.structures import CaseInsensitiveDict
+
+from .autoscaler import Autoscaler, AutoscalerOptions
+from .balancer import Balancer, HAPROXY_IMAGE, OnionBalancer
+from .bans import Quarantine
+from .cache import CacheEntry, parse_cache_control, ResponseCache
+from .circuit import (
+    create_onion,
+    OnionCircuit,
+    OnionCircuits,
+    TOR_IMAGE,
+    TorrcMountPoint,
+)
+from .coalesce import SingleFlight
+from .download import DownloadReport, ParallelDownload
+from .hedge import HedgePolicy
+from .metrics import PhaseTimings, RequestEvent, RequestorMetrics
+from .mount import MountFile
+from .network import Network, WhaorNet
+from .retry import RetryPolicy
+from .routing import CircuitRouter
+from .runtime import ContainerRuntime
+from .scheduler import HeldSlot, Scheduler
+from .session import pop_connect_time, SessionOptions, SessionPool
+from .stream import ResumableStream
+from .timeouts import AdaptiveTimeouts
+from .tor_cache import TorCache
+
+MAX_STARTUP_THREADS = 32
+"""* Default max number of threads starting TOR containers in parallel."""
 
-from .balancer import Balancer, OnionBalancer
-from .circuit import OnionCircuit, OnionCircuits
-from .network import WhaorNet
+DEFAULT_CONCURRENCY = 5
+"""* Default number of threads expected to share a requestor, sizing its connection pools."""
 
 
-def pause(sleep: int) -> None:
-    """Sleep function with a little logging fun."""
-    if random.random() > 0.5:
-        logger.debug("Warming things up.")
-    else:
-        logger.debug("Just chillin for a sec.")
+def wait_until_ready(
+    onions: List[OnionCircuit], onion_balancer: Balancer, timeout: float
+) -> float:
+    """Block until every TOR circuit has bootstrapped and the balancer sees them all UP.
 
-    time.sleep(sleep)  # let things connect
+    Args:
+        onions (List[OnionCircuit]): List of TOR containers.
+        onion_balancer (Balancer): Balancer instance connected to the TOR containers.
+        timeout (float): Max number of seconds to wait for the whole pool.
+
+    Returns:
+        float: Number of seconds it took for the pool to become ready.
+
+    Raises:
+        TimeoutError: If the pool is not ready before the timeout.
+    """
+    start = time.monotonic()
+
+    for onion in onions:
+        # The circuits bootstrap concurrently, so they all share one deadline.
+        onion.wait_until_ready(timeout=max(timeout - (time.monotonic() - start), 0))
+
+    onion_balancer.wait_until_ready(timeout=max(timeout - (time.monotonic() - start), 0))
+
+    elapsed = time.monotonic() - start
+    logger.info(f"Rotating proxy ready after {elapsed:.2f} seconds.")
+
+    return elapsed
 
 
 class Requestor:
     """Makes proxied web requests via a rotating proxy TOR network."""
 
-    def __init__(
-        self, onions: List[OnionCircuit], onion_balancer: Balancer, timeout: int, max_retries: int
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        onions: List[OnionCircuit],
+        onion_balancer: Balancer,
+        timeout: int,
+        max_retries: int,
+        session_options: Optional[SessionOptions] = None,
+        ready_timeout: int = 120,
+        network: Optional[Network] = None,
+        show_log: bool = False,
+        retry_policy: Optional[RetryPolicy] = None,
+        routing: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+        single_flight: Optional[SingleFlight] = None,
+        scheduler: Optional[Scheduler] = None,
+        quarantine: Optional[Quarantine] = None,
+        torrc: Optional[MountFile] = None,
+        tor_cache: Optional[TorCache] = None,
+        hedge: Optional[HedgePolicy] = None,
+        adaptive_timeouts: Optional[AdaptiveTimeouts] = None,
     ) -> "Requestor":
         """Requestor __init__ method.
 
@@ -41,62 +124,665 @@ class Requestor:
             onions (List[OnionCircuit]): List of TOR containers.
             onion_balancer (Balancer): Balancer instances connected to TOR containers
                 on the same network.
-            timeout (int): Requests timeout.
+            timeout (int): Requests timeout. With adaptive timeouts it is the static timeout
+                used until enough latencies were seen.
             max_retries (int): Max number of time to retry on bad response or connection error.
+            session_options (Optional[SessionOptions]): Connection pool and keep-alive options
+                for the pooled sessions.
+            ready_timeout (int): Max number of seconds to wait for the pool to become ready.
+            network (Optional[Network]): Network the TOR containers and balancer are connected
+                to. Required to scale the pool at runtime.
+            show_log (bool): If True shows the logs of containers started or stopped at runtime.
+            retry_policy (Optional[RetryPolicy]): Decides which failures are retried and when.
+                Defaults to a policy making up to max_retries attempts.
+            routing (Optional[str]): If set, requests bypass the balancer and are sent straight
+                to each onions SOCKS port, picked with the ewma or least_outstanding strategy.
+            cache (Optional[ResponseCache]): If set, GET responses are cached and revalidated
+                as their headers allow.
+            single_flight (Optional[SingleFlight]): If set, identical concurrent GET requests
+                wait on one request and share its response.
+            scheduler (Optional[Scheduler]): If set, every attempt waits its turn within the
+                per host rate limits, concurrency caps and politeness delays.
+            quarantine (Optional[Quarantine]): If set, responses are checked for bans. A banned
+                onion is taken out of rotation for the host and its identity renewed, and the
+                request is retried through another onion. Bans are traced to onions with client
+                side routing, which defaults to ewma when a quarantine is set.
+            torrc (Optional[MountFile]): Rendered torrc mounted into onions added at runtime.
+            tor_cache (Optional[TorCache]): If set, onions added at runtime start from its
+                cached directory documents.
+            hedge (Optional[HedgePolicy]): If set, an attempt which is slower than the hosts
+                usual latency is duplicated through another circuit, and the first response
+                wins. Streamed requests are never hedged.
+            adaptive_timeouts (Optional[AdaptiveTimeouts]): If set, each attempt gets connect
+                and read timeouts derived from the latencies of its circuit and host. The
+                effective timeouts per host are recorded in the metrics.
         """
+        self.network = network
+        self.show_log = show_log
+        self.ready_timeout = ready_timeout
+        self.time_to_ready: Optional[float] = None
+        self.startup_timings: Optional[PhaseTimings] = None
         self.timeout = timeout
         self.onions = onions
         self.onion_balancer = onion_balancer
         self.max_retries = max_retries
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=max_retries)
+        self.sessions = SessionPool(session_options)
+
+        if quarantine is not None and routing is None:
+            routing = "ewma"
+
+        self.router = (
+            None if routing is None else CircuitRouter(onions, routing, failure_penalty=timeout)
+        )
+
+        self.cache = cache
+        self.single_flight = single_flight
+        self.scheduler = scheduler
+        self.quarantine = quarantine
+        self.torrc = torrc
+        self.tor_cache = tor_cache
+        self.hedge = hedge
+        self.adaptive_timeouts = adaptive_timeouts
+        self.metrics = RequestorMetrics()
+
+        # Each hedged attempt runs in two of its threads while the caller waits on them.
+        self._hedge_pool = (
+            None
+            if hedge is None
+            else ThreadPoolExecutor(
+                max_workers=2 * self.sessions.options.pool_maxsize, thread_name_prefix="hedge"
+            )
+        )
+        self._scale_lock = threading.Lock()
 
     @property
     def rotating_proxy(self) -> Dict[str, str]:
         """Rotating proxy frontend input address."""
         return self.onion_balancer.proxies
 
+    @contextmanager
+    def _route(
+        self,
+        sticky_key: Optional[Hashable],
+        url: str,
+        exclude: AbstractSet[str] = frozenset(),
+        routed: Optional[Set[str]] = None,
+    ) -> Iterator[Tuple[Optional[OnionCircuit], Dict[str, str]]]:
+        """Yield the onion and the proxies to send a request through.
+
+        Without client side routing the onion is None and the proxies are the rotating proxy.
+        Onions in exclude and onions the urls host has banned are avoided. The name of the
+        picked onion is added to routed.
+        """
+        if self.router is None:
+            yield None, self.rotating_proxy
+            return
+
+        if self.quarantine is not None:
+            exclude = exclude | self.quarantine.banned(url)
+
+        with self.router.route(sticky_key, exclude) as onion:
+            if routed is not None:
+                routed.add(onion.container_name)
+
+            yield onion, onion.proxies
+
+    def _detect_ban(
+        self, onion: Optional[OnionCircuit], response: requests.models.Response
+    ) -> Optional[str]:
+        """Return why an onions response looks like a ban, None if it doesn't or can't tell."""
+        if self.quarantine is None or onion is None:
+            return None
+
+        return self.quarantine.detect(response)
+
+    def _ban(
+        self, onion: OnionCircuit, url: str, reason: str, sticky_key: Optional[Hashable]
+    ) -> None:
+        """Quarantine an onion banned by the urls host and renew only its identity."""
+        logger.warning(f"{onion.container_name} banned by {url} ({reason}), renewing it.")
+
+        self.quarantine.ban(onion.container_name, url, reason)
+
+        if sticky_key is not None:
+            self.router.unstick(sticky_key)
+
+        try:
+            onion.renew_identity()
+        except Exception as error:  # pylint: disable=broad-except
+            logger.error(f"Failed to renew {onion.container_name}: {error}")
+
+        # Only the banned onions keep-alive connections can stick to its old exit.
+        self.sessions.close_proxy(onion.address)
+
+    def _schedule(self, url: str) -> ContextManager[None]:
+        """Return a context which holds the urls scheduler slot, if there is a scheduler."""
+        return nullcontext() if self.scheduler is None else self.scheduler.slot(url)
+
+    def _record_attempt(
+        self,
+        url: str,
+        start: float,
+        response: Optional[requests.models.Response] = None,
+        error: Optional[Exception] = None,
+        stream: bool = False,
+    ) -> RequestEvent:
+        """Record the metrics of a request attempt which started at start."""
+        total = time.monotonic() - start
+        connect = pop_connect_time()
+
+        if response is None:
+            event = RequestEvent(url=url, error=type(error).__name__, connect=connect, total=total)
+
+        else:
+            event = RequestEvent(
+                url=url,
+                status_code=response.status_code,
+                connect=connect,
+                ttfb=response.elapsed.total_seconds(),
+                total=total,
+                received_bytes=0 if stream else len(response.content),
+            )
+
+        self.metrics.record(event)
+
+        return event
+
     def get(
-        self, url: str, *args, **kwargs  # noqa: ANN002, ANN003
+        self,
+        url: str,
+        params: Optional[Any] = None,
+        *,
+        sticky_key: Optional[Hashable] = None,
+        cache_ttl: Optional[float] = None,
+        **kwargs,  # noqa: ANN003
     ) -> Optional[requests.models.Response]:
         """Overload requests.get method.
 
-        This will pass in the rotating proxy host address and timeout into the requests.get
-        method. Additionally, It provides a way to automatically retry on connection failures
-        and bad status_codes. Each time there is a failure it will try a new request with
-        a new ip address.
+        This will pass in the rotating proxy host address and timeout into the get method of a
+        pooled keep-alive session. Additionally, It provides a way to automatically retry on
+        connection failures and retryable status_codes, as decided by the retry policy. Each
+        time there is a failure it will back off, then try a new request with a new ip address.
+
+        The number of retries made and the reason for each are set on the returned response as
+        `retries` and `retry_reasons`, and whether it was served from the cache as `from_cache`.
+        With single flight coalescing, callers of an identical request in flight share its
+        response object, or its exception. Sticky requests are never coalesced.
 
         Args:
             url (str): url to send the get request.
-            *args: arguments to pass to requests.get() method.
-            **kwargs: keyword arguments to pass to requests.get() method.
+            params (Optional[Any]): Query string parameters, as in requests.get.
+            sticky_key (Optional[Hashable]): With client side routing, requests sharing a key
+                are sent through the same onion until it fails.
+            cache_ttl (Optional[float]): With a cache, the number of seconds the response is
+                fresh for, overriding its headers and the caches ttl.
+            **kwargs: keyword arguments to pass to requests.Session.get() method.
 
         Returns:
-            Response: If a response is found else None.
+            Response: If a successful or terminal response is found else None.
         """
-        retries = self.max_retries
+        kwargs.pop("proxies", None)
+        kwargs.pop("timeout", None)
+
+        if params is not None:
+            kwargs["params"] = params
+
+        key = None
+
+        if self.single_flight is not None and sticky_key is None:
+            key = self.single_flight.key("GET", url, kwargs)
 
+        if key is None:
+            return self._fetch(url, sticky_key=sticky_key, cache_ttl=cache_ttl, **kwargs)
+
+        return self.single_flight.do(
+            (key, cache_ttl),
+            lambda: self._fetch(url, sticky_key=sticky_key, cache_ttl=cache_ttl, **kwargs),
+        )
+
+    def stream(
+        self,
+        url: str,
+        chunk_size: int = 65536,
+        max_resumes: Optional[int] = None,
+        sticky_key: Optional[Hashable] = None,
+        **kwargs,  # noqa: ANN003
+    ) -> Optional[ResumableStream]:
+        """Send a streamed get request whose body is read in bounded chunks.
+
+        The request is retried like get until a response arrives. If its body then breaks
+        mid-way it is resumed with Range requests through a fresh circuit, up to max_resumes
+        times, after checking the rest is the same body. Bodies are requested uncompressed
+        unless an Accept-Encoding header is given, so they can be resumed. Streams bypass the
+        cache and single flight coalescing.
+
+        Args:
+            url (str): url to send the get request.
+            chunk_size (int): Max number of body bytes held in memory at a time.
+            max_resumes (Optional[int]): Max number of times a broken body is resumed. Defaults
+                to max_retries.
+            sticky_key (Optional[Hashable]): With client side routing, the first request is sent
+                through the onion of the key. Resumes are not sticky.
+            **kwargs: keyword arguments to pass to requests.Session.get() method.
+
+        Returns:
+            Optional[ResumableStream]: The streamed body, e.g. to iterate or write_to a file.
+                None if no successful or terminal response was found.
+        """
         kwargs.pop("proxies", None)
         kwargs.pop("timeout", None)
+        kwargs.pop("stream", None)
 
-        while retries > 0:
-            try:
-                response = requests.get(
-                    url, timeout=self.timeout, proxies=self.rotating_proxy, *args, **kwargs
+        headers = CaseInsensitiveDict(kwargs.pop("headers", None) or {})
+        headers.setdefault("Accept-Encoding", "identity")
+
+        def reopen(extra: Dict[str, str]) -> Optional[requests.models.Response]:
+            self.metrics.record_retry("resume")
+            return self._get(url, stream=True, headers={**headers, **extra}, **kwargs)
+
+        response = self._get(
+            url, stream=True, headers=dict(headers), sticky_key=sticky_key, **kwargs
+        )
+
+        if response is None:
+            return None
+
+        return ResumableStream(
+            response,
+            reopen,
+            chunk_size=chunk_size,
+            max_resumes=self.max_retries if max_resumes is None else max_resumes,
+        )
+
+    def download(
+        self,
+        url: str,
+        path: Union[str, os.PathLike],
+        parts: int = 4,
+        chunk_size: int = 65536,
+        min_part_size: int = 1024 * 1024,
+        stall_timeout: float = 10,
+        **kwargs,  # noqa: ANN003
+    ) -> DownloadReport:
+        """Download a large file in parts fetched concurrently through different circuits.
+
+        See ParallelDownload. Files without range support are downloaded as one resumable
+        stream. Downloads bypass the cache and single flight coalescing.
+
+        Args:
+            url (str): url of the file.
+            path (Union[str, os.PathLike]): The file to write, replaced if it exists.
+            parts (int): Max number of parts fetched at the same time.
+            chunk_size (int): Max number of bytes each part holds in memory at a time.
+            min_part_size (int): Min number of bytes of a part, smaller files get fewer parts.
+            stall_timeout (float): Seconds a part can go without progress before its remaining
+                range is reassigned to a new request.
+            **kwargs: keyword arguments to pass to requests.Session.get() method.
+
+        Returns:
+            DownloadReport: Size, parts, reassignments and throughput of the download.
+
+        Raises:
+            StreamError: If the file can't be downloaded, or changes while it is.
+        """
+        kwargs.pop("proxies", None)
+        kwargs.pop("timeout", None)
+        kwargs.pop("stream", None)
+
+        headers = CaseInsensitiveDict(kwargs.pop("headers", None) or {})
+        headers.setdefault("Accept-Encoding", "identity")
+
+        def send(extra: Dict[str, str]) -> Optional[requests.models.Response]:
+            return self._get(url, stream=True, headers={**headers, **extra}, **kwargs)
+
+        download = ParallelDownload(
+            url,
+            send,
+            parts=parts,
+            chunk_size=chunk_size,
+            min_part_size=min_part_size,
+            stall_timeout=stall_timeout,
+            max_reassigns=self.max_retries,
+        )
+
+        return download.run(path)
+
+    def _fetch(
+        self,
+        url: str,
+        sticky_key: Optional[Hashable],
+        cache_ttl: Optional[float],
+        **kwargs,  # noqa: ANN003
+    ) -> Optional[requests.models.Response]:
+        """Send a get request, through the cache when there is one."""
+        if self.cache is None or kwargs.get("stream"):
+            return self._get(url, sticky_key=sticky_key, **kwargs)
+
+        return self._cached_get(url, sticky_key=sticky_key, cache_ttl=cache_ttl, **kwargs)
+
+    @staticmethod
+    def _from_cache(
+        entry: CacheEntry, response: Optional[requests.models.Response] = None
+    ) -> requests.models.Response:
+        """Return a cached entry as a response, keeping the retries of a revalidation."""
+        cached = entry.to_response()
+        cached.retries = getattr(response, "retries", 0)
+        cached.retry_reasons = getattr(response, "retry_reasons", [])
+        cached.from_cache = True
+
+        return cached
+
+    def _cached_get(
+        self,
+        url: str,
+        sticky_key: Optional[Hashable],
+        cache_ttl: Optional[float],
+        **kwargs,  # noqa: ANN003
+    ) -> Optional[requests.models.Response]:
+        """Serve a get request from the cache, revalidating or fetching it when needed."""
+        key = self.cache.key(url, kwargs.get("params"))
+        headers = CaseInsensitiveDict(kwargs.get("headers") or {})
+        directives = parse_cache_control(headers.get("Cache-Control"))
+
+        entry = None
+
+        if "no-cache" not in directives and "no-store" not in directives:
+            entry = self.cache.get(key)
+
+        if entry is not None and not entry.matches(headers):
+            entry = None
+
+        if entry is not None and entry.is_fresh():
+            self.cache.counts.inc("hit")
+            return self._from_cache(entry)
+
+        self.cache.counts.inc("miss" if entry is None else "stale")
+
+        if entry is not None:
+            kwargs["headers"] = {**headers, **entry.validators}
+
+        response = self._get(url, sticky_key=sticky_key, **kwargs)
+
+        if response is None:
+            return None
+
+        if entry is not None and response.status_code == 304:
+            return self._from_cache(
+                self.cache.revalidated(key, entry, response, cache_ttl), response
+            )
+
+        if "no-store" not in directives:
+            self.cache.store(key, response, headers, cache_ttl)
+
+        return response
+
+    def _send(
+        self,
+        url: str,
+        kwargs: Dict[str, Any],
+        sticky_key: Optional[Hashable],
+        exclude: AbstractSet[str] = frozenset(),
+        routed: Optional[Set[str]] = None,
+        slot: Optional[HeldSlot] = None,
+    ) -> Tuple[Optional[OnionCircuit], requests.models.Response]:
+        """Send a single attempt of a get request and record its metrics.
+
+        The attempt is sent with the calling threads session, in the given scheduler slot, by
+        default once the scheduler admits it.
+
+        Returns:
+            Tuple[Optional[OnionCircuit], requests.models.Response]: The onion the attempt was
+                routed through, None without client side routing, and the response.
+        """
+        start = time.monotonic()
+        onion, timeout = None, self.timeout
+
+        try:
+            with slot or self._schedule(url), self.metrics.track(), self._route(
+                sticky_key, url, exclude, routed
+            ) as (onion, proxies):
+                timeout = self._timeout(url, onion)
+                start = time.monotonic()
+                response = self.sessions.session().get(
+                    url, timeout=timeout, proxies=proxies, **kwargs
                 )
-                if response.ok:
+
+        except (ProxyError, Timeout, ConnectionError) as error:
+            self._record_attempt(url, start, error=error)
+            self._observe_timeout(url, onion, timeout, error)
+            raise
+
+        event = self._record_attempt(url, start, response=response, stream=kwargs.get("stream"))
+
+        if self.hedge is not None:
+            self.hedge.observe(url, time.monotonic() - start)
+
+        if self.adaptive_timeouts is not None:
+            self.adaptive_timeouts.observe(
+                url,
+                None if onion is None else onion.container_name,
+                connect=event.connect,
+                read=None if event.ttfb is None else max(event.ttfb - (event.connect or 0), 0),
+            )
+
+        return onion, response
+
+    def _timeout(self, url: str, onion: Optional[OnionCircuit]) -> Union[float, Tuple[float, ...]]:
+        """Return the timeout of an attempt, the connect and read timeouts when adaptive."""
+        if self.adaptive_timeouts is None:
+            return self.timeout
+
+        timeouts = self.adaptive_timeouts.timeout(
+            url, None if onion is None else onion.container_name, default=self.timeout
+        )
+        self.metrics.record_timeouts(self.adaptive_timeouts.host_of(url), *timeouts)
+
+        return timeouts
+
+    def _observe_timeout(
+        self,
+        url: str,
+        onion: Optional[OnionCircuit],
+        timeout: Union[float, Tuple[float, ...]],
+        error: Exception,
+    ) -> None:
+        """Observe an attempt which timed out at the timeout it hit."""
+        if self.adaptive_timeouts is None or not isinstance(timeout, tuple):
+            return
+
+        circuit = None if onion is None else onion.container_name
+
+        if isinstance(error, ConnectTimeout):
+            self.adaptive_timeouts.observe(url, circuit, connect=timeout[0])
+
+        elif isinstance(error, ReadTimeout):
+            self.adaptive_timeouts.observe(url, circuit, read=timeout[1])
+
+    def _send_hedged(
+        self,
+        url: str,
+        kwargs: Dict[str, Any],
+        sticky_key: Optional[Hashable],
+    ) -> Tuple[Optional[OnionCircuit], requests.models.Response]:
+        """Send an attempt, and a hedge through another onion if it is slower than usual.
+
+        The first response wins. A requests call in flight can't be interrupted, so the losing
+        attempt is cancelled if it hasn't started, else its response is closed on arrival. Both
+        attempts run on the hedge pool, each with its pool threads own session, so the callers
+        session is never shared with a leg still running after this returns. With a scheduler,
+        the hedge takes its slot before it is submitted, and is skipped if the host has no free
+        slot, so it never waits on the attempt it duplicates.
+        """
+        delay = self.hedge.delay(url)
+
+        if delay is None or delay >= self.timeout:
+            return self._send(url, kwargs, sticky_key)
+
+        routed: Set[str] = set()
+        primary = self._hedge_pool.submit(self._send, url, kwargs, sticky_key, frozenset(), routed)
+
+        if wait([primary], timeout=delay).done:
+            return primary.result()
+
+        slot = None
+
+        if self.scheduler is not None:
+            slot = self.scheduler.try_slot(url)
+
+            if slot is None:
+                self.hedge.counts.inc("busy")
+                return primary.result()
+
+        if not self.hedge.try_hedge():
+            if slot is not None:
+                slot.release()
+
+            return primary.result()
+
+        logger.debug(f"Hedging {url} after {delay:.2f} seconds.")
+
+        hedge = self._hedge_pool.submit(
+            self._send, url, kwargs, None, frozenset(routed), None, slot
+        )
+        error = None
+
+        for future in as_completed((primary, hedge)):
+            try:
+                result = future.result()
+            except (ProxyError, Timeout, ConnectionError) as leg_error:
+                error = leg_error
+                continue
+
+            if future is hedge:
+                self.hedge.counts.inc("won")
+
+            loser = primary if future is hedge else hedge
+
+            if not loser.cancel():
+                loser.add_done_callback(self._discard)
+
+            elif loser is hedge and slot is not None:
+                slot.release()
+
+            return result
+
+        raise error
+
+    @staticmethod
+    def _discard(future: Future) -> None:
+        """Close the response of a losing attempt, releasing its connection."""
+        if not future.cancelled() and future.exception() is None:
+            future.result()[1].close()
+
+    def _get(
+        self,
+        url: str,
+        sticky_key: Optional[Hashable] = None,
+        **kwargs,  # noqa: ANN003
+    ) -> Optional[requests.models.Response]:
+        """Send a get request through the rotating proxy, retrying as the policy decides."""
+        attempt = 0
+        reasons = []
+        hedged = self.hedge is not None and not kwargs.get("stream")
+
+        while True:
+            attempt += 1
+
+            try:
+                if hedged:
+                    onion, response = self._send_hedged(url, kwargs, sticky_key)
+                else:
+                    onion, response = self._send(url, kwargs, sticky_key)
+
+                if self.scheduler is not None:
+                    self.scheduler.observe(url, response.status_code, response.headers)
+
+                ban = self._detect_ban(onion, response)
+
+                if ban is not None:
+                    self._ban(onion, url, ban, sticky_key)
+                    reasons.append(f"banned:{ban}")
+
+                elif response.ok or not self.retry_policy.is_retryable(response.status_code):
+                    response.retries = attempt - 1
+                    response.retry_reasons = reasons
+                    response.from_cache = False
                     return response
 
+                else:
+                    reasons.append(str(response.status_code))
+
             except (ProxyError, Timeout, ConnectionError) as error:
+                reasons.append(type(error).__name__)
                 logger.error(error)
 
-            retries -= 1
-            logger.debug(f"Retrying {retries} more times.")
+            if not self.retry_policy.should_retry(attempt):
+                break
+
+            self.metrics.record_retry(reasons[-1])
+
+            delay = self.retry_policy.backoff(attempt)
+            logger.debug(f"Retrying in {delay:.2f} seconds after {reasons[-1]}.")
+            time.sleep(delay)
+
+        logger.debug(f"Giving up on {url} after {attempt} attempts: {', '.join(reasons)}.")
 
         return None
 
+    def close(self) -> None:
+        """Close the pooled sessions connections and the caches on disk tier."""
+        if self._hedge_pool is not None:
+            self._hedge_pool.shutdown(wait=False)
+
+        self.sessions.close()
+
+        if self.cache is not None:
+            self.cache.close()
+
+    def wait_until_ready(self) -> float:
+        """Block until the rotating proxy is ready and record the time it took.
+
+        Returns:
+            float: Number of seconds it took for the pool to become ready.
+        """
+        self.time_to_ready = wait_until_ready(self.onions, self.onion_balancer, self.ready_timeout)
+        return self.time_to_ready
+
+    def renew_identity(
+        self, onions: Optional[List[OnionCircuit]] = None, max_threads: int = 10
+    ) -> List[OnionCircuit]:
+        """Switch onions to clean TOR circuits without restarting their containers.
+
+        Sends SIGNAL NEWNYM over each onions control port in parallel, then recycles the pooled
+        keep-alive connections so they can't stick to the old circuits. This can be useful for
+        changing ip addresses every n requests without pausing throughput.
+
+        Args:
+            onions (Optional[List[OnionCircuit]]): Onions to renew. Defaults to all onions.
+            max_threads (int): How many threads to use.
+
+        Returns:
+            List[OnionCircuit]: Onions which were renewed. Onions renewed within TOR's NEWNYM
+                rate limit are skipped.
+        """
+        onions = self.onions if onions is None else onions
+
+        with ThreadPoolExecutor(max_workers=max_threads) as executor:
+            futures = {executor.submit(onion.renew_identity): onion for onion in onions}
+            renewed = [futures[future] for future in as_completed(futures) if future.result()]
+
+        self.sessions.close()
+
+        logger.debug(f"Renewed {len(renewed)} of {len(onions)} onion identities.")
+
+        return renewed
+
     def restart_onions(self, with_threads: bool = True, max_threads: int = 5) -> None:
         """Restart onion containers.
 
-        This can be useful for changing ip addresses every n requests.
+        This can be useful for changing ip addresses every n requests. Returns as soon as
+        every restarted circuit has bootstrapped again.
 
         Args:
             with_threads (bool): if True uses threads to restart the containers.
@@ -112,63 +798,361 @@ class Requestor:
             for onion in self.onions:
                 onion.restart()
 
-        pause(5)
+        self.wait_until_ready()
+
+    def _disable_route(self, onion: OnionCircuit) -> None:
+        """Stop client side routing of new requests through an onion."""
+        if self.router is not None:
+            self.router.disable(onion)
+
+    def _enable_route(self, onion: OnionCircuit) -> None:
+        """Resume client side routing of new requests through an onion."""
+        if self.router is not None:
+            self.router.enable(onion)
+
+    def _rotate_batch(self, batch: List[OnionCircuit], drain_timeout: float) -> None:
+        """Drain, restart and re-enable a batch of onions on the balancer."""
+        servers = [
+            server
+            for onion in batch
+            for server in self.onion_balancer.server_names(onion.container_name)
+        ]
+
+        for server in servers:
+            self.onion_balancer.set_server_state(server, "drain")
+
+        for onion in batch:
+            self._disable_route(onion)
+
+        # Idle keep-alive connections count as sessions, so drop them instead of waiting.
+        self.sessions.close()
+
+        deadline = time.monotonic() + drain_timeout
+
+        for server in servers:
+            remaining = max(deadline - time.monotonic(), 0)
+
+            if not self.onion_balancer.wait_until_drained(server, remaining):
+                logger.warning(f"{server} still has active sessions, restarting anyway.")
+
+            self.onion_balancer.set_server_state(server, "maint")
+
+        try:
+            with ThreadPoolExecutor(max_workers=len(batch)) as executor:
+                futures = [executor.submit(onion.restart) for onion in batch]
+
+                for future in as_completed(futures):
+                    future.result()
+
+            for onion in batch:
+                onion.wait_until_ready(timeout=self.ready_timeout)
+
+        finally:
+            for server in servers:
+                self.onion_balancer.set_server_state(server, "ready")
+
+            for onion in batch:
+                self._enable_route(onion)
+
+        for server in servers:
+            if not self.onion_balancer.wait_until_up(server, self.ready_timeout):
+                logger.warning(f"{server} did not pass its health check after restarting.")
+
+    def rolling_restart_onions(self, batch_size: int = 1, drain_timeout: float = 30) -> None:
+        """Restart onion containers a batch at a time without interrupting requests.
+
+        Each batch is drained on the balancer first, so in-flight requests finish on their
+        circuits while new requests go to the rest of the pool. The batch is then restarted and
+        put back into rotation once it has bootstrapped and passes its health check. At least
+        (onion_count - batch_size) / onion_count of the pool keeps serving requests throughout.
+
+        Args:
+            batch_size (int): Number of onions to restart at a time.
+            drain_timeout (float): Max number of seconds to wait for a batches active sessions
+                to finish before restarting it anyway.
+        """
+        for batch in chunked(self.onions, batch_size):
+            self._rotate_batch(batch, drain_timeout)
+
+        logger.debug(f"Rolling restart of {len(self.onions)} onions complete.")
+
+    def _add_onion(self) -> OnionCircuit:
+        """Start a new onion and route to it once it has bootstrapped."""
+        seed = None if self.tor_cache is None else self.tor_cache.load()
+        circuits = self.onion_balancer.haproxy_options.circuits_per_onion
+        onion = create_onion(self.network.runtime, self.torrc, seed, circuits)
+        onion.start(show_log=self.show_log, network=self.network.handle)
+
+        try:
+            onion.wait_until_ready(timeout=self.ready_timeout)
+            self.onion_balancer.add_servers(
+                onion.container_name,
+                [
+                    self.network.container_address(onion.container, port)
+                    for port in onion.socks_ports
+                ],
+                timeout=self.ready_timeout,
+            )
+
+        except Exception:
+            onion.stop(show_log=self.show_log)
+            raise
+
+        return onion
+
+    def _remove_onion(self, onion: OnionCircuit, drain_timeout: float) -> None:
+        """Stop routing to an onion, then stop it once its active sessions have finished."""
+        self._disable_route(onion)
+        self.onion_balancer.remove_servers(onion.container_name, timeout=drain_timeout)
+        onion.stop(show_log=self.show_log)
+
+        if self.router is not None:
+            self.router.forget(onion)
+
+    def scale_to(self, onion_count: int, drain_timeout: float = 30) -> None:
+        """Grow or shrink the pool of onions without restarting the balancer.
+
+        New onions are added to free server slots on the balancer once they have bootstrapped.
+        Removed onions are drained first, so no active connections are dropped.
+
+        Args:
+            onion_count (int): Number of onions the pool should have.
+            drain_timeout (float): Max number of seconds to wait for a removed onions active
+                sessions to finish before stopping it anyway.
+
+        Raises:
+            ValueError: If the onion_count is out of the range the balancer can route to.
+        """
+        haproxy_options = self.onion_balancer.haproxy_options
+        slots = len(self.onion_balancer.servers) // haproxy_options.circuits_per_onion
+
+        if not 1 <= onion_count <= slots:
+            raise ValueError(f"onion_count must be between 1 and {slots}.")
+
+        with self._scale_lock:
+            self._scale_to(onion_count, drain_timeout)
+
+    def _scale_to(self, onion_count: int, drain_timeout: float) -> None:
+        """Start or stop onions until the pool has onion_count onions."""
+        current = len(self.onions)
+
+        if onion_count > current:
+            with ThreadPoolExecutor(max_workers=onion_count - current) as executor:
+                futures = [executor.submit(self._add_onion) for _ in range(onion_count - current)]
+
+                for future in as_completed(futures):
+                    # Onions are appended in place, so OnionCircuits stops them on exit.
+                    self.onions.append(future.result())
+
+        elif onion_count < current:
+            self.sessions.close()  # Drop idle keep-alive connections to the removed onions.
+
+            removed = self.onions[onion_count:]
+
+            with ThreadPoolExecutor(max_workers=len(removed)) as executor:
+                futures = [
+                    executor.submit(self._remove_onion, onion, drain_timeout) for onion in removed
+                ]
+
+                for future in as_completed(futures):
+                    future.result()
+
+            del self.onions[onion_count:]
+
+        logger.info(f"Scaled pool from {current} to {len(self.onions)} onions.")
 
 
 @contextmanager
 def RequestsWhaor(  # pylint: disable=invalid-name, too-many-arguments
     onion_count: int = 5,
     start_with_threads: bool = True,
-    max_threads: int = 5,
+    max_threads: Optional[int] = None,
     timeout: int = 5,
     show_log: bool = False,
     max_retries: int = 5,
+    concurrency: Optional[int] = None,
+    pool_connections: Optional[int] = None,
+    pool_maxsize: Optional[int] = None,
+    keep_alive: Optional[int] = 60,
+    ready_timeout: int = 120,
+    max_onions: Optional[int] = None,
+    autoscale: bool = False,
+    min_onions: int = 1,
+    retry_policy: Optional[RetryPolicy] = None,
+    routing: Optional[str] = None,
+    haproxy_options: Optional[Dict[str, Any]] = None,
+    runtime: Optional[ContainerRuntime] = None,
+    cache: Optional[ResponseCache] = None,
+    single_flight: Optional[SingleFlight] = None,
+    scheduler: Optional[Scheduler] = None,
+    quarantine: Optional[Quarantine] = None,
+    startup_threads: Optional[int] = None,
+    torrc_options: Optional[Dict[str, str]] = None,
+    tor_cache: Optional[TorCache] = None,
+    circuits_per_container: int = 1,
+    hedge: Optional[HedgePolicy] = None,
+    adaptive_timeouts: Optional[AdaptiveTimeouts] = None,
 ) -> Requestor:
     """Context manager which starts n amount of tor nodes behind a round robin reverse proxy.
 
     Args:
         onion_count (int): Number of TOR circuits to spin up.
         start_with_threads (bool): If True uses treads to spin up containers.
-        max_threads (int): Max number of threads to use when spin up containers.
+        max_threads (Optional[int]): Max number of threads to use when spinning up containers,
+            unless startup_threads is set. Also sizes the connection pools unless concurrency
+            is set.
         timeout (int): Requests timeout.
         show_log (bool): If True shows the containers logs.
         max_retries (int): Max number of time to retry on bad response or connection error.
+        concurrency (Optional[int]): Number of threads expected to share the requestor. Used
+            to size the connection pools. Defaults to max_threads, or DEFAULT_CONCURRENCY.
+        pool_connections (Optional[int]): Number of connection pools to cache, one per target
+            host. Defaults to onion_count with a minimum of 10.
+        pool_maxsize (Optional[int]): Maximum number of kept alive connections per pool.
+            Defaults to the larger of onion_count and concurrency.
+        keep_alive (Optional[int]): Seconds before kept alive connections are recycled.
+            None keeps connections alive indefinitely.
+        ready_timeout (int): Max number of seconds to wait for the TOR circuits to bootstrap
+            and the balancer to report them UP.
+        max_onions (Optional[int]): Max number of TOR circuits the pool can be scaled to at
+            runtime with Requestor.scale_to. Defaults to twice onion_count.
+        autoscale (bool): If True runs a background autoscaler which scales the pool between
+            min_onions and max_onions to the load.
+        min_onions (int): Min number of TOR circuits the autoscaler can scale down to.
+        retry_policy (Optional[RetryPolicy]): Decides which failures are retried and when.
+            Defaults to a policy making up to max_retries attempts.
+        routing (Optional[str]): If set to ewma or least_outstanding, requests bypass the
+            balancer and are load balanced client side across each TOR circuits SOCKS port.
+        haproxy_options (Optional[Dict[str, Any]]): HAProxyOptions fields for the balancer,
+            e.g. {"balance": "leastconn", "socks_check": True}.
+        runtime (Optional[ContainerRuntime]): Runtime to run TOR and HAProxy on, e.g. a
+            LocalProcessRuntime to run the binaries directly without Docker. Defaults to
+            Docker.
+        cache (Optional[ResponseCache]): If set, GET responses are cached and revalidated as
+            their headers allow, e.g. ResponseCache(path="responses.sqlite").
+        single_flight (Optional[SingleFlight]): If set, identical concurrent GET requests are
+            coalesced into one, e.g. SingleFlight() or SingleFlight(key=my_key_function).
+        scheduler (Optional[Scheduler]): If set, requests are rate limited and queued fairly per
+            host, e.g. Scheduler(HostLimits(rate=2, max_concurrency=4, delay=0.1)).
+        quarantine (Optional[Quarantine]): If set, onions a host bans are taken out of rotation
+            for that host and renewed, e.g. Quarantine(duration=600). Enables ewma routing
+            unless routing is set.
+        startup_threads (Optional[int]): Max number of threads starting and stopping the TOR
+            containers when start_with_threads is set. Defaults to max_threads, or onion_count
+            capped at MAX_STARTUP_THREADS.
+        torrc_options (Optional[Dict[str, str]]): Extra options of the torrc every TOR
+            container shares, e.g. {"ExitNodes": "{de}", "StrictNodes": "1"}.
+        tor_cache (Optional[TorCache]): If set, TOR containers start from its cached directory
+            documents instead of downloading them, and it is updated from a bootstrapped
+            container once the pool is ready, e.g. TorCache() to persist them between runs.
+        circuits_per_container (int): Number of isolated SOCKS ports each TOR container
+            serves, each registered as its own balancer server. Raises the number of distinct
+            circuits per TOR process, so onion_count * circuits_per_container circuits run in
+            onion_count processes. Client side routing uses each containers first port only.
+        hedge (Optional[HedgePolicy]): If set, GET attempts slower than the hosts latency
+            quantile are duplicated through another circuit and the first response wins, e.g.
+            HedgePolicy(quantile=0.95, budget_ratio=0.05).
+        adaptive_timeouts (Optional[AdaptiveTimeouts]): If set, connect and read timeouts are
+            derived from the latencies seen per host and per circuit, with timeout as the
+            static timeout until there are enough, e.g. AdaptiveTimeouts(factor=3,
+            hosts={"slow.example.com": (10, 60)}).
 
     Yields:
         Requestor: Makes proxied web requests via a rotating proxy TOR network.
     """
+    max_onions = max_onions or onion_count * 2
+    startup_threads = (
+        startup_threads or max_threads or max(min(onion_count, MAX_STARTUP_THREADS), 1)
+    )
+    timings = PhaseTimings()
+
     with ExitStack() as stack:
         try:
-            network = stack.enter_context(WhaorNet())
-            onions = stack.enter_context(
-                OnionCircuits(
-                    onion_count,
-                    startup_with_threads=start_with_threads,
-                    max_threads=max_threads,
-                    show_log=show_log,
-                )
-            )
-            for onion in onions:
-                network.connect_container(onion.container_id, onion.container_name)
+            with timings.phase("network"):
+                network = stack.enter_context(WhaorNet(runtime=runtime))
 
-            onion_balancer = stack.enter_context(
-                OnionBalancer(onions=network.containers, show_log=show_log)
-            )
+            with timings.phase("images"):
+                network.runtime.prepare([TOR_IMAGE, HAPROXY_IMAGE])
 
-            network.connect_container(onion_balancer.container_id, onion_balancer.container_name)
+            torrc = stack.enter_context(TorrcMountPoint(torrc_options))
 
-            pause(5)
+            # Containers are created connected to the network. TOR bootstraps in the
+            # background while the balancer starts, and both are only waited on at the end.
+            with timings.phase("onions"):
+                onions = stack.enter_context(
+                    OnionCircuits(
+                        onion_count,
+                        startup_with_threads=start_with_threads,
+                        max_threads=startup_threads,
+                        show_log=show_log,
+                        network=network,
+                        torrc=torrc,
+                        tor_cache=tor_cache,
+                        circuits_per_container=circuits_per_container,
+                    )
+                )
+
+            with timings.phase("balancer"):
+                onion_balancer = stack.enter_context(
+                    OnionBalancer(
+                        onions=onions,
+                        show_log=show_log,
+                        max_onions=max_onions,
+                        network=network,
+                        **(haproxy_options or {}),
+                    )
+                )
 
             logger.info(f"Dashboard Address: {onion_balancer.dashboard_address}")
 
-            pause(1)
+            session_options = SessionOptions.sized_for(
+                onion_count,
+                concurrency or max_threads or DEFAULT_CONCURRENCY,
+                pool_connections=pool_connections,
+                pool_maxsize=pool_maxsize,
+            )
+            session_options.keep_alive = keep_alive
 
-            yield Requestor(
+            requestor = Requestor(
                 onions=onions,
                 onion_balancer=onion_balancer,
                 timeout=timeout,
                 max_retries=max_retries,
+                session_options=session_options,
+                ready_timeout=ready_timeout,
+                network=network,
+                show_log=show_log,
+                retry_policy=retry_policy,
+                routing=routing,
+                cache=cache,
+                single_flight=single_flight,
+                scheduler=scheduler,
+                quarantine=quarantine,
+                torrc=torrc,
+                tor_cache=tor_cache,
+                hedge=hedge,
+                adaptive_timeouts=adaptive_timeouts,
             )
+            stack.callback(requestor.close)
+
+            with timings.phase("bootstrap"):
+                requestor.wait_until_ready()
+
+            if tor_cache is not None and onions:
+                with timings.phase("cache"):
+                    tor_cache.update_from(onions[0])
+
+            requestor.startup_timings = timings
+            logger.info(f"Started {onion_count} onions: {timings.summary()}.")
+
+            if autoscale:
+                autoscaler = Autoscaler(
+                    requestor, AutoscalerOptions(min_onions=min_onions, max_onions=max_onions)
+                )
+                autoscaler.start()
+                stack.callback(autoscaler.stop)
+
+            yield requestor
 
         finally:
 
@@ -0,0 +1,361 @@
+"""This module provides parallel downloads of large files split across TOR circuits."""
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Union
+
+from loguru import logger
+from pydantic import BaseModel as Base
+import requests
+
+from .stream import (
+    parse_content_range,
+    RESUMABLE_ERRORS,
+    ResumableStream,
+    StreamError,
+    strong_etag,
+)
+
+
+def write_at(fd: int, data: bytes, offset: int) -> None:
+    """Write data at an offset of a file, without moving a shared file position.
+
+    Args:
+        fd (int): File descriptor opened for writing.
+        data (bytes): Bytes to write.
+        offset (int): Offset of the first byte.
+    """
+    view = memoryview(data)
+
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+class Segment:
+    """A byte range of the file, fetched through one circuit.
+
+    Attributes:
+        start (int): Offset of the first byte of the range.
+        end (int): Offset of the last byte of the range, inclusive.
+        position (int): Offset of the next byte to write.
+        attempt (int): Number of times the range was assigned, 1 for the first assignment.
+        last_progress (Optional[float]): Monotonic time the response arrived or a chunk was last
+            written, None while the request is being sent and retried.
+        abandoned (bool): Set once the range was reassigned, the segment stops writing.
+        lock (threading.Lock): Held while writing, so a reassigned range is written once.
+    """
+
+    def __init__(self, start: int, end: int, attempt: int = 1) -> "Segment":
+        """Segment __init__ method.
+
+        Args:
+            start (int): Offset of the first byte of the range.
+            end (int): Offset of the last byte of the range, inclusive.
+            attempt (int): Number of times the range was assigned.
+        """
+        self.start = start
+        self.end = end
+        self.position = start
+        self.attempt = attempt
+        self.last_progress: Optional[float] = None
+        self.abandoned = False
+        self.lock = threading.Lock()
+
+    @property
+    def remaining(self) -> int:
+        """Return the number of bytes left to write."""
+        return self.end + 1 - self.position
+
+    @property
+    def range_header(self) -> str:
+        """Return the Range header requesting the bytes left to write."""
+        return f"bytes={self.position}-{self.end}"
+
+
+class DownloadReport(Base):
+    """Summary of a finished download.
+
+    Attributes:
+        url (str): The downloaded url.
+        path (str): The file written.
+        size (int): Number of bytes written.
+        parts (int): Number of segments the file was split into, 1 without range support.
+        reassigned (int): Number of times a failed or stalled segment was reassigned.
+        seconds (float): Number of seconds the download took.
+    """
+
+    url: str
+    path: str
+    size: int
+    parts: int
+    reassigned: int = 0
+    seconds: float
+
+    @property
+    def throughput(self) -> float:
+        """Return the average number of bytes downloaded per second."""
+        return self.size / self.seconds if self.seconds > 0 else 0.0
+
+
+class ParallelDownload:
+    """Downloads a file in segments fetched concurrently through different circuits.
+
+    A single TOR circuit caps a download at its bandwidth. The file is probed for range
+    support with a one byte Range request, preallocated, and split into parts which are fetched
+    with Range requests at the same time. Requests go through the requestors pooled keep-alive
+    connections, and segments in flight at the same time each hold a connection of their own,
+    which the rotating proxy balances to a circuit, so they spread over the circuits of the
+    pool. A kept alive connection stays on its circuit, so a later segment can reuse the
+    circuit of an earlier one. Each segment writes its bytes in place with pwrite. A segment
+    which fails, or writes nothing for stall_timeout seconds, is abandoned at the byte it
+    reached and the rest of its range is reassigned to a new request.
+    Every segment must come from the same version of the file, checked with If-Range and the
+    ETag, or the Last-Modified date without one, and the total size in Content-Range. Files
+    without range support are downloaded as one resumable stream.
+
+    Attributes:
+        url (str): The url to download.
+        parts (int): Max number of segments fetched at the same time.
+        chunk_size (int): Max number of bytes a segment holds in memory at a time.
+        min_part_size (int): Min number of bytes of a segment, smaller files get fewer parts.
+        stall_timeout (float): Seconds without progress before a segment is reassigned.
+        max_reassigns (int): Max number of times one range is reassigned.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        send: Callable[[Dict[str, str]], Optional[requests.models.Response]],
+        parts: int = 4,
+        chunk_size: int = 65536,
+        min_part_size: int = 1024 * 1024,
+        stall_timeout: float = 10,
+        max_reassigns: int = 5,
+    ) -> "ParallelDownload":
+        """Initialize the ParallelDownload.
+
+        Args:
+            url (str): The url to download.
+            send (Callable[[Dict[str, str]], Optional[requests.models.Response]]): Sends a
+                streamed get request of the url with extra headers, returns None if it failed.
+            parts (int): Max number of segments fetched at the same time.
+            chunk_size (int): Max number of bytes a segment holds in memory at a time.
+            min_part_size (int): Min number of bytes of a segment.
+            stall_timeout (float): Seconds without progress before a segment is reassigned.
+            max_reassigns (int): Max number of times one range is reassigned.
+        """
+        self.url = url
+        self.parts = max(parts, 1)
+        self.chunk_size = chunk_size
+        self.min_part_size = min_part_size
+        self.stall_timeout = stall_timeout
+        self.max_reassigns = max_reassigns
+
+        self._send = send
+        self._etag: Optional[str] = None
+        self._last_modified: Optional[str] = None
+        self._size: Optional[int] = None
+        self._reassigned = 0
+
+    def split(self, size: int) -> List[Segment]:
+        """Split a file of size bytes into contiguous segments.
+
+        Args:
+            size (int): Size of the file.
+
+        Returns:
+            List[Segment]: At most parts segments of at least min_part_size bytes, except the
+                last.
+        """
+        parts = max(min(self.parts, -(-size // max(self.min_part_size, 1))), 1)
+        step = max(-(-size // parts), 1)
+
+        return [Segment(start, min(start + step, size) - 1) for start in range(0, size, step)]
+
+    def run(self, path: Union[str, os.PathLike]) -> DownloadReport:
+        """Download the file to path.
+
+        Args:
+            path (Union[str, os.PathLike]): The file to write, replaced if it exists.
+
+        Returns:
+            DownloadReport: Size, parts, reassignments and throughput of the download.
+
+        Raises:
+            StreamError: If the file can't be downloaded, or changes while it is.
+        """
+        start = time.monotonic()
+        probe = self._send({"Range": "bytes=0-0"})
+
+        if probe is None:
+            raise StreamError(f"Failed to probe {self.url}.")
+
+        content_range = parse_content_range(probe.headers.get("Content-Range"))
+
+        if probe.status_code == 206 and content_range is not None and content_range[2]:
+            probe.close()
+            self._etag = strong_etag(probe)
+            self._last_modified = probe.headers.get("Last-Modified")
+            size = self._size = content_range[2]
+            segments = self.split(size)
+            self._download(path, size, segments)
+            parts = len(segments)
+
+        else:
+            size, parts = self._stream(probe, path), 1
+
+        report = DownloadReport(
+            url=self.url,
+            path=str(path),
+            size=size,
+            parts=parts,
+            reassigned=self._reassigned,
+            seconds=time.monotonic() - start,
+        )
+        logger.info(
+            f"Downloaded {report.size} bytes of {self.url} in {report.seconds:.2f} seconds over "
+            f"{report.parts} parts, {report.throughput / 1024:.1f} KiB/s."
+        )
+
+        return report
+
+    def _stream(self, probe: requests.models.Response, path: Union[str, os.PathLike]) -> int:
+        """Download a file without range support as one resumable stream."""
+        logger.debug(f"{self.url} does not support ranges, downloading it in one part.")
+
+        if probe.status_code != 200:
+            probe.close()
+            probe = self._send({})
+
+            if probe is None:
+                raise StreamError(f"Failed to download {self.url}.")
+
+        with ResumableStream(probe, self._send, self.chunk_size, self.max_reassigns) as stream:
+            return stream.write_to(path)
+
+    def _download(self, path: Union[str, os.PathLike], size: int, segments: List[Segment]) -> None:
+        """Preallocate the file and fetch the segments into it until every byte is written."""
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+
+        try:
+            os.ftruncate(fd, size)
+
+            # Room for a replacement of every segment while a stalled one waits on its timeout.
+            with ThreadPoolExecutor(max_workers=len(segments) * 2) as executor:
+                running = {
+                    executor.submit(self._fetch, fd, segment): segment for segment in segments
+                }
+
+                try:
+                    self._supervise(executor, fd, running)
+                finally:
+                    for segment in running.values():
+                        segment.abandoned = True
+
+        finally:
+            os.close(fd)
+
+    def _supervise(
+        self, executor: ThreadPoolExecutor, fd: int, running: Dict[Future, Segment]
+    ) -> None:
+        """Wait for the segments, reassigning the ones which fail or stall."""
+        while running:
+            done, _ = wait(
+                running, timeout=min(self.stall_timeout / 4, 1), return_when=FIRST_COMPLETED
+            )
+
+            for future in done:
+                segment = running.pop(future)
+                future.result()  # StreamErrors mean the file can't be downloaded consistently.
+
+                if segment.remaining and not segment.abandoned:
+                    self._reassign(executor, fd, running, segment, "failed")
+
+            now = time.monotonic()
+
+            for segment in list(running.values()):
+                if segment.abandoned or segment.last_progress is None:
+                    continue
+
+                if now - segment.last_progress > self.stall_timeout:
+                    self._reassign(executor, fd, running, segment, "stalled")
+
+    def _reassign(
+        self,
+        executor: ThreadPoolExecutor,
+        fd: int,
+        running: Dict[Future, Segment],
+        segment: Segment,
+        reason: str,
+    ) -> None:
+        """Abandon a segment and fetch the rest of its range through a new request."""
+        with segment.lock:
+            segment.abandoned = True
+            replacement = Segment(segment.position, segment.end, segment.attempt + 1)
+
+        if replacement.attempt > self.max_reassigns + 1:
+            raise StreamError(f"{self.url} range {replacement.range_header} {reason} too often.")
+
+        self._reassigned += 1
+        logger.debug(f"Reassigning {self.url} range {replacement.range_header}, {reason}.")
+
+        running[executor.submit(self._fetch, fd, replacement)] = replacement
+
+    def _changed(self, response: requests.models.Response, size: Optional[int]) -> bool:
+        """Check if a ranges response comes from another version of the file than the probe."""
+        if size != self._size or strong_etag(response) != self._etag:
+            return True
+
+        return self._etag is None and response.headers.get("Last-Modified") != self._last_modified
+
+    def _fetch(self, fd: int, segment: Segment) -> None:
+        """Fetch a segments range and write it in place, until done, broken or abandoned.
+
+        Raises:
+            StreamError: If the response is not the requested range of the same file.
+        """
+        headers = {"Range": segment.range_header}
+        validator = self._etag or self._last_modified
+
+        if validator is not None:
+            # The server sends the whole new file instead of the range if it changed.
+            headers["If-Range"] = validator
+
+        response = self._send(headers)
+
+        if response is None:
+            return
+
+        segment.last_progress = time.monotonic()
+
+        try:
+            content_range = parse_content_range(response.headers.get("Content-Range"))
+
+            if response.status_code != 206 or content_range is None:
+                raise StreamError(f"{self.url} answered a range with {response.status_code}.")
+
+            if content_range[0] != segment.position or self._changed(response, content_range[2]):
+                raise StreamError(f"{self.url} changed while it was downloaded.")
+
+            for chunk in response.iter_content(self.chunk_size):
+                with segment.lock:
+                    if segment.abandoned:
+                        return
+
+                    data = chunk[: segment.remaining]
+                    write_at(fd, data, segment.position)
+                    segment.position += len(data)
+                    segment.last_progress = time.monotonic()
+
+                if not segment.remaining:
+                    return
+
+        except RESUMABLE_ERRORS as error:
+            logger.debug(f"{self.url} range {segment.range_header} broke: {error}")
+
+        finally:
+            response.close()
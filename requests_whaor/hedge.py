@@ -0,0 +1,120 @@
+"""This module provides the hedging policy used to cut the tail latency of requests."""
+
+import threading
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+from .metrics import CounterMap, HistogramMap
+
+
+class HedgePolicy:
+    """Decides when a duplicate of a slow request is sent through another circuit.
+
+    Tail latency through TOR is dominated by the occasional slow circuit. Latencies are tracked
+    per host, and once a request has gone unanswered for the hosts latency quantile, a hedge is
+    sent through another circuit. Whichever answers first is used. Hedges draw from a budget
+    which every request adds budget_ratio tokens to, so at most about budget_ratio extra
+    requests are sent per request, however slow the circuits get.
+
+    Attributes:
+        quantile (float): Latency quantile of the host after which a hedge is sent.
+        min_delay (float): Min number of seconds to wait before hedging.
+        max_delay (Optional[float]): Max number of seconds to wait before hedging.
+        min_samples (int): Number of latencies a host needs before its requests are hedged.
+        budget_ratio (float): Hedges earned by each request.
+        budget_burst (float): Max number of hedges the budget can hold.
+        latencies (HistogramMap): Seconds until a response arrived, by host.
+        counts (CounterMap): Number of hedges fired, won, skipped for lack of budget, and
+            busy, skipped for lack of a free scheduler slot.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        quantile: float = 0.95,
+        min_delay: float = 0.05,
+        max_delay: Optional[float] = None,
+        min_samples: int = 20,
+        budget_ratio: float = 0.1,
+        budget_burst: float = 10,
+    ) -> "HedgePolicy":
+        """Initialize the HedgePolicy.
+
+        Args:
+            quantile (float): Latency quantile of the host after which a hedge is sent.
+            min_delay (float): Min number of seconds to wait before hedging.
+            max_delay (Optional[float]): Max number of seconds to wait before hedging. None
+                for no max.
+            min_samples (int): Number of latencies a host needs before its requests are hedged.
+            budget_ratio (float): Hedges earned by each request, e.g. 0.1 allows one hedge
+                per ten requests.
+            budget_burst (float): Max number of hedges the budget can hold.
+        """
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.budget_ratio = budget_ratio
+        self.budget_burst = budget_burst
+
+        self.latencies = HistogramMap()
+        self.counts = CounterMap()
+
+        self._budget = budget_burst
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        """Return the hostname latencies of url are tracked under."""
+        return (urlsplit(url).hostname or "").lower()
+
+    def observe(self, url: str, seconds: float) -> None:
+        """Record the seconds a response from the urls host took to arrive."""
+        self.latencies.observe(self.host_of(url), seconds)
+
+    def delay(self, url: str) -> Optional[float]:
+        """Return the seconds to wait for a response before hedging a request to url.
+
+        Every request passes through here once, earning the budget its share of a hedge.
+
+        Args:
+            url (str): The request url.
+
+        Returns:
+            Optional[float]: Seconds to wait, None if the host has too few latencies yet.
+        """
+        with self._lock:
+            self._budget = min(self._budget + self.budget_ratio, self.budget_burst)
+
+        histogram = self.latencies.get(self.host_of(url))
+
+        if histogram is None or histogram.count < self.min_samples:
+            return None
+
+        delay = max(histogram.quantile(self.quantile), self.min_delay)
+
+        return delay if self.max_delay is None else min(delay, self.max_delay)
+
+    def try_hedge(self) -> bool:
+        """Take a hedge from the budget if one is available.
+
+        Returns:
+            bool: True if a hedge should be fired.
+        """
+        with self._lock:
+            if self._budget < 1:
+                self.counts.inc("skipped")
+                return False
+
+            self._budget -= 1
+
+        self.counts.inc("fired")
+
+        return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the hedge counts, the budget left and the latencies per host."""
+        return {
+            "counts": self.counts.snapshot(),
+            "budget": self._budget,
+            "latencies": self.latencies.snapshot(),
+        }
@@ -0,0 +1,468 @@
+"""This module provides lightweight, thread safe request metrics."""
+
+import bisect
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import itertools
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from loguru import logger
+from pydantic import BaseModel as Base
+
+
+class Ewma:
+    """Thread safe exponentially weighted moving average."""
+
+    def __init__(self, alpha: float = 0.1) -> "Ewma":
+        """Ewma __init__ method.
+
+        Args:
+            alpha (float): Weight of each new sample, between 0 and 1. Higher values react
+                faster to change.
+        """
+        self.alpha = alpha
+
+        self._value: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def value(self) -> Optional[float]:
+        """Return the current average, None if no samples have been added."""
+        return self._value
+
+    def update(self, sample: float) -> float:
+        """Add a sample to the average.
+
+        Args:
+            sample (float): The new sample.
+
+        Returns:
+            float: The updated average.
+        """
+        with self._lock:
+            if self._value is None:
+                self._value = sample
+            else:
+                self._value += self.alpha * (sample - self._value)
+
+            return self._value
+
+
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+"""* Histogram bucket upper bounds in seconds, spread for latencies through TOR."""
+
+
+class Histogram:
+    """Thread safe histogram with fixed buckets."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> "Histogram":
+        """Histogram __init__ method.
+
+        Args:
+            buckets (Sequence[float]): Sorted bucket upper bounds. An infinite bucket is
+                always added last.
+        """
+        self.buckets = tuple(buckets) + (math.inf,)
+
+        self._counts = [0] * len(self.buckets)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        """Add a sample to the histogram.
+
+        Args:
+            value (float): The sample.
+        """
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sum += value
+
+    @property
+    def count(self) -> int:
+        """Return the number of samples."""
+        return sum(self._counts)
+
+    @property
+    def sum(self) -> float:
+        """Return the sum of all samples."""
+        return self._sum
+
+    def cumulative_counts(self) -> List[int]:
+        """Return the number of samples less than or equal to each bucket upper bound."""
+        with self._lock:
+            return list(itertools.accumulate(self._counts))
+
+    def quantile(self, quantile: float) -> Optional[float]:
+        """Estimate a quantile by interpolating linearly within its bucket.
+
+        Args:
+            quantile (float): The quantile, between 0 and 1.
+
+        Returns:
+            Optional[float]: The estimate, None if there are no samples. Samples in the
+                infinite bucket are estimated as the largest finite bucket bound.
+        """
+        cumulative = self.cumulative_counts()
+
+        if not cumulative[-1]:
+            return None
+
+        rank = quantile * cumulative[-1]
+        # The first bucket holding the rank, skipping leading empty buckets for rank 0.
+        index = max(bisect.bisect_left(cumulative, rank), bisect.bisect_right(cumulative, 0))
+
+        if index == len(self.buckets) - 1:
+            return self.buckets[-2]
+
+        lower = self.buckets[index - 1] if index else 0.0
+        below = cumulative[index - 1] if index else 0
+        in_bucket = cumulative[index] - below
+
+        return lower + (self.buckets[index] - lower) * (rank - below) / in_bucket
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the histograms count, sum and common quantiles."""
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+        }
+
+
+class CounterMap:
+    """Thread safe counters keyed by label."""
+
+    def __init__(self) -> "CounterMap":
+        """Initialize the CounterMap."""
+        self._counts: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label: str, amount: float = 1) -> None:
+        """Increase the counter of a label.
+
+        Args:
+            label (str): The counters label.
+            amount (float): Amount to increase the counter by.
+        """
+        with self._lock:
+            self._counts[label] = self._counts.get(label, 0) + amount
+
+    def snapshot(self) -> Dict[str, float]:
+        """Return a copy of every counter."""
+        with self._lock:
+            return dict(self._counts)
+
+
+class HistogramMap:
+    """Thread safe histograms keyed by label, e.g. latencies per host."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> "HistogramMap":
+        """Initialize the HistogramMap.
+
+        Args:
+            buckets (Sequence[float]): Bucket upper bounds of every histogram.
+        """
+        self.buckets = tuple(buckets)
+
+        self._histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label: str, value: float) -> None:
+        """Add a sample to the histogram of a label, creating it on first use.
+
+        Args:
+            label (str): The histograms label.
+            value (float): The sample.
+        """
+        with self._lock:
+            histogram = self._histograms.get(label)
+
+            if histogram is None:
+                histogram = self._histograms[label] = Histogram(self.buckets)
+
+        histogram.observe(value)
+
+    def get(self, label: str) -> Optional[Histogram]:
+        """Return the histogram of a label, None if it has no samples yet."""
+        return self._histograms.get(label)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Return a snapshot of every histogram by label."""
+        with self._lock:
+            histograms = dict(self._histograms)
+
+        return {label: histogram.snapshot() for label, histogram in histograms.items()}
+
+
+class PhaseTimings:
+    """Wall clock seconds spent in each phase of a multi step operation, e.g. startup."""
+
+    def __init__(self) -> "PhaseTimings":
+        """Initialize the PhaseTimings."""
+        self.phases: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Context manager which times a phase, adding to its time if it ran before.
+
+        Args:
+            name (str): Name of the phase.
+
+        Yields:
+            None: While the phase runs.
+        """
+        start = time.monotonic()
+
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.monotonic() - start
+
+    @property
+    def total(self) -> float:
+        """Return the seconds spent in every phase."""
+        return sum(self.phases.values())
+
+    def summary(self) -> str:
+        """Return the phases and their timings as a single line."""
+        phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items())
+        return f"{phases} (total {self.total:.2f}s)"
+
+
+class RequestEvent(Base):
+    """A single request attempt, as passed to metric sinks.
+
+    Attributes:
+        url (str): Requested url.
+        status_code (Optional[int]): Response status, None if the attempt raised.
+        error (Optional[str]): Name of the exception the attempt raised.
+        connect (Optional[float]): Seconds to connect through the proxy, None if a kept alive
+            connection was reused.
+        ttfb (Optional[float]): Seconds until the response headers were received.
+        total (float): Seconds the attempt took, including reading the body.
+        received_bytes (int): Size of the response body.
+    """
+
+    url: str
+    status_code: Optional[int]
+    error: Optional[str]
+    connect: Optional[float]
+    ttfb: Optional[float]
+    total: float
+    received_bytes: int = 0
+
+
+class RequestorMetrics:
+    """Instrumentation of the requests made by a requestor.
+
+    Provides latency histograms for each phase of a request, counters for statuses, retries
+    and failures, received bytes, an in flight gauge, the effective timeouts per host, and
+    hooks for custom sinks.
+    """
+
+    PHASES = ("connect", "ttfb", "total")
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> "RequestorMetrics":
+        """Initialize the RequestorMetrics.
+
+        Args:
+            buckets (Sequence[float]): Latency histogram bucket upper bounds in seconds.
+        """
+        self.latencies = {phase: Histogram(buckets) for phase in self.PHASES}
+        self.statuses = CounterMap()
+        self.retries = CounterMap()
+        self.failures = CounterMap()
+        self.received_bytes = 0
+        self.in_flight = 0
+        self.timeouts: Dict[str, Dict[str, float]] = {}
+
+        self.latency = Ewma()
+        self.error_rate = Ewma()
+
+        self.sinks: List[Callable[[RequestEvent], None]] = []
+        self._lock = threading.Lock()
+
+    def add_sink(self, sink: Callable[[RequestEvent], None]) -> None:
+        """Register a callable which receives every request attempt.
+
+        Args:
+            sink (Callable[[RequestEvent], None]): Called with each RequestEvent. It runs on
+                the requesting thread, so it should be quick.
+        """
+        self.sinks.append(sink)
+
+    @contextmanager
+    def track(self) -> Iterator[None]:
+        """Context manager which counts a request as in flight while it runs."""
+        with self._lock:
+            self.in_flight += 1
+
+        try:
+            yield
+
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def record(self, event: RequestEvent) -> None:
+        """Record a request attempt.
+
+        Args:
+            event (RequestEvent): The request attempt.
+        """
+        for phase in self.PHASES:
+            value = getattr(event, phase)
+
+            if value is not None:
+                self.latencies[phase].observe(value)
+
+        if event.error is None:
+            self.statuses.inc(str(event.status_code))
+
+            with self._lock:
+                self.received_bytes += event.received_bytes
+
+            self.latency.update(event.total)
+            self.error_rate.update(0)
+
+        else:
+            self.failures.inc(event.error)
+            self.error_rate.update(1)
+
+        for sink in self.sinks:
+            try:
+                sink(event)
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error(f"Metrics sink failed: {error}")
+
+    def record_retry(self, reason: str) -> None:
+        """Record a retry.
+
+        Args:
+            reason (str): Status code or exception name which caused the retry.
+        """
+        self.retries.inc(reason)
+
+    def record_timeouts(self, host: str, connect: float, read: float) -> None:
+        """Record the timeouts the last attempt to a host was sent with.
+
+        Args:
+            host (str): Hostname of the attempt.
+            connect (float): Connect timeout in seconds.
+            read (float): Read timeout in seconds.
+        """
+        with self._lock:
+            self.timeouts[host] = {"connect": connect, "read": read}
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a cheap point in time copy of every metric."""
+        with self._lock:
+            timeouts = {host: dict(timeouts) for host, timeouts in self.timeouts.items()}
+
+        return {
+            "latency": {phase: self.latencies[phase].snapshot() for phase in self.PHASES},
+            "statuses": self.statuses.snapshot(),
+            "retries": self.retries.snapshot(),
+            "failures": self.failures.snapshot(),
+            "received_bytes": self.received_bytes,
+            "in_flight": self.in_flight,
+            "timeouts": timeouts,
+        }
+
+    def to_prometheus(self, prefix: str = "whaor") -> str:
+        """Render every metric in the Prometheus text exposition format.
+
+        Args:
+            prefix (str): Metric name prefix.
+
+        Returns:
+            str: The metrics text.
+        """
+        lines = [
+            f"# HELP {prefix}_request_duration_seconds Request latency by phase.",
+            f"# TYPE {prefix}_request_duration_seconds histogram",
+        ]
+
+        name = f"{prefix}_request_duration_seconds"
+
+        for phase, histogram in self.latencies.items():
+            for bound, count in zip(histogram.buckets, histogram.cumulative_counts()):
+                le = "+Inf" if math.isinf(bound) else repr(bound)
+                lines.append(f'{name}_bucket{{phase="{phase}",le="{le}"}} {count}')
+
+            lines.append(f'{name}_sum{{phase="{phase}"}} {histogram.sum}')
+            lines.append(f'{name}_count{{phase="{phase}"}} {histogram.count}')
+
+        counters = (
+            ("responses_total", "Responses by status code.", "status", self.statuses),
+            ("retries_total", "Retries by reason.", "reason", self.retries),
+            ("failures_total", "Failed attempts by exception.", "error", self.failures),
+        )
+
+        for name, description, label, counter in counters:
+            lines.append(f"# HELP {prefix}_{name} {description}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+
+            for value, count in sorted(counter.snapshot().items()):
+                lines.append(f'{prefix}_{name}{{{label}="{value}"}} {count}')
+
+        lines += [
+            f"# HELP {prefix}_received_bytes_total Response body bytes received.",
+            f"# TYPE {prefix}_received_bytes_total counter",
+            f"{prefix}_received_bytes_total {self.received_bytes}",
+            f"# HELP {prefix}_requests_in_flight Requests currently in flight.",
+            f"# TYPE {prefix}_requests_in_flight gauge",
+            f"{prefix}_requests_in_flight {self.in_flight}",
+        ]
+
+        timeouts = self.snapshot()["timeouts"]
+
+        if timeouts:
+            lines.append(f"# HELP {prefix}_timeout_seconds Effective timeouts by host and phase.")
+            lines.append(f"# TYPE {prefix}_timeout_seconds gauge")
+
+            for host, phases in sorted(timeouts.items()):
+                for phase, seconds in sorted(phases.items()):
+                    lines.append(
+                        f'{prefix}_timeout_seconds{{host="{host}",phase="{phase}"}} {seconds}'
+                    )
+
+        return "\n".join(lines) + "\n"
+
+    def serve_prometheus(self, port: int, host: str = "localhost") -> ThreadingHTTPServer:
+        """Serve the Prometheus text format from a background thread.
+
+        Args:
+            port (int): Port to listen on.
+            host (str): Interface to listen on.
+
+        Returns:
+            ThreadingHTTPServer: The running server, call its shutdown method to stop it.
+        """
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            """Responds to every GET request with the metrics text."""
+
+            def do_GET(self) -> None:  # noqa: N802
+                """Send the metrics text."""
+                body = metrics.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:  # noqa: ANN002
+                """Silence request logging."""
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="whaor-metrics", daemon=True).start()
+
+        return server
@@ -1,87 +1,96 @@
-"""This module provides objects for managing docker network instances."""
+"""This module provides objects for managing container network instances."""
 
 from contextlib import contextmanager
-from typing import ContextManager, List, Optional
+from typing import ContextManager, List, Optional, Tuple
 
-from docker.models.containers import Container as DockerContainer
-from docker.models.networks import Network as DockerNetwork
 from loguru import logger
+from pydantic import Field
 
 from .client import Client
+from .runtime import ContainerRuntime, default_runtime, RuntimeContainer, RuntimeNetwork
 
 
 class Network(Client):
-    """Represents a docker network.
+    """Represents a container network.
 
     Attributes:
         name (str): Network name.
         driver (str): Network driver.
-        docker_network (Optional[DockerNetwork]): Holds an instance of a started docker network.
+        runtime (ContainerRuntime): Runtime the network is created on. Defaults to Docker.
+        handle (Optional[RuntimeNetwork]): Holds the runtimes handle of the started network.
     """
 
     name: str
     driver: str
 
-    docker_network: Optional[DockerNetwork]
+    runtime: ContainerRuntime = Field(default_factory=default_runtime)
+    handle: Optional[RuntimeNetwork]
 
-    def connect_container(self, container_id: str, container_name: str) -> None:
+    def connect_container(self, container: RuntimeContainer) -> None:
         """Connect container to network and give it a reachable network alias.
 
         Args:
-            container_id (str): The containers id.
-            container_name (str): The containers name.
+            container (RuntimeContainer): The runtimes handle of the container.
         """
-        logger.debug(f"connecting {container_name} to the {self.network_name} network")
-        self.docker_network.connect(container_id, aliases=[container_name])
+        logger.debug(f"connecting {container.name} to the {self.network_name} network")
+        self.runtime.connect(self.handle, container)
+
+    def container_address(self, container: RuntimeContainer, port: int) -> Tuple[str, int]:
+        """Return the address other containers on the network reach a container port on.
+
+        Args:
+            container (RuntimeContainer): The runtimes handle of a container connected to the
+                network.
+            port (int): The container port.
+
+        Returns:
+            Tuple[str, int]: The host and port.
+        """
+        return self.runtime.network_address(self.handle, container, port)
 
     @property
-    def containers(self) -> List[DockerContainer]:
-        """Return list of Container objects connected to network."""
-        self.docker_network.reload()
-        return self.docker_network.containers
+    def containers(self) -> List[RuntimeContainer]:
+        """Return list of container handles connected to network."""
+        return self.runtime.network_containers(self.handle)
 
     @property
     def network_name(self) -> str:
         """Network name."""
-        return self.docker_network.name
+        return self.handle.name
 
     @property
     def network_id(self) -> str:
         """Network short id."""
-        return self.docker_network.short_id
+        return self.handle.short_id
 
     def start(self) -> None:
-        """Start Docker network."""
-        client = self.get_client()
-        self.docker_network = client.networks.create(name=self.name, driver=self.driver)
+        """Start network."""
+        self.handle = self.runtime.create_network(self.name, self.driver)
         logger.debug(f"Network: {self.network_name} {self.network_id} Created.")
 
     def stop(self) -> None:
-        """Stop Docker network."""
-        self.docker_network.reload()
-
-        if self.docker_network.containers:
-
-            for container in self.docker_network.containers:
-                self.docker_network.disconnect(container.name)
-
-        self.docker_network.remove()
+        """Stop network."""
+        self.runtime.remove_network(self.handle)
         logger.debug(f"Network: {self.network_name} {self.network_id} Destroyed.")
 
 
 @contextmanager
 # pylint: disable=invalid-name
-def WhaorNet(name: str = "whaornet", driver: str = "bridge") -> ContextManager[Network]:
+def WhaorNet(
+    name: str = "whaornet", driver: str = "bridge", runtime: Optional[ContainerRuntime] = None
+) -> ContextManager[Network]:
     """Context manager which yields a network to connect containers to.
 
     Args:
         name (str): Name of network.
         driver (str): Type of network drivier.
+        runtime (Optional[ContainerRuntime]): Runtime to create the network on. Defaults to
+            Docker.
 
     Yields:
-        Network: A Docker network.
+        Network: A container network.
     """
-    whaornet = Network(name=name, driver=driver)
+    whaornet = Network(name=name, driver=driver, runtime=runtime or default_runtime())
 
     try:
         whaornet.start()
@@ -1,5 +1,6 @@
 """Module for commonly used paths."""
 
+import os
 from pathlib import Path
 from tempfile import gettempdir
 
@@ -18,3 +19,9 @@ TEMPLATE_DIRECTORY = SOURCE_ROOT_PATH / "templates"
 
 TEMPORARY_FILES_DIRECTORY = Path(gettempdir())
 """* A path to the temporary files directory."""
+
+USER_CACHE_DIRECTORY = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+"""* A path to the users cache directory."""
+
+CACHE_DIRECTORY = USER_CACHE_DIRECTORY / "requests_whaor"
+"""* A path to the persistent cache directory."""
@@ -0,0 +1,77 @@
+"""This module provides rate limiting primitives."""
+
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread safe token bucket.
+
+    Tokens refill continuously at a fixed rate up to the buckets capacity, so short bursts
+    are allowed while the long term rate is capped.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> "TokenBucket":
+        """Initialize the TokenBucket.
+
+        Args:
+            rate (float): Tokens added per second.
+            capacity (float): Max number of tokens the bucket holds.
+        """
+        self.rate = rate
+        self.capacity = capacity
+
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        """Add the tokens accumulated since the last refill."""
+        now = time.monotonic()
+        self._tokens = min(self._tokens + (now - self._updated) * self.rate, self.capacity)
+        self._updated = now
+
+    @property
+    def tokens(self) -> float:
+        """Return the number of tokens currently available."""
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Take tokens from the bucket if enough are available.
+
+        Args:
+            tokens (float): Number of tokens to take.
+
+        Returns:
+            bool: True if the tokens were taken.
+        """
+        with self._lock:
+            self._refill()
+
+            if self._tokens < tokens:
+                return False
+
+            self._tokens -= tokens
+            return True
+
+    def time_until(self, tokens: float = 1) -> float:
+        """Return the number of seconds until tokens are available, 0 if they already are.
+
+        Args:
+            tokens (float): Number of tokens wanted.
+
+        Returns:
+            float: Seconds to wait, infinite if the bucket can never hold that many tokens.
+        """
+        with self._lock:
+            self._refill()
+
+            if self._tokens >= tokens:
+                return 0.0
+
+            if tokens > self.capacity or self.rate <= 0:
+                return float("inf")
+
+            return (tokens - self._tokens) / self.rate
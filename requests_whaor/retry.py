@@ -0,0 +1,89 @@
+"""This module provides the retry policy used by the requestors."""
+
+import random
+from typing import Iterable, Optional
+
+from loguru import logger
+
+from .ratelimit import TokenBucket
+
+RETRYABLE_STATUSES = frozenset({403, 408, 425, 429, 500, 502, 503, 504})
+"""* Statuses worth retrying through a new TOR circuit. 403 and 429 are often exit bans."""
+
+
+class RetryPolicy:
+    """Decides whether, and when, a failed request is retried.
+
+    Connection errors and retryable statuses are retried with exponential backoff and full
+    jitter. Every other status is terminal. All retries made by the requestors sharing a
+    policy draw from one token bucket budget, so an outage of the target can't turn into a
+    retry storm across every circuit.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        max_attempts: int = 5,
+        retry_statuses: Iterable[int] = RETRYABLE_STATUSES,
+        backoff_base: float = 0.25,
+        backoff_max: float = 10,
+        budget_rate: Optional[float] = 10,
+        budget_burst: float = 50,
+    ) -> "RetryPolicy":
+        """Initialize the RetryPolicy.
+
+        Args:
+            max_attempts (int): Max number of attempts per request, including the first.
+            retry_statuses (Iterable[int]): Status codes which are retried.
+            backoff_base (float): Seconds to back off before the first retry, doubled on each
+                following retry.
+            backoff_max (float): Max number of seconds to back off.
+            budget_rate (Optional[float]): Retries per second the budget refills with.
+                None disables the budget.
+            budget_burst (float): Max number of retries the budget can hold.
+        """
+        self.max_attempts = max_attempts
+        self.retry_statuses = frozenset(retry_statuses)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.budget = None if budget_rate is None else TokenBucket(budget_rate, budget_burst)
+
+    def is_retryable(self, status_code: int) -> bool:
+        """Check if a response status is worth retrying.
+
+        Args:
+            status_code (int): Response status code.
+
+        Returns:
+            bool: True if the status is retryable.
+        """
+        return status_code in self.retry_statuses
+
+    def backoff(self, attempt: int) -> float:
+        """Return the number of seconds to wait before the next attempt.
+
+        Args:
+            attempt (int): Number of the attempt which just failed, starting from 1.
+
+        Returns:
+            float: Seconds to wait.
+        """
+        return random.uniform(0, min(self.backoff_base * 2 ** (attempt - 1), self.backoff_max))
+
+    def should_retry(self, attempt: int) -> bool:
+        """Check if another attempt can be made, taking a token from the budget if so.
+
+        Args:
+            attempt (int): Number of the attempt which just failed, starting from 1.
+
+        Returns:
+            bool: True if the request should be retried.
+        """
+        if attempt >= self.max_attempts:
+            return False
+
+        if self.budget is not None and not self.budget.try_acquire():
+            logger.warning("Retry budget exhausted, giving up.")
+            return False
+
+        return True
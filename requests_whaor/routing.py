@@ -0,0 +1,226 @@
+"""This module provides client side load balancing directly across TOR circuits."""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import random
+import threading
+import time
+from typing import AbstractSet, Dict, Hashable, Iterator, List, Optional, Set
+
+from .circuit import OnionCircuit
+from .metrics import Ewma
+
+ROUTING_STRATEGIES = ("ewma", "least_outstanding")
+
+
+class CircuitLoad:
+    """Load an onion is under, as seen by the requestor."""
+
+    def __init__(self) -> "CircuitLoad":
+        """Initialize the CircuitLoad."""
+        self.outstanding = 0
+        self.latency = Ewma(alpha=0.3)
+
+    def score(self) -> float:
+        """Return the expected cost of sending one more request through the onion.
+
+        Onions without latency samples score zero, so new onions are tried first.
+        """
+        return (self.latency.value or 0) * (self.outstanding + 1)
+
+
+class CircuitRouter:
+    """Picks the onion each request is sent through, bypassing the balancer.
+
+    The ewma strategy uses the power of two choices: it samples two onions at random and picks
+    the one with the lower EWMA latency weighted by its outstanding requests. The
+    least_outstanding strategy picks the onion with the fewest requests in flight. Requests with
+    a sticky key keep using the same onion until it fails, is disabled or leaves the pool, or
+    until the key is evicted as the least recently used one. Onions can be excluded per request,
+    e.g. the onions a target host has banned.
+    """
+
+    def __init__(
+        self,
+        onions: List[OnionCircuit],
+        strategy: str = "ewma",
+        failure_penalty: float = 5,
+        max_sticky_keys: int = 10000,
+    ) -> "CircuitRouter":
+        """Initialize the CircuitRouter.
+
+        Args:
+            onions (List[OnionCircuit]): List of TOR containers, read on every pick so onions
+                added or removed at runtime are picked up.
+            strategy (str): Either ewma or least_outstanding.
+            failure_penalty (float): Latency in seconds recorded for a failed request.
+            max_sticky_keys (int): Max number of sticky keys to remember the onion of. The least
+                recently used keys are forgotten first.
+
+        Raises:
+            ValueError: If the strategy is unknown.
+        """
+        if strategy not in ROUTING_STRATEGIES:
+            raise ValueError(f"strategy must be one of {', '.join(ROUTING_STRATEGIES)}.")
+
+        self.onions = onions
+        self.strategy = strategy
+        self.failure_penalty = failure_penalty
+        self.max_sticky_keys = max_sticky_keys
+
+        self._loads: Dict[str, CircuitLoad] = {}
+        self._sticky: "OrderedDict[Hashable, str]" = OrderedDict()
+        self._disabled: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def load(self, onion: OnionCircuit) -> CircuitLoad:
+        """Return the load of an onion.
+
+        Args:
+            onion (OnionCircuit): A TOR container.
+
+        Returns:
+            CircuitLoad: The onions load.
+        """
+        with self._lock:
+            return self._loads.setdefault(onion.container_name, CircuitLoad())
+
+    def disable(self, onion: OnionCircuit) -> None:
+        """Stop routing new requests through an onion, e.g. while it restarts.
+
+        Sticky keys using the onion are unstuck, as it comes back with a new identity.
+
+        Args:
+            onion (OnionCircuit): A TOR container.
+        """
+        with self._lock:
+            self._disabled.add(onion.container_name)
+            self._unstick_onion(onion.container_name)
+
+    def enable(self, onion: OnionCircuit) -> None:
+        """Route new requests through a disabled onion again.
+
+        Args:
+            onion (OnionCircuit): A TOR container.
+        """
+        with self._lock:
+            self._disabled.discard(onion.container_name)
+
+    def forget(self, onion: OnionCircuit) -> None:
+        """Drop everything known about an onion which has left the pool.
+
+        Args:
+            onion (OnionCircuit): A TOR container.
+        """
+        with self._lock:
+            self._loads.pop(onion.container_name, None)
+            self._disabled.discard(onion.container_name)
+            self._unstick_onion(onion.container_name)
+
+    def _unstick_onion(self, name: str) -> None:
+        """Forget the sticky keys using an onion. Must be called with the lock held."""
+        for sticky_key in [key for key, stuck in self._sticky.items() if stuck == name]:
+            del self._sticky[sticky_key]
+
+    def _candidates(self, exclude: AbstractSet[str] = frozenset()) -> List[OnionCircuit]:
+        """Return the onions requests can be routed through.
+
+        Excluded onions are only left out while other onions remain, so a request is never
+        refused just because every onion is excluded.
+        """
+        candidates = [onion for onion in self.onions if onion.container_name not in self._disabled]
+
+        if not candidates:
+            raise LookupError("No onions available to route requests through.")
+
+        included = [onion for onion in candidates if onion.container_name not in exclude]
+
+        return included or candidates
+
+    def pick(
+        self, sticky_key: Optional[Hashable] = None, exclude: AbstractSet[str] = frozenset()
+    ) -> OnionCircuit:
+        """Pick the onion to send the next request through.
+
+        Args:
+            sticky_key (Optional[Hashable]): Requests with the same key use the same onion.
+            exclude (AbstractSet[str]): Container names of onions to avoid.
+
+        Returns:
+            OnionCircuit: The picked onion.
+        """
+        candidates = self._candidates(exclude)
+
+        if sticky_key is not None:
+            with self._lock:
+                name = self._sticky.get(sticky_key)
+
+                if name is not None:
+                    self._sticky.move_to_end(sticky_key)
+
+            for onion in candidates:
+                if onion.container_name == name:
+                    return onion
+
+        if self.strategy == "least_outstanding":
+            random.shuffle(candidates)
+            onion = min(candidates, key=lambda candidate: self.load(candidate).outstanding)
+
+        else:
+            sample = random.sample(candidates, min(len(candidates), 2))
+            onion = min(sample, key=lambda candidate: self.load(candidate).score())
+
+        if sticky_key is not None:
+            with self._lock:
+                self._sticky[sticky_key] = onion.container_name
+                self._sticky.move_to_end(sticky_key)
+
+                while len(self._sticky) > self.max_sticky_keys:
+                    self._sticky.popitem(last=False)
+
+        return onion
+
+    def unstick(self, sticky_key: Hashable) -> None:
+        """Forget the onion requests with a sticky key use, so the next one is picked again."""
+        with self._lock:
+            self._sticky.pop(sticky_key, None)
+
+    @contextmanager
+    def route(
+        self, sticky_key: Optional[Hashable] = None, exclude: AbstractSet[str] = frozenset()
+    ) -> Iterator[OnionCircuit]:
+        """Context manager which yields the onion to send a request through.
+
+        Tracks the request as outstanding on the onion while it is in flight and records its
+        latency, or the failure penalty if the request raises.
+
+        Args:
+            sticky_key (Optional[Hashable]): Requests with the same key use the same onion.
+            exclude (AbstractSet[str]): Container names of onions to avoid.
+
+        Yields:
+            OnionCircuit: The picked onion.
+        """
+        onion = self.pick(sticky_key, exclude)
+        load = self.load(onion)
+
+        with self._lock:
+            load.outstanding += 1
+
+        start = time.monotonic()
+
+        try:
+            yield onion
+            load.latency.update(time.monotonic() - start)
+
+        except Exception:
+            load.latency.update(self.failure_penalty)
+
+            if sticky_key is not None:
+                self.unstick(sticky_key)
+
+            raise
+
+        finally:
+            with self._lock:
+                load.outstanding -= 1
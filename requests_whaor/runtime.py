@@ -0,0 +1,873 @@
+"""This module provides the container runtimes the TOR and HAProxy instances run on."""
+
+from abc import ABC, abstractmethod
+import io
+from pathlib import Path
+import re
+import secrets
+import shutil
+import socket
+import subprocess  # nosec
+import tarfile
+import tempfile
+import threading
+from typing import ClassVar, Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING, Union
+
+import docker
+from docker.client import DockerClient
+from docker.errors import ImageNotFound, NotFound
+from docker.models.containers import Container
+from docker.models.networks import Network as DockerNetwork
+from loguru import logger
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .client import ContainerOptions
+
+
+def free_port(interface: str = "127.0.0.1") -> int:
+    """Return a port which is free on an interface.
+
+    Args:
+        interface (str): Interface the port should be free on.
+
+    Returns:
+        int: The port.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((interface, 0))
+        return sock.getsockname()[1]
+
+
+def tar_files(files: Dict[str, bytes]) -> bytes:
+    """Return an uncompressed tar archive of files, by file name."""
+    archive = io.BytesIO()
+
+    with tarfile.open(fileobj=archive, mode="w") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            info.mode = 0o644
+            tar.addfile(info, io.BytesIO(content))
+
+    return archive.getvalue()
+
+
+def untar_files(archive: bytes) -> Dict[str, bytes]:
+    """Return the regular files of a tar archive, by file name."""
+    files = {}
+
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        for member in tar.getmembers():
+            if member.isfile():
+                files[Path(member.name).name] = tar.extractfile(member).read()
+
+    return files
+
+
+def render_command(
+    options: "ContainerOptions", ports: Dict[int, int], data_dir: Optional[str], interface: str
+) -> Optional[List[str]]:
+    """Fill in the placeholders of a containers command.
+
+    Commands are written independently of the runtime they run on. `{ports[9050]}` is
+    replaced with the port the process listens on for container port 9050, `{data_dir}` with
+    its data directory and `{interface}` with the interface it listens on.
+
+    Args:
+        options (ContainerOptions): Options of the container.
+        ports (Dict[int, int]): Container ports mapped to the port the process listens on.
+        data_dir (Optional[str]): Data directory of the process.
+        interface (str): Interface the process listens on.
+
+    Returns:
+        Optional[List[str]]: The command, None to run the images default command.
+    """
+    if options.command is None:
+        return None
+
+    return [
+        argument.format(ports=ports, data_dir=data_dir, interface=interface)
+        for argument in options.command
+    ]
+
+
+class ContainerHandle:
+    """A container started by a runtime other than Docker.
+
+    Attributes:
+        id (str): Unique id of the container.
+        short_id (str): Short id of the container.
+        name (str): Name of the container.
+        options (ContainerOptions): Options the container was started with.
+        ports (Dict[int, int]): Container ports mapped to the local port they listen on.
+    """
+
+    def __init__(
+        self, name: str, options: "ContainerOptions", ports: Dict[int, int]
+    ) -> "ContainerHandle":
+        """Initialize the ContainerHandle.
+
+        Args:
+            name (str): Name of the container.
+            options (ContainerOptions): Options the container was started with.
+            ports (Dict[int, int]): Container ports mapped to the local port they listen on.
+        """
+        self.id = secrets.token_hex(16)  # pylint: disable=invalid-name
+        self.short_id = self.id[:10]
+        self.name = name
+        self.options = options
+        self.ports = ports
+
+
+class NetworkHandle:
+    """A network created by a runtime other than Docker.
+
+    Every container of a local runtime shares the loopback interface, so the network only
+    keeps track of which containers were connected to it.
+
+    Attributes:
+        id (str): Unique id of the network.
+        short_id (str): Short id of the network.
+        name (str): Name of the network.
+        containers (List[ContainerHandle]): Containers connected to the network.
+    """
+
+    def __init__(self, name: str) -> "NetworkHandle":
+        """Initialize the NetworkHandle.
+
+        Args:
+            name (str): Name of the network.
+        """
+        self.id = secrets.token_hex(16)  # pylint: disable=invalid-name
+        self.short_id = self.id[:10]
+        self.name = name
+        self.containers: List[ContainerHandle] = []
+
+
+RuntimeContainer = Union[Container, ContainerHandle]
+"""* Handle of a container started by any runtime."""
+
+RuntimeNetwork = Union[DockerNetwork, NetworkHandle]
+"""* Handle of a network created by any runtime."""
+
+
+class ContainerRuntime(ABC):
+    """Starts, stops and connects containers.
+
+    Attributes:
+        name (ClassVar[str]): Name of the runtime.
+        listen_interface (ClassVar[str]): Interface processes listen on, for commands and
+            configuration files to bind to.
+    """
+
+    name: ClassVar[str]
+    listen_interface: ClassVar[str]
+
+    def prepare(self, images: Sequence[str]) -> None:
+        """Make the images containers are started from available, before starting any.
+
+        Args:
+            images (Sequence[str]): Names of the images.
+        """
+        logger.debug(f"The {self.name} runtime has no images to prepare.")
+
+    @abstractmethod
+    def run(
+        self, options: "ContainerOptions", network: Optional[RuntimeNetwork] = None
+    ) -> RuntimeContainer:
+        """Start a container.
+
+        Args:
+            options (ContainerOptions): Options of the container.
+            network (Optional[RuntimeNetwork]): Network the container is created connected to.
+
+        Returns:
+            RuntimeContainer: A handle with the id, short_id and name of the container.
+        """
+
+    @abstractmethod
+    def stop(self, container: RuntimeContainer, timeout: int) -> None:
+        """Stop a container, killing it if it hasn't stopped after timeout seconds."""
+
+    @abstractmethod
+    def restart(self, container: RuntimeContainer, timeout: int) -> None:
+        """Restart a container, killing it if it hasn't stopped after timeout seconds."""
+
+    @abstractmethod
+    def status(self, container: RuntimeContainer) -> str:
+        """Return the status of a container, running once it has started."""
+
+    @abstractmethod
+    def logs(self, container: RuntimeContainer, since: Optional[int] = None) -> str:
+        """Return the output of a container.
+
+        Args:
+            container (RuntimeContainer): Handle of the container.
+            since (Optional[int]): Only return output since this unix time.
+
+        Returns:
+            str: The output.
+        """
+
+    @abstractmethod
+    def read_files(
+        self, container: RuntimeContainer, data_dir: Optional[str], names: Sequence[str]
+    ) -> Dict[str, bytes]:
+        """Read files from the data directory of a container.
+
+        Args:
+            container (RuntimeContainer): Handle of the container.
+            data_dir (Optional[str]): Data directory the container was started with.
+            names (Sequence[str]): Names of the files.
+
+        Returns:
+            Dict[str, bytes]: Content of the files which exist, by name.
+        """
+
+    @abstractmethod
+    def host_port(self, container: RuntimeContainer, port: int) -> int:
+        """Return the local port a published container port is reachable on."""
+
+    @abstractmethod
+    def follow_logs_command(self, container: RuntimeContainer) -> str:
+        """Return a shell command which follows the output of a container."""
+
+    def open_connection(
+        self, container: RuntimeContainer, port: int, timeout: float
+    ) -> socket.socket:
+        """Open a connection to a published container port, e.g. a control port.
+
+        Args:
+            container (RuntimeContainer): Handle of the container.
+            port (int): The published container port.
+            timeout (float): Socket timeout in seconds.
+
+        Returns:
+            socket.socket: The connected socket.
+        """
+        address = ("localhost", self.host_port(container, port))
+        return socket.create_connection(address, timeout=timeout)
+
+    @abstractmethod
+    def create_network(self, name: str, driver: str) -> RuntimeNetwork:
+        """Create a network containers can reach each other on.
+
+        Args:
+            name (str): Name of the network.
+            driver (str): Network driver.
+
+        Returns:
+            RuntimeNetwork: A handle with the name and short_id of the network.
+        """
+
+    @abstractmethod
+    def remove_network(self, network: RuntimeNetwork) -> None:
+        """Disconnect every container from a network and remove it."""
+
+    @abstractmethod
+    def connect(self, network: RuntimeNetwork, container: RuntimeContainer) -> None:
+        """Connect a container to a network, reachable by its name."""
+
+    @abstractmethod
+    def network_address(
+        self, network: RuntimeNetwork, container: RuntimeContainer, port: int
+    ) -> Tuple[str, int]:
+        """Return the host and port other containers on a network reach a container port on."""
+
+    @abstractmethod
+    def network_containers(self, network: RuntimeNetwork) -> List[RuntimeContainer]:
+        """Return the containers connected to a network."""
+
+
+class DockerRuntime(ContainerRuntime):
+    """Runs each instance in its own docker container, connected over a bridge network."""
+
+    name = "docker"
+    listen_interface = "0.0.0.0"  # nosec
+
+    def __init__(self) -> "DockerRuntime":
+        """Initialize the DockerRuntime."""
+        self._client: Optional[DockerClient] = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> DockerClient:
+        """Return the shared docker client, connecting on first use."""
+        with self._lock:
+            if self._client is None:
+                self._client = docker.from_env()
+                self._client.ping()
+                logger.debug("Docker connection successful.")
+
+            return self._client
+
+    def prepare(self, images: Sequence[str]) -> None:
+        """Pull the docker images which are not available locally yet."""
+        for image in dict.fromkeys(images):
+            try:
+                self.client.images.get(image)
+            except ImageNotFound:
+                logger.info(f"Pulling docker image {image}.")
+                self.client.images.pull(image)
+
+    def run(
+        self, options: "ContainerOptions", network: Optional[DockerNetwork] = None
+    ) -> Container:
+        """Start a docker container."""
+        arguments = options.dict(exclude={"data_dir"})
+        ports = {port: port for port in options.ports}
+        arguments["command"] = render_command(
+            options, ports, options.data_dir, self.listen_interface
+        )
+
+        files = arguments.pop("files")
+
+        if network is not None:
+            arguments["network"] = network.name
+
+        if not files:
+            return self.client.containers.run(**arguments)
+
+        # Files are copied into the created container, so they are there when it starts.
+        arguments.pop("detach")
+        container = self.client.containers.create(**arguments)
+        container.put_archive(options.data_dir, tar_files(files))
+        container.start()
+
+        return container
+
+    def stop(self, container: Container, timeout: int) -> None:
+        """Stop a docker container."""
+        container.stop(timeout=timeout)
+
+    def restart(self, container: Container, timeout: int) -> None:
+        """Restart a docker container."""
+        container.restart(timeout=timeout)
+
+    def status(self, container: Container) -> str:
+        """Return the status of a docker container."""
+        container.reload()
+        return container.status
+
+    def logs(self, container: Container, since: Optional[int] = None) -> str:
+        """Return the logs of a docker container."""
+        return container.logs(since=since).decode(errors="replace")
+
+    def read_files(
+        self, container: Container, data_dir: Optional[str], names: Sequence[str]
+    ) -> Dict[str, bytes]:
+        """Copy files out of the data directory of a docker container."""
+        files = {}
+
+        for name in names:
+            try:
+                stream, _ = container.get_archive(f"{data_dir}/{name}")
+            except NotFound:
+                continue
+
+            files.update(untar_files(b"".join(stream)))
+
+        return files
+
+    def host_port(self, container: Container, port: int) -> int:
+        """Return the host port a docker container port is published on."""
+        container.reload()
+        return int(container.ports[f"{port}/tcp"][0]["HostPort"])
+
+    def follow_logs_command(self, container: Container) -> str:
+        """Return the docker command which follows a containers logs."""
+        return f"docker container logs -f {container.name}"
+
+    def create_network(self, name: str, driver: str) -> DockerNetwork:
+        """Create a docker network."""
+        return self.client.networks.create(name=name, driver=driver)
+
+    def remove_network(self, network: DockerNetwork) -> None:
+        """Disconnect every container from a docker network and remove it."""
+        network.reload()
+
+        for container in network.containers:
+            network.disconnect(container.name)
+
+        network.remove()
+
+    def connect(self, network: DockerNetwork, container: Container) -> None:
+        """Connect a container to a docker network with its name as an alias."""
+        network.connect(container.id, aliases=[container.name])
+
+    def network_address(
+        self, network: DockerNetwork, container: Container, port: int
+    ) -> Tuple[str, int]:
+        """Return the ip address of a container on a docker network."""
+        container.reload()
+        return container.attrs["NetworkSettings"]["Networks"][network.name]["IPAddress"], port
+
+    def network_containers(self, network: DockerNetwork) -> List[Container]:
+        """Return the containers connected to a docker network."""
+        network.reload()
+        return network.containers
+
+
+class LoopbackRuntime(ContainerRuntime, ABC):
+    """Base of runtimes whose containers all listen on the local loopback interface.
+
+    Published ports are given a free local port, exposed ports listen on the same port
+    locally, and networks only keep track of their containers.
+    """
+
+    listen_interface = "127.0.0.1"
+
+    @staticmethod
+    def _allocate_ports(options: "ContainerOptions") -> Dict[int, int]:
+        """Return the local port each container port will listen on."""
+        ports = {}
+
+        for port, binding in options.ports.items():
+            host_port = binding[1] if isinstance(binding, tuple) else binding
+            ports[port] = free_port() if host_port is None else host_port
+
+        return ports
+
+    def host_port(self, container: ContainerHandle, port: int) -> int:
+        """Return the local port a container port listens on."""
+        return container.ports[port]
+
+    def create_network(self, name: str, driver: str) -> NetworkHandle:
+        """Create a network handle."""
+        return NetworkHandle(name)
+
+    def remove_network(self, network: NetworkHandle) -> None:
+        """Forget every container connected to a network."""
+        network.containers.clear()
+
+    def connect(self, network: NetworkHandle, container: ContainerHandle) -> None:
+        """Record a container as connected to a network."""
+        network.containers.append(container)
+
+    def network_address(
+        self, network: NetworkHandle, container: ContainerHandle, port: int
+    ) -> Tuple[str, int]:
+        """Return the loopback address a container port listens on."""
+        return self.listen_interface, container.ports[port]
+
+    def network_containers(self, network: NetworkHandle) -> List[ContainerHandle]:
+        """Return the containers connected to a network."""
+        return list(network.containers)
+
+
+class ProcessContainer(ContainerHandle):
+    """A process started by the LocalProcessRuntime.
+
+    Attributes:
+        workdir (Path): Directory holding the processes data directory and output.
+        process (Optional[subprocess.Popen]): The running process.
+    """
+
+    def __init__(
+        self, name: str, options: "ContainerOptions", ports: Dict[int, int], workdir: Path
+    ) -> "ProcessContainer":
+        """Initialize the ProcessContainer.
+
+        Args:
+            name (str): Name of the process.
+            options (ContainerOptions): Options the process was started with.
+            ports (Dict[int, int]): Container ports mapped to the local port they listen on.
+            workdir (Path): Directory holding the processes data directory and output.
+        """
+        super().__init__(name, options, ports)
+
+        self.workdir = workdir
+        self.process: Optional[subprocess.Popen] = None
+
+    @property
+    def data_dir(self) -> Path:
+        """Return the processes data directory."""
+        return self.workdir / "data"
+
+    @property
+    def log_path(self) -> Path:
+        """Return the file the processes output is written to."""
+        return self.workdir / "output.log"
+
+
+class LocalProcessRuntime(LoopbackRuntime):
+    """Runs the tor and haproxy binaries directly as local processes, skipping Docker.
+
+    Each process gets its own ports on the loopback interface and its own working directory,
+    which holds its data directory and output. Mounted files are used from their source path
+    in place, by substituting their target path in the command. This saves the memory and
+    startup time of a container and a bridge network hop per circuit.
+    """
+
+    name = "local"
+
+    def __init__(
+        self, binaries: Optional[Dict[str, str]] = None, base_directory: Optional[str] = None
+    ) -> "LocalProcessRuntime":
+        """Initialize the LocalProcessRuntime.
+
+        Args:
+            binaries (Optional[Dict[str, str]]): Paths of binaries by command name, e.g.
+                {"tor": "/usr/sbin/tor"}. Other binaries are looked up on the PATH.
+            base_directory (Optional[str]): Directory the working directories are created in.
+                Defaults to the systems temporary directory.
+        """
+        self.binaries = binaries or {}
+        self.base_directory = base_directory
+
+    def _resolve(self, binary: str) -> str:
+        """Return the path of a binary."""
+        path = self.binaries.get(binary) or shutil.which(binary)
+
+        if path is None:
+            raise FileNotFoundError(f"{binary} was not found, install it or set its path.")
+
+        return path
+
+    def _launch(self, container: ProcessContainer) -> None:
+        """Start the process of a container, truncating its previous output."""
+        options = container.options
+        command = render_command(
+            options, container.ports, str(container.data_dir), self.listen_interface
+        )
+
+        for mount in options.mounts:
+            command = [argument.replace(mount["Target"], mount["Source"]) for argument in command]
+
+        command[0] = self._resolve(command[0])
+
+        with open(container.log_path, mode="wb") as output:
+            container.process = subprocess.Popen(  # nosec
+                command,
+                stdin=subprocess.DEVNULL,
+                stdout=output,
+                stderr=subprocess.STDOUT,
+                cwd=container.workdir,
+                start_new_session=True,
+            )
+
+    @staticmethod
+    def _terminate(container: ProcessContainer, timeout: int) -> None:
+        """Terminate the process of a container, killing it after timeout seconds."""
+        process = container.process
+
+        if process is None or process.poll() is not None:
+            return
+
+        process.terminate()
+
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def run(
+        self, options: "ContainerOptions", network: Optional[NetworkHandle] = None
+    ) -> ProcessContainer:
+        """Start a local process.
+
+        Raises:
+            ValueError: If the options have no command to run.
+        """
+        if not options.command:
+            raise ValueError("The local process runtime needs an explicit command to run.")
+
+        name = f"{Path(options.command[0]).name}-{secrets.token_hex(4)}"
+        workdir = Path(tempfile.mkdtemp(prefix=f"whaor-{name}-", dir=self.base_directory))
+
+        container = ProcessContainer(name, options, self._allocate_ports(options), workdir)
+        container.data_dir.mkdir(mode=0o700)
+
+        for file_name, content in options.files.items():
+            (container.data_dir / file_name).write_bytes(content)
+
+        self._launch(container)
+
+        if network is not None:
+            self.connect(network, container)
+
+        return container
+
+    def stop(self, container: ProcessContainer, timeout: int) -> None:
+        """Stop a local process, removing its working directory if auto_remove is set."""
+        self._terminate(container, timeout)
+
+        if container.options.auto_remove:
+            shutil.rmtree(container.workdir, ignore_errors=True)
+
+    def restart(self, container: ProcessContainer, timeout: int) -> None:
+        """Restart a local process, keeping its data directory."""
+        self._terminate(container, timeout)
+        self._launch(container)
+
+    def status(self, container: ProcessContainer) -> str:
+        """Return running while the process is alive, exited otherwise."""
+        if container.process is not None and container.process.poll() is None:
+            return "running"
+
+        return "exited"
+
+    def logs(self, container: ProcessContainer, since: Optional[int] = None) -> str:
+        """Return the output of the current process.
+
+        The output is truncated when the process restarts, so it never holds output from
+        before the last start and since is not needed to filter it.
+        """
+        try:
+            return container.log_path.read_bytes().decode(errors="replace")
+        except FileNotFoundError:
+            return ""
+
+    def read_files(
+        self, container: ProcessContainer, data_dir: Optional[str], names: Sequence[str]
+    ) -> Dict[str, bytes]:
+        """Read files from the data directory of a local process."""
+        paths = [container.data_dir / name for name in names]
+
+        return {path.name: path.read_bytes() for path in paths if path.is_file()}
+
+    def follow_logs_command(self, container: ProcessContainer) -> str:
+        """Return the command which follows a processes output."""
+        return f"tail -f {container.log_path}"
+
+
+class FakeContainer(ContainerHandle):
+    """A container of the FakeRuntime.
+
+    Attributes:
+        status (str): Either running or exited.
+        output (str): What the fake container logs.
+        files (Dict[str, bytes]): Files in the fake containers data directory.
+        services (Dict[int, str]): Container ports the fake process answers on, mapped to the
+            protocol it speaks there, either runtime_api or control.
+        backend (Optional[str]): Name of the backend a fake HAProxy balances across.
+        servers (Dict[str, Dict[str, str]]): `show stat` row of each server of a fake HAProxy,
+            by server name. Tests can change a rows scur to hold sessions open.
+        commands (List[str]): Each command received on the fake containers services.
+    """
+
+    def __init__(
+        self, name: str, options: "ContainerOptions", ports: Dict[int, int], output: str
+    ) -> "FakeContainer":
+        """Initialize the FakeContainer.
+
+        Args:
+            name (str): Name of the container.
+            options (ContainerOptions): Options the container was started with.
+            ports (Dict[int, int]): Container ports mapped to a free local port.
+            output (str): What the fake container logs.
+        """
+        super().__init__(name, options, ports)
+
+        self.status = "running"
+        self.output = output
+        self.files = dict(options.files)
+        self.services: Dict[int, str] = {}
+        self.backend: Optional[str] = None
+        self.servers: Dict[str, Dict[str, str]] = {}
+        self.commands: List[str] = []
+
+
+class FakeRuntime(LoopbackRuntime):
+    """In memory runtime which starts nothing, for testing orchestration without Docker.
+
+    Fake TOR containers accept any password and command on their control port. Fake HAProxy
+    containers read their servers from the mounted configuration and answer `show stat` and
+    `set server` on their runtime API, with every ready server UP.
+
+    Attributes:
+        output (str): What every fake container logs, e.g. TOR's bootstrapped message.
+        containers (List[FakeContainer]): Every container started.
+        events (List[Tuple[str, str]]): Each lifecycle call made, as (action, container name)
+            or ("prepare", image).
+    """
+
+    name = "fake"
+
+    def __init__(self, output: str = "") -> "FakeRuntime":
+        """Initialize the FakeRuntime.
+
+        Args:
+            output (str): What every fake container logs.
+        """
+        self.output = output
+        self.containers: List[FakeContainer] = []
+        self.events: List[Tuple[str, str]] = []
+        self._lock = threading.Lock()
+
+    def _record(self, action: str, name: str) -> None:
+        """Record a lifecycle call."""
+        with self._lock:
+            self.events.append((action, name))
+
+    def prepare(self, images: Sequence[str]) -> None:
+        """Record the images as prepared."""
+        for image in dict.fromkeys(images):
+            self._record("prepare", image)
+
+    def run(
+        self, options: "ContainerOptions", network: Optional[NetworkHandle] = None
+    ) -> FakeContainer:
+        """Create a fake running container."""
+        image = (options.image or "fake").split("/")[-1].split(":")[0]
+        container = FakeContainer(
+            f"{image}-{secrets.token_hex(4)}", options, self._allocate_ports(options), self.output
+        )
+        command = options.command or []
+
+        if command[:1] == ["tor"]:
+            control_port = command[command.index("--ControlPort") + 1]
+            container.services[int(re.search(r"ports\[(\d+)\]", control_port)[1])] = "control"
+
+        if command[:1] == ["haproxy"]:
+            self._load_haproxy_config(container)
+
+        with self._lock:
+            self.containers.append(container)
+
+        self._record("run", container.name)
+
+        if network is not None:
+            self.connect(network, container)
+
+        return container
+
+    def stop(self, container: FakeContainer, timeout: int) -> None:
+        """Mark a fake container as exited."""
+        container.status = "exited"
+        self._record("stop", container.name)
+
+    def restart(self, container: FakeContainer, timeout: int) -> None:
+        """Mark a fake container as running again."""
+        container.status = "running"
+        self._record("restart", container.name)
+
+    def status(self, container: FakeContainer) -> str:
+        """Return the status of a fake container."""
+        return container.status
+
+    def logs(self, container: FakeContainer, since: Optional[int] = None) -> str:
+        """Return what the fake container logs."""
+        return container.output
+
+    def read_files(
+        self, container: FakeContainer, data_dir: Optional[str], names: Sequence[str]
+    ) -> Dict[str, bytes]:
+        """Return files from the fake containers data directory."""
+        return {name: container.files[name] for name in names if name in container.files}
+
+    def follow_logs_command(self, container: FakeContainer) -> str:
+        """Fake containers have no logs to follow."""
+        return f"# {container.name} is a fake container"
+
+    @staticmethod
+    def _load_haproxy_config(container: FakeContainer) -> None:
+        """Read the runtime API port, backend and servers from a mounted haproxy.cfg."""
+        for mount in container.options.mounts:
+            for line in Path(mount["Source"]).read_text().splitlines():
+                words = line.split()
+
+                if words[:2] == ["stats", "socket"]:
+                    container.services[int(words[2].rsplit(":", 1)[1])] = "runtime_api"
+
+                elif words[:1] == ["listen"]:
+                    container.backend = words[1]
+
+                elif words[:1] == ["server"]:
+                    container.servers[words[1]] = {"svname": words[1], "status": "UP"}
+
+                elif words[:1] == ["server-template"]:
+                    first, last = words[2].split("-")
+
+                    for index in range(int(first), int(last) + 1):
+                        name = f"{words[1]}{index}"
+                        container.servers[name] = {"svname": name, "status": "MAINT"}
+
+    def _runtime_api(self, container: FakeContainer, command: str) -> str:
+        """Answer a HAProxy runtime API command."""
+        if command == "show stat":
+            rows = [
+                {"svname": "FRONTEND", "status": "OPEN"},
+                *container.servers.values(),
+                {"svname": "BACKEND", "status": "UP"},
+            ]
+            lines = [
+                f"{container.backend},{row['svname']},0,{row.get('scur', 0)},{row['status']}"
+                for row in rows
+            ]
+
+            return "\n".join(["# pxname,svname,qcur,scur,status", *lines, ""])
+
+        match = re.fullmatch(r"set server (\S+)/(\S+) (addr|state) (.+)", command)
+
+        if match is None:
+            return "Unknown command.\n"
+
+        backend, server, field, value = match.groups()
+
+        if backend != container.backend or server not in container.servers:
+            return "No such server.\n"
+
+        if field == "addr":
+            return ""
+
+        states = {"ready": "UP", "drain": "DRAIN", "maint": "MAINT"}
+
+        if value not in states:
+            return "'set server <srv> state' expects 'ready', 'drain' and 'maint'.\n"
+
+        container.servers[server]["status"] = states[value]
+
+        return ""
+
+    def _serve(self, container: FakeContainer, protocol: str, sock: socket.socket) -> None:
+        """Answer the commands sent over one connection to a fake service."""
+        with sock, sock.makefile("rwb") as stream:
+            for line in stream:
+                command = line.decode().strip()
+
+                with self._lock:
+                    container.commands.append(command)
+
+                    if protocol == "runtime_api":
+                        # The runtime API answers one command, then closes the connection.
+                        stream.write(self._runtime_api(container, command).encode())
+                        return
+
+                if command == "QUIT":
+                    stream.write(b"250 closing connection\r\n")
+                    return
+
+                stream.write(b"250 OK\r\n")
+                stream.flush()
+
+    def open_connection(
+        self, container: FakeContainer, port: int, timeout: float
+    ) -> socket.socket:
+        """Open a connection to a fake service, answered on a background thread.
+
+        Raises:
+            ConnectionRefusedError: If the container is not running or serves nothing on port.
+        """
+        protocol = container.services.get(port)
+
+        if container.status != "running" or protocol is None:
+            raise ConnectionRefusedError(f"{container.name} does not serve port {port}.")
+
+        client, server = socket.socketpair()
+        client.settimeout(timeout)
+        threading.Thread(
+            target=self._serve, args=(container, protocol, server), daemon=True
+        ).start()
+
+        return client
+
+
+DOCKER_RUNTIME = DockerRuntime()
+"""* The runtime used unless another is given, shared so one docker client is reused."""
+
+
+def default_runtime() -> ContainerRuntime:
+    """Return the runtime used unless another is given."""
+    return DOCKER_RUNTIME
@@ -0,0 +1,430 @@
+"""This module provides per host rate limiting and fair scheduling of requests."""
+
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+import threading
+import time
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, Mapping, Optional, Tuple
+from urllib.parse import urlsplit
+
+from pydantic import BaseModel as Base, validator
+
+from .cache import parse_http_date
+from .metrics import CounterMap, Histogram
+from .ratelimit import TokenBucket
+
+
+def retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Return the seconds a Retry-After header asks to wait, None if there is none.
+
+    Args:
+        headers (Mapping[str, str]): Case insensitive response headers.
+
+    Returns:
+        Optional[float]: Seconds to wait, in delay seconds or until an HTTP date.
+    """
+    value = headers.get("Retry-After")
+
+    if not value:
+        return None
+
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    date = parse_http_date(value)
+
+    return None if date is None else max(date - time.time(), 0.0)
+
+
+class HostLimits(Base):
+    """Limits on the requests sent to one host.
+
+    Attributes:
+        rate (Optional[float]): Max requests started per second, None for no rate limit.
+        burst (float): Number of requests which can start at once before the rate applies.
+        max_concurrency (Optional[int]): Max requests in flight, None for no cap.
+        delay (float): Politeness delay, the min number of seconds between request starts.
+    """
+
+    rate: Optional[float] = None
+    burst: float = 1
+    max_concurrency: Optional[int] = None
+    delay: float = 0
+
+    @validator("rate")
+    def _rate_must_be_positive(  # pylint: disable=no-self-argument,no-self-use
+        cls, rate: Optional[float]
+    ) -> Optional[float]:
+        """Check a rate limit lets requests through."""
+        if rate is not None and rate <= 0:
+            raise ValueError("rate must be positive, None for no rate limit.")
+
+        return rate
+
+    @validator("burst")
+    def _burst_must_hold_a_request(  # pylint: disable=no-self-argument,no-self-use
+        cls, burst: float
+    ) -> float:
+        """Check the token bucket can hold the token of a request."""
+        if burst < 1:
+            raise ValueError("burst must be at least 1.")
+
+        return burst
+
+    @validator("max_concurrency")
+    def _max_concurrency_must_be_positive(  # pylint: disable=no-self-argument,no-self-use
+        cls, max_concurrency: Optional[int]
+    ) -> Optional[int]:
+        """Check a concurrency cap lets requests through."""
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1, None for no cap.")
+
+        return max_concurrency
+
+
+class _Waiter:
+    """A request queued for a host, woken when it may be admitted."""
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> "_Waiter":
+        """_Waiter __init__ method.
+
+        Args:
+            loop (Optional[asyncio.AbstractEventLoop]): Event loop of an async waiter.
+        """
+        self.loop = loop
+        self.event = threading.Event() if loop is None else asyncio.Event()
+
+    def wake(self) -> None:
+        """Wake the waiter from any thread."""
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self.event.set)
+
+
+class _Host:
+    """Scheduling state of one host."""
+
+    def __init__(self, limits: HostLimits) -> "_Host":
+        """_Host __init__ method.
+
+        Args:
+            limits (HostLimits): Limits of the host.
+        """
+        self.limits = limits
+        self.bucket = None if limits.rate is None else TokenBucket(limits.rate, limits.burst)
+        self.active = 0
+        self.next_start = 0.0
+        self.waiters: Deque[_Waiter] = deque()
+
+
+class HeldSlot:
+    """A hosts slot taken without waiting, held until it is released or its context exits.
+
+    Unlike Scheduler.slot, it can be taken in one thread and released in another, or released
+    without ever being entered if the request it was taken for is never sent.
+    """
+
+    def __init__(self, scheduler: "Scheduler", host: _Host) -> "HeldSlot":
+        """Initialize the HeldSlot.
+
+        Args:
+            scheduler (Scheduler): The scheduler the slot was taken from.
+            host (_Host): Scheduling state of the host.
+        """
+        self._scheduler = scheduler
+        self._host = host
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self) -> None:
+        """Free the slot, only the first call has any effect."""
+        with self._lock:
+            released, self._released = self._released, True
+
+        if not released:
+            self._scheduler._release(self._host)  # pylint: disable=protected-access
+
+    def __enter__(self) -> None:
+        """Hold the slot while the request is in flight."""
+
+    def __exit__(self, *exc_info) -> None:  # noqa: ANN002
+        """Free the slot once the request is done."""
+        self.release()
+
+
+class Scheduler:
+    """Admits requests to each host in arrival order within its limits.
+
+    Requests to a host wait in a FIFO queue. Only the request at its head is considered, and it
+    is admitted once the host has a free concurrency slot, its politeness delay has passed and
+    its token bucket has a token. Waiting requests block on an event rather than sleeping, and
+    are woken as soon as a slot is released or their turn comes, so threads and coroutines
+    share the same queues. A Retry-After header defers every request to the host.
+
+    Attributes:
+        default (HostLimits): Limits of hosts without their own limits.
+        hosts (Dict[str, HostLimits]): Limits of individual hosts, keyed by hostname.
+        max_retry_after (float): Max number of seconds a Retry-After header defers a host.
+        counts (CounterMap): Number of requests admitted, queued and deferred.
+        wait_time (Histogram): Seconds requests waited to be admitted.
+    """
+
+    def __init__(
+        self,
+        default: Optional[HostLimits] = None,
+        hosts: Optional[Dict[str, HostLimits]] = None,
+        max_retry_after: float = 60,
+    ) -> "Scheduler":
+        """Scheduler __init__ method.
+
+        Args:
+            default (Optional[HostLimits]): Limits of hosts without their own limits. Defaults
+                to no limits.
+            hosts (Optional[Dict[str, HostLimits]]): Limits of individual hosts.
+            max_retry_after (float): Max number of seconds a Retry-After header defers a host.
+        """
+        self.default = default or HostLimits()
+        self.hosts = {host.lower(): limits for host, limits in (hosts or {}).items()}
+        self.max_retry_after = max_retry_after
+
+        self.counts = CounterMap()
+        self.wait_time = Histogram()
+
+        self._hosts: Dict[str, _Host] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        """Return the hostname requests to url are scheduled under."""
+        return (urlsplit(url).hostname or "").lower()
+
+    def _host(self, url: str) -> _Host:
+        """Return the scheduling state of the urls host, creating it on first use."""
+        name = self.host_of(url)
+
+        with self._lock:
+            host = self._hosts.get(name)
+
+            if host is None:
+                host = self._hosts[name] = _Host(self.hosts.get(name, self.default))
+
+            return host
+
+    def _enqueue(self, host: _Host, waiter: _Waiter) -> None:
+        """Add a waiter to the back of a hosts queue."""
+        with self._lock:
+            host.waiters.append(waiter)
+
+    def _poll(self, host: _Host, waiter: _Waiter) -> Tuple[bool, Optional[float]]:
+        """Admit the waiter if it is at the head of the queue and the limits allow it.
+
+        Returns:
+            Tuple[bool, Optional[float]]: Whether it was admitted, and if not the seconds to
+                wait before polling again, None to wait until it is woken.
+        """
+        with self._lock:
+            if host.waiters[0] is not waiter:
+                return False, None
+
+            limits = host.limits
+
+            if limits.max_concurrency is not None and host.active >= limits.max_concurrency:
+                return False, None
+
+            now = time.monotonic()
+
+            if host.next_start > now:
+                return False, host.next_start - now
+
+            if host.bucket is not None and not host.bucket.try_acquire():
+                return False, host.bucket.time_until()
+
+            host.waiters.popleft()
+            host.active += 1
+            host.next_start = max(host.next_start, now + limits.delay)
+
+            if host.waiters:
+                host.waiters[0].wake()
+
+            return True, None
+
+    def _abandon(self, host: _Host, waiter: _Waiter) -> None:
+        """Remove a waiter which gave up, letting the next waiter take its turn."""
+        with self._lock:
+            head = host.waiters[0] is waiter
+            host.waiters.remove(waiter)
+
+            if head and host.waiters:
+                host.waiters[0].wake()
+
+    def _release(self, host: _Host) -> None:
+        """Free an admitted requests concurrency slot."""
+        with self._lock:
+            host.active -= 1
+
+            if host.waiters:
+                host.waiters[0].wake()
+
+    def _admitted(self, start: float) -> None:
+        """Record a request admitted after waiting since start."""
+        waited = time.monotonic() - start
+
+        self.counts.inc("admitted")
+        self.wait_time.observe(waited)
+
+        if waited > 0.001:
+            self.counts.inc("queued")
+
+    @contextmanager
+    def slot(self, url: str) -> Iterator[None]:
+        """Block the thread until a request to url may be sent, and hold its slot.
+
+        Args:
+            url (str): The url the request is sent to.
+
+        Yields:
+            None: While the request is in flight.
+        """
+        host = self._host(url)
+        waiter = _Waiter()
+        start = time.monotonic()
+        admitted = False
+
+        self._enqueue(host, waiter)
+
+        try:
+            while True:
+                waiter.event.clear()
+                admitted, wait = self._poll(host, waiter)
+
+                if admitted:
+                    break
+
+                waiter.event.wait(wait)
+
+        finally:
+            if not admitted:
+                self._abandon(host, waiter)
+
+        self._admitted(start)
+
+        try:
+            yield
+        finally:
+            self._release(host)
+
+    def try_slot(self, url: str) -> Optional[HeldSlot]:
+        """Take a slot for a request to url only if it may be sent right away.
+
+        Requests already queued for the host keep their turn, so a slot is only taken when
+        none are waiting and the hosts limits allow another request now.
+
+        Args:
+            url (str): The url the request is sent to.
+
+        Returns:
+            Optional[HeldSlot]: The slot, which must be released, None if there is no free slot.
+        """
+        host = self._host(url)
+        waiter = _Waiter()
+
+        self._enqueue(host, waiter)
+        admitted, _ = self._poll(host, waiter)
+
+        if not admitted:
+            self._abandon(host, waiter)
+            return None
+
+        self._admitted(time.monotonic())
+
+        return HeldSlot(self, host)
+
+    @asynccontextmanager
+    async def async_slot(self, url: str) -> AsyncIterator[None]:
+        """Wait without blocking the event loop until a request to url may be sent.
+
+        Args:
+            url (str): The url the request is sent to.
+
+        Yields:
+            None: While the request is in flight.
+        """
+        host = self._host(url)
+        waiter = _Waiter(asyncio.get_running_loop())
+        start = time.monotonic()
+        admitted = False
+
+        self._enqueue(host, waiter)
+
+        try:
+            while True:
+                waiter.event.clear()
+                admitted, wait = self._poll(host, waiter)
+
+                if admitted:
+                    break
+
+                try:
+                    await asyncio.wait_for(waiter.event.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+
+        finally:
+            if not admitted:
+                self._abandon(host, waiter)
+
+        self._admitted(start)
+
+        try:
+            yield
+        finally:
+            self._release(host)
+
+    def defer(self, url: str, seconds: float) -> None:
+        """Hold back every request to the urls host for a number of seconds.
+
+        Args:
+            url (str): A url of the host.
+            seconds (float): Seconds to wait, capped at max_retry_after.
+        """
+        host = self._host(url)
+        seconds = min(seconds, self.max_retry_after)
+
+        with self._lock:
+            host.next_start = max(host.next_start, time.monotonic() + seconds)
+
+        self.counts.inc("deferred")
+
+    def observe(self, url: str, status_code: int, headers: Mapping[str, str]) -> None:
+        """Defer the host of a response which asks to be retried later.
+
+        Args:
+            url (str): The url the response came from.
+            status_code (int): Response status code.
+            headers (Mapping[str, str]): Case insensitive response headers.
+        """
+        if status_code not in (429, 503):
+            return
+
+        seconds = retry_after(headers)
+
+        if seconds:
+            self.defer(url, seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the counts, wait times and the requests in flight and queued per host."""
+        with self._lock:
+            hosts = {
+                name: {"active": host.active, "queued": len(host.waiters)}
+                for name, host in self._hosts.items()
+            }
+
+        return {
+            "counts": self.counts.snapshot(),
+            "wait_time": self.wait_time.snapshot(),
+            "hosts": hosts,
+        }
@@ -0,0 +1,209 @@
+"""This module provides pooled keep-alive sessions for making proxied requests."""
+
+import threading
+import time
+from typing import Optional
+
+from loguru import logger
+from pydantic import BaseModel as Base
+import requests
+from requests.adapters import HTTPAdapter
+from socks import socksocket
+from urllib3 import PoolManager
+from urllib3.contrib.socks import (
+    SOCKSConnection,
+    SOCKSHTTPConnectionPool,
+    SOCKSHTTPSConnection,
+    SOCKSHTTPSConnectionPool,
+    SOCKSProxyManager,
+)
+
+_connect_times = threading.local()
+
+
+def pop_connect_time() -> Optional[float]:
+    """Return and clear the time the calling threads last new proxy connection took.
+
+    Returns:
+        Optional[float]: Seconds taken to connect through the SOCKS proxy, None if the last
+            request reused a kept alive connection.
+    """
+    connect_time = getattr(_connect_times, "last", None)
+    _connect_times.last = None
+
+    return connect_time
+
+
+class TimedSOCKSConnection(SOCKSConnection):
+    """SOCKS connection which records how long establishing it took."""
+
+    def _new_conn(self) -> socksocket:
+        """Establish a new connection via the SOCKS proxy and record the time it took."""
+        start = time.monotonic()
+        connection = super()._new_conn()
+        _connect_times.last = time.monotonic() - start
+
+        return connection
+
+
+class TimedSOCKSHTTPSConnection(TimedSOCKSConnection, SOCKSHTTPSConnection):
+    """SOCKS https connection which records how long establishing it took."""
+
+
+class TimedSOCKSHTTPConnectionPool(SOCKSHTTPConnectionPool):
+    """SOCKS http connection pool of timed connections."""
+
+    ConnectionCls = TimedSOCKSConnection
+
+
+class TimedSOCKSHTTPSConnectionPool(SOCKSHTTPSConnectionPool):
+    """SOCKS https connection pool of timed connections."""
+
+    ConnectionCls = TimedSOCKSHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter which records the connect time of new SOCKS proxy connections."""
+
+    def proxy_manager_for(self, proxy: str, **proxy_kwargs) -> PoolManager:  # noqa: ANN003
+        """Return the proxy manager for a proxy, using timed connections for SOCKS proxies."""
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+
+        if isinstance(manager, SOCKSProxyManager):
+            manager.pool_classes_by_scheme = {
+                "http": TimedSOCKSHTTPConnectionPool,
+                "https": TimedSOCKSHTTPSConnectionPool,
+            }
+
+        return manager
+
+
+class SessionOptions(Base):
+    """Handles options for the pooled requests sessions.
+
+    Attributes:
+        pool_connections (int): Number of connection pools to cache, one pool per target host.
+        pool_maxsize (int): Maximum number of connections to keep alive in each pool.
+        pool_block (bool): If True, block when a pool has no free connections instead of
+            opening a connection which will be discarded after use.
+        keep_alive (Optional[int]): Seconds before the pooled connections are recycled. Each
+            kept alive connection sticks to a single TOR circuit, so this bounds how long a
+            connection keeps the same ip address. None keeps connections alive indefinitely.
+    """
+
+    pool_connections: int = 10
+    pool_maxsize: int = 10
+    pool_block: bool = False
+    keep_alive: Optional[int] = 60
+
+    @classmethod
+    def sized_for(
+        cls, onion_count: int, concurrency: int, **options  # noqa: ANN003
+    ) -> "SessionOptions":
+        """Return options with pools sized for the number of circuits and callers.
+
+        Args:
+            onion_count (int): Number of TOR circuits behind the rotating proxy.
+            concurrency (int): Number of threads expected to share the sessions.
+            **options: Explicit option overrides, ignored when None.
+
+        Returns:
+            SessionOptions: Options object.
+        """
+        sized = {
+            "pool_connections": max(onion_count, cls.__fields__["pool_connections"].default),
+            "pool_maxsize": max(onion_count, concurrency),
+        }
+        sized.update({key: value for key, value in options.items() if value is not None})
+
+        return cls(**sized)
+
+
+class SessionPool:
+    """Thread safe pool of keep-alive requests sessions.
+
+    Each thread gets its own requests.Session, so cookies and other session state are never
+    shared between threads. Every session mounts one shared HTTPAdapter, whose urllib3 pools
+    are thread safe, so open connections to the balancer are reused across all threads.
+    """
+
+    def __init__(self, options: Optional[SessionOptions] = None) -> "SessionPool":
+        """Initialize the SessionPool.
+
+        Args:
+            options (Optional[SessionOptions]): Session options object.
+        """
+        self.options = options or SessionOptions()
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._adapter: Optional[HTTPAdapter] = None
+        self._adapter_created = 0.0
+
+    def _create_adapter(self) -> HTTPAdapter:
+        """Create a new shared adapter."""
+        return TimedHTTPAdapter(
+            pool_connections=self.options.pool_connections,
+            pool_maxsize=self.options.pool_maxsize,
+            pool_block=self.options.pool_block,
+        )
+
+    def _adapter_expired(self) -> bool:
+        """Check if the shared adapter has outlived the keep alive duration."""
+        if self.options.keep_alive is None:
+            return False
+
+        return time.monotonic() - self._adapter_created > self.options.keep_alive
+
+    @property
+    def adapter(self) -> HTTPAdapter:
+        """Return the shared adapter, recycling it once the keep alive duration has passed."""
+        with self._lock:
+            if self._adapter is None or self._adapter_expired():
+                expired, self._adapter = self._adapter, self._create_adapter()
+                self._adapter_created = time.monotonic()
+
+                if expired is not None:
+                    logger.debug("Recycling keep-alive connections.")
+                    # Connections still in use are closed when they are returned to the pool.
+                    expired.close()
+
+            return self._adapter
+
+    def session(self) -> requests.Session:
+        """Return the calling thread's session mounted with the shared adapter."""
+        adapter = self.adapter
+        session = getattr(self._local, "session", None)
+
+        if session is None:
+            session = self._local.session = requests.Session()
+
+        if session.get_adapter("https://") is not adapter:
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+
+        return session
+
+    def close_proxy(self, proxy: str) -> None:
+        """Close the pooled connections through one proxy, leaving the others open.
+
+        Args:
+            proxy (str): Address of the proxy, e.g. an onions socks5 address.
+        """
+        with self._lock:
+            adapter = self._adapter
+
+        if adapter is None:
+            return
+
+        manager = adapter.proxy_manager.pop(proxy, None)
+
+        if manager is not None:
+            manager.clear()
+
+    def close(self) -> None:
+        """Close all pooled connections."""
+        with self._lock:
+            if self._adapter is not None:
+                self._adapter.close()
+                self._adapter = None
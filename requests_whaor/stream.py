@@ -0,0 +1,259 @@
+"""This module provides streamed responses which resume with range requests when they break."""
+
+import os
+import re
+from typing import BinaryIO, Callable, Dict, Iterator, Optional, Tuple, Union
+
+from loguru import logger
+import requests
+from requests.exceptions import (  # pylint: disable=redefined-builtin
+    ChunkedEncodingError,
+    ConnectionError,
+    Timeout,
+)
+
+RESUMABLE_ERRORS = (ChunkedEncodingError, ConnectionError, Timeout)
+"""* Errors a stream can break with mid-way, which are resumed from."""
+
+CONTENT_RANGE = re.compile(r"^bytes (\d+)-(\d+)/(\d+|\*)$")
+
+
+class StreamError(Exception):
+    """Raised when a broken stream can't be resumed, or resumes with a different body."""
+
+
+def parse_content_range(value: Optional[str]) -> Optional[Tuple[int, int, Optional[int]]]:
+    """Parse a Content-Range header.
+
+    Args:
+        value (Optional[str]): Header value, e.g. `bytes 100-199/1000`.
+
+    Returns:
+        Optional[Tuple[int, int, Optional[int]]]: First and last byte positions and the full
+            length, None if unknown. None if the header is missing or malformed.
+    """
+    match = CONTENT_RANGE.match((value or "").strip())
+
+    if match is None:
+        return None
+
+    first, last, length = match.groups()
+
+    return int(first), int(last), None if length == "*" else int(length)
+
+
+def strong_etag(response: requests.models.Response) -> Optional[str]:
+    """Return the responses ETag if it is a strong validator, weak ones can't resume ranges."""
+    etag = response.headers.get("ETag")
+    return None if not etag or etag.startswith("W/") else etag
+
+
+def content_length(response: requests.models.Response) -> Optional[int]:
+    """Return the responses Content-Length, None if it is missing or malformed."""
+    try:
+        return int(response.headers["Content-Length"])
+    except (KeyError, ValueError):
+        return None
+
+
+class ResumableStream:
+    """Body of a streamed GET response, read in bounded chunks and resumed when it breaks.
+
+    At most chunk_size bytes of the body are held in memory at a time. When the connection
+    breaks or the body ends short of its Content-Length, the rest is requested again from the
+    byte it broke at with a Range request, which the requestor sends through another circuit.
+    The resumed response must be the same body: its ETag, or its Last-Modified date without
+    one, and its length must match, and a 206 response must start at the requested byte. A
+    server which ignores the range and answers 200 is read from the start, skipping the bytes
+    already yielded.
+
+    Only uncompressed 200 responses with an ETag or Content-Length are resumed, as ranges of
+    compressed bodies don't line up with the decoded bytes. A stream is iterated once.
+
+    Attributes:
+        response (requests.models.Response): The response currently being read.
+        chunk_size (int): Max number of bytes read and yielded at a time.
+        max_resumes (int): Max number of times the stream is resumed.
+        received (int): Number of body bytes yielded so far.
+        resumes (int): Number of times the stream was resumed.
+        length (Optional[int]): Length of the whole body, None if unknown.
+        etag (Optional[str]): Strong ETag of the body, None if it has none.
+        resumable (bool): Whether the stream can be resumed at all.
+    """
+
+    def __init__(
+        self,
+        response: requests.models.Response,
+        reopen: Callable[[Dict[str, str]], Optional[requests.models.Response]],
+        chunk_size: int = 65536,
+        max_resumes: int = 5,
+    ) -> "ResumableStream":
+        """Initialize the ResumableStream.
+
+        Args:
+            response (requests.models.Response): A response sent with stream=True.
+            reopen (Callable[[Dict[str, str]], Optional[requests.models.Response]]): Sends the
+                request again with extra headers and stream=True, returns None if it failed.
+            chunk_size (int): Max number of bytes read and yielded at a time.
+            max_resumes (int): Max number of times the stream is resumed.
+        """
+        self.response = response
+        self.chunk_size = chunk_size
+        self.max_resumes = max_resumes
+        self.received = 0
+        self.resumes = 0
+
+        self.length = content_length(response)
+        self.etag = strong_etag(response)
+        self._last_modified = response.headers.get("Last-Modified")
+
+        encoding = response.headers.get("Content-Encoding", "identity").lower()
+        ranges = response.headers.get("Accept-Ranges", "").lower()
+        validated = self.etag is not None or self.length is not None
+
+        self.resumable = all(
+            (response.status_code == 200, encoding == "identity", ranges != "none", validated)
+        )
+
+        self._reopen = reopen
+        self._skip = 0
+
+    @property
+    def url(self) -> str:
+        """Return the url of the streamed response."""
+        return self.response.url
+
+    def __iter__(self) -> Iterator[bytes]:
+        """Yield the body in chunks of at most chunk_size bytes, resuming when it breaks.
+
+        Raises:
+            StreamError: If the stream broke and can't be resumed.
+        """
+        while True:
+            try:
+                for chunk in self.response.iter_content(self.chunk_size):
+                    if self._skip:
+                        skipped = min(self._skip, len(chunk))
+                        chunk = chunk[skipped:]
+                        self._skip -= skipped
+
+                    if chunk:
+                        self.received += len(chunk)
+                        yield chunk
+
+                if self._skip == 0 and (self.length is None or self.received >= self.length):
+                    return
+
+                reason = "truncated"
+
+            except RESUMABLE_ERRORS as error:
+                reason = type(error).__name__
+
+            self._resume(reason)
+
+    def _resume(self, reason: str) -> None:
+        """Request the rest of the body and check it is the same body."""
+        self.response.close()
+
+        if not self.resumable or self.resumes >= self.max_resumes:
+            raise StreamError(f"{self.url} broke after {self.received} bytes ({reason}).")
+
+        self.resumes += 1
+        logger.debug(f"Resuming {self.url} at byte {self.received} after {reason}.")
+
+        headers = {"Range": f"bytes={self.received}-"}
+        validator = self.etag or self._last_modified
+
+        if validator is not None:
+            # The server sends the whole new body instead of a range if it changed.
+            headers["If-Range"] = validator
+
+        response = self._reopen(headers)
+
+        if response is None:
+            raise StreamError(f"Failed to resume {self.url} at byte {self.received}.")
+
+        try:
+            self._skip = self._check(response)
+        except StreamError:
+            response.close()
+            raise
+
+        self.response = response
+
+    def _check(self, response: requests.models.Response) -> int:
+        """Check a resumed response continues the same body.
+
+        Returns:
+            int: Number of bytes at its start which were already yielded.
+
+        Raises:
+            StreamError: If it is a different body, or doesn't continue it.
+        """
+        etag = strong_etag(response)
+
+        if self.etag is not None and etag != self.etag:
+            raise StreamError(f"{self.url} changed while resuming, ETag {etag} != {self.etag}.")
+
+        last_modified = response.headers.get("Last-Modified")
+
+        if self.etag is None and self._last_modified not in (None, last_modified):
+            raise StreamError(f"{self.url} changed while resuming, modified {last_modified}.")
+
+        if response.status_code == 206:
+            content_range = parse_content_range(response.headers.get("Content-Range"))
+
+            if content_range is None or content_range[0] != self.received:
+                raise StreamError(f"{self.url} resumed at the wrong range {content_range}.")
+
+            length = content_range[2]
+            skip = 0
+
+        elif response.status_code == 200:
+            length = content_length(response)
+            skip = self.received
+
+        else:
+            raise StreamError(f"{self.url} resumed with status {response.status_code}.")
+
+        if self.length is not None and length is not None and length != self.length:
+            raise StreamError(f"{self.url} changed while resuming, length {length}.")
+
+        return skip
+
+    def write_to(self, sink: Union[str, os.PathLike, BinaryIO]) -> int:
+        """Write the body to a file or sink a chunk at a time.
+
+        Args:
+            sink (Union[str, os.PathLike, BinaryIO]): Path of the file to write, or an object
+                with a write method, e.g. an open file or socket file.
+
+        Returns:
+            int: Number of bytes written.
+
+        Raises:
+            StreamError: If the stream broke and can't be resumed.
+        """
+        if isinstance(sink, (str, os.PathLike)):
+            with open(sink, mode="wb") as file:
+                return self.write_to(file)
+
+        written = 0
+
+        for chunk in self:
+            sink.write(chunk)
+            written += len(chunk)
+
+        return written
+
+    def close(self) -> None:
+        """Release the connection of the response being read."""
+        self.response.close()
+
+    def __enter__(self) -> "ResumableStream":
+        """Return the stream, which is closed on exit."""
+        return self
+
+    def __exit__(self, *exc) -> None:  # noqa: ANN002
+        """Close the stream."""
+        self.close()
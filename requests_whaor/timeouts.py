@@ -0,0 +1,146 @@
+"""This module provides connect and read timeouts derived from observed latencies."""
+
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .metrics import Histogram, HistogramMap
+
+
+class AdaptiveTimeouts:
+    """Derives connect and read timeouts from the latencies seen per host and per circuit.
+
+    One static timeout is too short for slow but healthy targets and far too long for failed
+    circuits. Connect times mostly depend on the circuit, so the connect timeout comes from the
+    connect times of the circuit a request is routed through, or of the host without client side
+    routing. Waiting for the response depends on the target, so the read timeout comes from the
+    hosts time to first byte. Each timeout is the latency quantile times factor, clamped to its
+    bounds. Until there are min_samples latencies the static default is used, and hosts can be
+    given static timeouts which always apply.
+
+    Attempts which time out are observed at the timeout they hit, so timeouts which are too
+    tight grow back instead of hiding the slow latencies they cut off.
+
+    Attributes:
+        quantile (float): Latency quantile the timeouts are derived from.
+        factor (float): Multiple of the quantile the timeouts are set to.
+        connect_bounds (Tuple[float, float]): Min and max connect timeout in seconds.
+        read_bounds (Tuple[float, float]): Min and max read timeout in seconds.
+        min_samples (int): Number of latencies needed before a timeout is derived from them.
+        hosts (Dict[str, Tuple[float, float]]): Static connect and read timeouts by hostname.
+        connect_by_circuit (HistogramMap): Seconds to connect, by circuit container name.
+        connect_by_host (HistogramMap): Seconds to connect, by hostname.
+        read_by_host (HistogramMap): Seconds from sending a request to its first byte, by
+            hostname.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        quantile: float = 0.99,
+        factor: float = 3,
+        connect_bounds: Tuple[float, float] = (1, 30),
+        read_bounds: Tuple[float, float] = (2, 120),
+        min_samples: int = 20,
+        hosts: Optional[Dict[str, Tuple[float, float]]] = None,
+    ) -> "AdaptiveTimeouts":
+        """Initialize the AdaptiveTimeouts.
+
+        Args:
+            quantile (float): Latency quantile the timeouts are derived from.
+            factor (float): Multiple of the quantile the timeouts are set to.
+            connect_bounds (Tuple[float, float]): Min and max connect timeout in seconds.
+            read_bounds (Tuple[float, float]): Min and max read timeout in seconds.
+            min_samples (int): Number of latencies needed before a timeout is derived.
+            hosts (Optional[Dict[str, Tuple[float, float]]]): Static connect and read timeouts
+                by hostname, e.g. {"slow.example.com": (10, 60)}.
+        """
+        self.quantile = quantile
+        self.factor = factor
+        self.connect_bounds = connect_bounds
+        self.read_bounds = read_bounds
+        self.min_samples = min_samples
+        self.hosts = {host.lower(): timeouts for host, timeouts in (hosts or {}).items()}
+
+        self.connect_by_circuit = HistogramMap()
+        self.connect_by_host = HistogramMap()
+        self.read_by_host = HistogramMap()
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        """Return the hostname latencies of url are tracked under."""
+        return (urlsplit(url).hostname or "").lower()
+
+    def observe(
+        self,
+        url: str,
+        circuit: Optional[str] = None,
+        connect: Optional[float] = None,
+        read: Optional[float] = None,
+    ) -> None:
+        """Record the latencies of a request attempt.
+
+        Args:
+            url (str): The request url.
+            circuit (Optional[str]): Container name of the circuit it was routed through.
+            connect (Optional[float]): Seconds to connect, None if a connection was reused.
+            read (Optional[float]): Seconds from sending the request to its first byte.
+        """
+        host = self.host_of(url)
+
+        if connect is not None:
+            self.connect_by_host.observe(host, connect)
+
+            if circuit is not None:
+                self.connect_by_circuit.observe(circuit, connect)
+
+        if read is not None:
+            self.read_by_host.observe(host, read)
+
+    def _derive(
+        self, histogram: Optional[Histogram], bounds: Tuple[float, float]
+    ) -> Optional[float]:
+        """Return the bounded timeout a histogram gives, None if it has too few samples."""
+        if histogram is None or histogram.count < self.min_samples:
+            return None
+
+        floor, ceiling = bounds
+
+        return min(max(histogram.quantile(self.quantile) * self.factor, floor), ceiling)
+
+    def timeout(
+        self, url: str, circuit: Optional[str] = None, default: float = 5
+    ) -> Tuple[float, float]:
+        """Return the connect and read timeouts of a request attempt.
+
+        Args:
+            url (str): The request url.
+            circuit (Optional[str]): Container name of the circuit it is routed through.
+            default (float): Static timeout used until there are enough latencies.
+
+        Returns:
+            Tuple[float, float]: Connect and read timeouts in seconds.
+        """
+        host = self.host_of(url)
+        static = self.hosts.get(host)
+
+        if static is not None:
+            return static
+
+        connect = None
+
+        if circuit is not None:
+            connect = self._derive(self.connect_by_circuit.get(circuit), self.connect_bounds)
+
+        if connect is None:
+            connect = self._derive(self.connect_by_host.get(host), self.connect_bounds)
+
+        read = self._derive(self.read_by_host.get(host), self.read_bounds)
+
+        return (default if connect is None else connect, default if read is None else read)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the latency distributions the timeouts are derived from."""
+        return {
+            "connect_by_circuit": self.connect_by_circuit.snapshot(),
+            "connect_by_host": self.connect_by_host.snapshot(),
+            "read_by_host": self.read_by_host.snapshot(),
+        }
@@ -0,0 +1,183 @@
+"""This module provides a persistent cache of TOR directory documents shared by circuits."""
+
+import calendar
+import os
+from pathlib import Path
+import re
+import threading
+import time
+from typing import Dict, List, Optional, TYPE_CHECKING, Union
+
+from loguru import logger
+
+from .paths import CACHE_DIRECTORY
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .circuit import OnionCircuit
+
+CONSENSUS_FILE = "cached-microdesc-consensus"
+"""* Name of the microdescriptor consensus TOR keeps in its data directory."""
+
+CACHE_FILES = (CONSENSUS_FILE, "cached-certs", "cached-microdescs", "cached-microdescs.new")
+"""* Directory documents a circuit needs to bootstrap, in order of importance."""
+
+VALID_UNTIL = re.compile(rb"^valid-until (\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)$", re.MULTILINE)
+
+
+def consensus_valid_until(consensus: bytes) -> Optional[float]:
+    """Return the unix time a consensus is valid until, None if it can't be parsed."""
+    match = VALID_UNTIL.search(consensus[:4096])
+
+    if match is None:
+        return None
+
+    return float(calendar.timegm(time.strptime(match.group(1).decode(), "%Y-%m-%d %H:%M:%S")))
+
+
+class TorCache:
+    """Directory documents of a bootstrapped circuit, used to seed new circuits.
+
+    Without them every new TOR instance downloads the consensus, certificates and
+    microdescriptors itself before it can build circuits. New circuits are started with a copy
+    of the cached documents in their data directory, and the cache is updated from a
+    bootstrapped circuit whenever it holds a newer consensus. TOR keeps using a consensus for up
+    to a day after it expires while it fetches a new one, so the cache is used until max_stale
+    seconds past its consensus valid-until time and pruned after that.
+
+    Attributes:
+        path (Path): Directory holding the documents.
+        max_bytes (int): Max size of the documents. The least important are left out first.
+        max_stale (float): Seconds past its valid-until time a consensus is still used.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_stale: float = 24 * 60 * 60,
+    ) -> "TorCache":
+        """Initialize the TorCache.
+
+        Args:
+            path (Optional[Union[str, Path]]): Directory holding the documents. Defaults to a
+                tor directory in the persistent cache directory.
+            max_bytes (int): Max size of the documents.
+            max_stale (float): Seconds past its valid-until time a consensus is still used.
+        """
+        self.path = Path(path) if path is not None else CACHE_DIRECTORY / "tor"
+        self.max_bytes = max_bytes
+        self.max_stale = max_stale
+
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        """Return the size of the cached documents in bytes."""
+        return sum(path.stat().st_size for path in self._paths())
+
+    def _paths(self) -> List[Path]:
+        """Return the paths of the cached documents which exist."""
+        return [self.path / name for name in CACHE_FILES if (self.path / name).is_file()]
+
+    def valid_until(self) -> Optional[float]:
+        """Return the unix time the cached consensus is valid until, None if there is none."""
+        try:
+            with open(self.path / CONSENSUS_FILE, mode="rb") as consensus:
+                return consensus_valid_until(consensus.read(4096))
+        except FileNotFoundError:
+            return None
+
+    def is_usable(self) -> bool:
+        """Check if there is a cached consensus recent enough to seed circuits with."""
+        valid_until = self.valid_until()
+        return valid_until is not None and time.time() < valid_until + self.max_stale
+
+    def load(self) -> Dict[str, bytes]:
+        """Return the documents to seed a new circuit with, pruning them if they are too old.
+
+        Returns:
+            Dict[str, bytes]: Content of each cached document by file name, empty if the cache
+                is empty or unusable.
+        """
+        with self._lock:
+            if not self.is_usable():
+                self._prune()
+                return {}
+
+            return {path.name: path.read_bytes() for path in self._paths()}
+
+    def store(self, files: Dict[str, bytes]) -> bool:
+        """Replace the cached documents with newer ones.
+
+        Args:
+            files (Dict[str, bytes]): Content of each document by file name, as read from a
+                bootstrapped circuits data directory.
+
+        Returns:
+            bool: True if the documents were stored. They are not if their consensus is missing,
+                unparsable or not newer than the cached one.
+        """
+        consensus = files.get(CONSENSUS_FILE)
+        valid_until = None if consensus is None else consensus_valid_until(consensus)
+
+        if valid_until is None:
+            return False
+
+        kept, size = {}, 0
+
+        for name in CACHE_FILES:
+            content = files.get(name)
+
+            if content is not None and size + len(content) <= self.max_bytes:
+                kept[name] = content
+                size += len(content)
+
+        if CONSENSUS_FILE not in kept:
+            return False
+
+        with self._lock:
+            current = self.valid_until()
+
+            if current is not None and current >= valid_until:
+                return False
+
+            self.path.mkdir(parents=True, exist_ok=True)
+
+            for name, content in kept.items():
+                # Written then renamed, so a concurrent load never reads a partial document.
+                partial = self.path / f".{name}.{os.getpid()}.{threading.get_ident()}"
+                partial.write_bytes(content)
+                os.replace(partial, self.path / name)
+
+            for path in self._paths():
+                if path.name not in kept:
+                    path.unlink()
+
+        logger.debug(f"Stored {size} bytes of TOR directory documents in {self.path}.")
+
+        return True
+
+    def update_from(self, circuit: "OnionCircuit") -> bool:
+        """Store the directory documents of a bootstrapped circuit if they are newer.
+
+        Args:
+            circuit (OnionCircuit): A bootstrapped TOR container.
+
+        Returns:
+            bool: True if the documents were stored.
+        """
+        try:
+            return self.store(circuit.read_data_files(CACHE_FILES))
+        except Exception as error:  # pylint: disable=broad-except
+            logger.warning(f"Failed to cache {circuit.container_name}'s documents: {error}")
+            return False
+
+    def clear(self) -> None:
+        """Remove every cached document."""
+        with self._lock:
+            self._prune()
+
+    def _prune(self) -> None:
+        """Remove every cached document, the lock must be held."""
+        for path in self._paths():
+            path.unlink()
@@ -0,0 +1,17 @@
+"""Shared test fixtures."""
+
+from benchmarks.servers import serve, SOCKS5Server, TargetServer
+import pytest
+
+
+@pytest.fixture
+def servers():
+    """Serve a SOCKS5 proxy stand-in and a target server, yielding (proxy, target)."""
+    proxy, target = SOCKS5Server(), TargetServer()
+    serve(proxy)
+    serve(target)
+
+    yield proxy, target
+
+    proxy.shutdown()
+    target.shutdown()
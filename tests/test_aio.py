@@ -0,0 +1,93 @@
+"""Async requestor tests."""
+
+import asyncio
+import time
+
+import pytest
+from requests_whaor.aio import AsyncRequestor
+from requests_whaor.retry import RetryPolicy
+from requests_whaor.scheduler import HostLimits, Scheduler
+
+pytest.importorskip("httpx")
+
+
+def _run(servers, test, **options):
+    """Run test with an async requestor proxied through local stand-ins."""
+    proxy, target = servers
+
+    async def main():
+        requestor = AsyncRequestor(
+            onions=[],
+            onion_balancer=proxy,
+            timeout=5,
+            max_retries=3,
+            retry_policy=RetryPolicy(max_attempts=3, backoff_base=0.01),
+            **options,
+        )
+
+        try:
+            return await test(requestor, target.url)
+        finally:
+            await requestor.close()
+
+    return asyncio.run(main())
+
+
+def test_failed_attempts_are_retried(servers):
+    async def test(requestor, url):
+        first = await requestor.get(f"{url}?error_rate=0.5")
+        second = await requestor.get(f"{url}?error_rate=0.5")
+        failed = await requestor.get(f"{url}?error_rate=1")
+
+        return first, second, failed, requestor.metrics.snapshot()
+
+    first, second, failed, snapshot = _run(servers, test)
+
+    assert (first.status_code, first.retries) == (200, 0)
+    assert (second.status_code, second.retries, second.retry_reasons) == (200, 1, ["503"])
+    assert failed is None
+    assert snapshot["statuses"] == {"200": 2, "503": 4}
+    assert snapshot["retries"] == {"503": 3}
+
+
+def test_semaphore_bounds_requests_in_flight(servers):
+    async def test(requestor, url):
+        peak = 0
+
+        async def sample():
+            nonlocal peak
+
+            while True:
+                peak = max(peak, requestor.metrics.in_flight)
+                await asyncio.sleep(0.005)
+
+        sampler = asyncio.ensure_future(sample())
+        start = time.monotonic()
+        responses = await asyncio.gather(*(requestor.get(f"{url}?latency=0.1") for _ in range(6)))
+        elapsed = time.monotonic() - start
+        sampler.cancel()
+
+        return responses, elapsed, peak
+
+    responses, elapsed, peak = _run(servers, test, max_concurrency=2)
+
+    assert all(response.status_code == 200 for response in responses)
+    assert peak == 2
+    assert elapsed >= 0.3
+
+
+def test_scheduler_limits_apply(servers):
+    scheduler = Scheduler(HostLimits(max_concurrency=1))
+
+    async def test(requestor, url):
+        start = time.monotonic()
+        responses = await asyncio.gather(*(requestor.get(f"{url}?latency=0.1") for _ in range(3)))
+
+        return responses, time.monotonic() - start
+
+    responses, elapsed = _run(servers, test, scheduler=scheduler)
+
+    assert all(response.status_code == 200 for response in responses)
+    assert elapsed >= 0.3
+    assert scheduler.snapshot()["counts"]["admitted"] == 3
+    assert scheduler.snapshot()["hosts"]["127.0.0.1"] == {"active": 0, "queued": 0}
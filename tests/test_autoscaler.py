@@ -0,0 +1,112 @@
+"""Autoscaler tests."""
+
+from types import SimpleNamespace
+
+from pydantic import ValidationError
+import pytest
+from requests_whaor.autoscaler import Autoscaler, AutoscalerOptions, LoadSignals
+from requests_whaor.metrics import RequestEvent, RequestorMetrics
+
+
+class StubRequestor:
+    def __init__(self, onion_count=2, sessions=0, queue=0):
+        self.onions = [object() for _ in range(onion_count)]
+        self.metrics = RequestorMetrics()
+        self.scaled = []
+        self.sessions = sessions
+        self.queue = queue
+
+    @property
+    def onion_balancer(self):
+        row = SimpleNamespace(sessions=self.sessions, connect_time=10)
+        stats = SimpleNamespace(
+            servers={f"onion-{i}": row for i in range(len(self.onions))},
+            backend=SimpleNamespace(queue=self.queue),
+        )
+
+        return SimpleNamespace(stats=lambda max_age: stats)
+
+    def scale_to(self, onion_count):
+        self.scaled.append(onion_count)
+        self.onions = [object() for _ in range(onion_count)]
+
+
+def _signals(**fields):
+    values = {
+        "onion_count": 4,
+        "queue": 0,
+        "sessions_per_onion": 4,
+        "connect_time": 10,
+        "latency": 5,
+        "error_rate": 0,
+        "completed": 10,
+    }
+    values.update(fields)
+
+    return LoadSignals(**values)
+
+
+def test_options_bounds_are_validated():
+    with pytest.raises(ValidationError):
+        AutoscalerOptions(min_onions=5, max_onions=2)
+
+
+def test_decide():
+    autoscaler = Autoscaler(StubRequestor(), AutoscalerOptions())
+
+    assert autoscaler.decide(_signals()) == 0
+    assert autoscaler.decide(_signals(queue=1)) == 1
+    assert autoscaler.decide(_signals(latency=20)) == 1
+    assert autoscaler.decide(_signals(error_rate=0.5)) == 1
+    assert autoscaler.decide(_signals(sessions_per_onion=1, latency=1)) == -1
+
+
+def test_decide_only_scales_down_a_healthy_pool():
+    autoscaler = Autoscaler(StubRequestor(), AutoscalerOptions())
+    idle = {"sessions_per_onion": 1, "latency": 1}
+
+    assert autoscaler.decide(_signals(**idle, error_rate=0.1)) == 0
+    assert autoscaler.decide(_signals(**idle, connect_time=300)) == 0
+    assert autoscaler.decide(_signals(**idle, error_rate=0.01, connect_time=100)) == -1
+
+
+def test_decide_ignores_stale_averages_when_idle():
+    autoscaler = Autoscaler(StubRequestor(), AutoscalerOptions())
+
+    assert autoscaler.decide(_signals(latency=20, error_rate=1, completed=0)) == 0
+    assert autoscaler.decide(_signals(sessions_per_onion=0, latency=20, completed=0)) == -1
+
+
+def test_target_is_bounded():
+    autoscaler = Autoscaler(StubRequestor(), AutoscalerOptions(min_onions=2, max_onions=5))
+
+    assert autoscaler.target(_signals(onion_count=2), 1) == 3
+    assert autoscaler.target(_signals(onion_count=4), 1) == 5
+    assert autoscaler.target(_signals(onion_count=3), -1) == 2
+    assert autoscaler.target(_signals(onion_count=2), -1) == 2
+
+
+def test_check_scales_after_consecutive_checks():
+    requestor = StubRequestor(onion_count=2, queue=3)
+    options = AutoscalerOptions(max_onions=4, consecutive_checks=2, scale_up_cooldown=0)
+    autoscaler = Autoscaler(requestor, options)
+
+    autoscaler.check()
+    assert requestor.scaled == []
+
+    autoscaler.check()
+    assert requestor.scaled == [3]
+
+
+def test_check_ignores_latency_without_traffic():
+    requestor = StubRequestor(onion_count=2, sessions=4)
+    options = AutoscalerOptions(consecutive_checks=1, scale_up_cooldown=0)
+    autoscaler = Autoscaler(requestor, options)
+
+    requestor.metrics.record(RequestEvent(url="http://example.com/", status_code=200, total=30))
+
+    autoscaler.check()
+    assert requestor.scaled == [3]
+
+    autoscaler.check()
+    assert requestor.scaled == [3]
@@ -0,0 +1,162 @@
+"""Balancer statistics tests."""
+
+from pydantic import ValidationError
+import pytest
+from requests_whaor.balancer import Balancer, HAProxyOptions
+from requests_whaor.client import ContainerOptions
+from requests_whaor.mount import MountFile
+from requests_whaor.runtime import ContainerHandle
+
+SHOW_STAT = """# pxname,svname,qcur,qmax,scur,smax,stot,bin,bout,econ,eresp,wretr,wredis,status,lastchg,check_status,ctime,rtime,ttime,qtime
+onions,FRONTEND,,,3,5,40,1000,2000,,,,,OPEN,,,,,,
+onions,onion-a,0,0,1,2,20,500,900,0,0,0,0,UP,120,L4OK,35,0,900,0
+onions,onion-b,0,0,2,3,20,500,1100,4,1,2,0,UP 1/3,5,L4TOUT,250,0,1200,0
+onions,spare1,0,0,0,0,0,0,0,0,0,0,0,MAINT,300,,0,0,0,0
+onions,BACKEND,2,4,3,5,40,1000,2000,4,1,2,0,UP,120,,142,0,1050,3
+"""
+
+
+def _balancer(monkeypatch):
+    monkeypatch.setattr(Balancer, "runtime_command", lambda self, command: SHOW_STAT)
+
+    return Balancer(
+        haproxy_options=HAProxyOptions(onions=[]),
+        servers={"onion-a": "onion-a", "onion-b": "onion-b", "spare1": None},
+    )
+
+
+def test_server_stats_are_typed(monkeypatch):
+    servers = _balancer(monkeypatch).server_stats()
+
+    onion = servers["onion-b"]
+
+    assert onion.onion == "onion-b"
+    assert onion.sessions == 2
+    assert onion.connect_time == 250
+    assert onion.connection_errors == 4
+    assert onion.bytes_out == 1100
+    assert onion.is_up
+    assert servers["spare1"].onion is None
+    assert not servers["spare1"].is_up
+    assert servers["FRONTEND"].queue == 0
+
+
+def test_stats_are_keyed_by_onion_and_cached(monkeypatch):
+    balancer = _balancer(monkeypatch)
+    stats = balancer.stats()
+
+    assert set(stats.servers) == {"onion-a", "onion-b"}
+    assert stats.backend.queue == 2
+    assert stats.slowest()[0].onion == "onion-b"
+    assert balancer.stats(max_age=60) is stats
+    assert balancer.stats(max_age=0) is not stats
+
+
+def test_config_routes_to_onion_addresses():
+    onion = ContainerHandle("onion-a", ContainerOptions(), {})
+    options = HAProxyOptions(
+        onions=[onion], addresses={"onion-a": "127.0.0.1:20000"}, bind_interface="127.0.0.1"
+    )
+    mount = MountFile(
+        template_name="haproxy.cfg",
+        target_path="/haproxy.cfg",
+        template_variables=options.template_variables(),
+    )
+
+    config = mount._render_template()
+
+    assert "server onion-a 127.0.0.1:20000 check" in config
+    assert "bind 127.0.0.1:8001" in config
+    assert "stats socket ipv4@127.0.0.1:9998" in config
+
+
+def test_each_socks_port_is_its_own_server():
+    onion = ContainerHandle("onion-a", ContainerOptions(), {})
+    options = HAProxyOptions(
+        onions=[onion],
+        circuits_per_onion=2,
+        addresses={"onion-a-2": "127.0.0.1:20001"},
+        spare_slots=2,
+    )
+    mount = MountFile(
+        template_name="haproxy.cfg",
+        target_path="/haproxy.cfg",
+        template_variables=options.template_variables(),
+    )
+
+    config = mount._render_template()
+
+    assert "server onion-a-1 onion-a:9050 check" in config
+    assert "server onion-a-2 127.0.0.1:20001 check" in config
+    assert options.servers == {
+        "onion-a-1": "onion-a",
+        "onion-a-2": "onion-a",
+        "spare1": None,
+        "spare2": None,
+    }
+
+
+def _config(**options):
+    onion = ContainerHandle("onion-a", ContainerOptions(), {})
+    mount = MountFile(
+        template_name="haproxy.cfg",
+        target_path="/haproxy.cfg",
+        template_variables=HAProxyOptions(onions=[onion], **options).template_variables(),
+    )
+
+    return mount._render_template()
+
+
+def test_config_balance_and_checks():
+    config = _config()
+
+    assert "balance roundrobin\n" in config
+    assert "default-server inter 2000ms rise 2 fall 3" in config
+    assert "tcp-check" not in config
+
+    config = _config(balance="random", random_draws=3, check_interval=500, check_fall=5)
+
+    assert "balance random(3)\n" in config
+    assert "default-server inter 500ms rise 2 fall 5" in config
+
+
+def test_config_socks_check():
+    config = _config(socks_check=True, socks_check_host="example.com", socks_check_port=80)
+    connect_request = "050100030b" + b"example.com".hex() + "0050"
+
+    assert "option tcp-check" in config
+    assert "timeout check 10s" in config
+    assert "tcp-check send-binary 050100\n" in config
+    assert f"tcp-check send-binary {connect_request}\n" in config
+    assert config.count("tcp-check expect rbinary ^0500") == 2
+
+
+def test_unsupported_balance_is_refused():
+    with pytest.raises(ValidationError):
+        HAProxyOptions(onions=[], balance="uri")
+
+
+def test_servers_are_added_and_removed_per_port(monkeypatch):
+    commands = []
+    monkeypatch.setattr(
+        Balancer, "runtime_command", lambda self, command: commands.append(command) or ""
+    )
+    monkeypatch.setattr(Balancer, "wait_until_up", lambda self, server, timeout: True)
+    monkeypatch.setattr(Balancer, "wait_until_drained", lambda self, server, timeout: True)
+
+    balancer = Balancer(
+        haproxy_options=HAProxyOptions(onions=[], circuits_per_onion=2),
+        servers={"spare1": None, "spare2": None, "spare3": None},
+    )
+
+    servers = balancer.add_servers("onion-b", [("10.0.0.2", 9050), ("10.0.0.2", 9051)], 1)
+
+    assert servers == ["spare1", "spare2"]
+    assert "set server onions/spare2 addr 10.0.0.2 port 9051" in commands
+    assert balancer.server_names("onion-b") == ["spare1", "spare2"]
+
+    with pytest.raises(ValueError):
+        balancer.add_servers("onion-c", [("10.0.0.3", 9050), ("10.0.0.3", 9051)], 1)
+
+    assert balancer.remove_servers("onion-b", 1) == ["spare1", "spare2"]
+    assert set(balancer.servers.values()) == {None}
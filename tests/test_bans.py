@@ -0,0 +1,115 @@
+"""Ban detection and quarantine tests."""
+
+from http.server import BaseHTTPRequestHandler
+
+from benchmarks.servers import serve, SOCKS5Server
+import requests
+from requests_whaor.bans import BodyBanDetector, Quarantine, StatusBanDetector
+from requests_whaor.core import Requestor
+from requests_whaor.routing import CircuitRouter
+
+
+def _response(status_code=200, content=b""):
+    response = requests.models.Response()
+    response.status_code = status_code
+    response._content = content
+    response.encoding = "utf-8"
+    response._content_consumed = True
+
+    return response
+
+
+class StubOnion:
+    def __init__(self, name, address="socks5://127.0.0.1:9050"):
+        self.container_name = name
+        self.address = address
+        self.proxies = {"http": address, "https": address}
+        self.renewed = 0
+
+    def renew_identity(self):
+        self.renewed += 1
+        return True
+
+
+def test_detectors():
+    assert StatusBanDetector().detect(_response(403)) == "403"
+    assert StatusBanDetector().detect(_response(404)) is None
+
+    detector = BodyBanDetector()
+    captcha = b"<h1>Please solve this CAPTCHA</h1>"
+    assert detector.detect(_response(503, captcha)) == "captcha"
+    assert detector.detect(_response(503, b"<h1>Welcome</h1>")) is None
+    assert detector.detect(_response(content=b"<p>How captcha solvers work</p>")) is None
+    assert BodyBanDetector(statuses=None).detect(_response(content=captcha)) == "captcha"
+
+    streamed = _response(503, b"captcha")
+    streamed._content_consumed = False
+    assert detector.detect(streamed) is None
+
+
+def test_quarantine_is_per_host():
+    quarantine = Quarantine(duration=60)
+    quarantine.ban("onion-a", "https://Example.com/page", "403")
+
+    assert quarantine.banned("https://example.com/other") == {"onion-a"}
+    assert quarantine.banned("https://other.com/") == set()
+    assert quarantine.snapshot()["counts"] == {"403": 1}
+
+    quarantine.duration = 0
+    quarantine.ban("onion-a", "https://other.com/")
+    assert quarantine.banned("https://other.com/") == set()
+
+
+def test_router_avoids_excluded_onions():
+    onions = [StubOnion(name) for name in ("a", "b", "c")]
+    router = CircuitRouter(onions)
+
+    for _ in range(20):
+        assert router.pick(exclude={"a", "b"}).container_name == "c"
+
+    assert router.pick(exclude={"a", "b", "c"}) in onions
+
+
+class BanFirstHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    sent = 0
+
+    def do_GET(self):  # noqa: N802
+        type(self).sent += 1
+        status = 403 if self.sent == 1 else 200
+
+        self.send_response(status)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+def test_requestor_quarantines_and_renews_the_banned_onion(servers):
+    proxy, target = servers
+    target.RequestHandlerClass = BanFirstHandler
+    other = SOCKS5Server()
+    serve(other)
+
+    onions = [StubOnion("onion-a", proxy.address), StubOnion("onion-b", other.address)]
+    quarantine = Quarantine()
+    requestor = Requestor(
+        onions=onions, onion_balancer=None, timeout=5, max_retries=3, quarantine=quarantine
+    )
+
+    try:
+        response = requestor.get(target.url)
+
+    finally:
+        requestor.close()
+        other.shutdown()
+
+    assert requestor.router is not None
+    assert response.ok
+    assert response.retry_reasons == ["banned:403"]
+    assert sorted(onion.renewed for onion in onions) == [0, 1]
+
+    banned = next(onion for onion in onions if onion.renewed)
+    assert quarantine.banned(target.url) == {banned.container_name}
@@ -0,0 +1,40 @@
+"""Offline benchmark harness smoke tests."""
+
+from benchmarks.run import compare, run, SCENARIOS
+
+
+def test_benchmarks_run_offline():
+    scenarios = [scenario for scenario in SCENARIOS if scenario.name in ("fast", "errors")]
+    results = run(scenarios, concurrency_levels=[2], count=20, trace_memory=False)
+
+    assert [result["scenario"] for result in results["results"]] == ["fast", "errors"]
+
+    for result in results["results"]:
+        assert result["succeeded"] == 20
+        assert result["latency"]["p50"] <= result["latency"]["p99"]
+
+
+def _results(throughput, p99):
+    return {
+        "results": [
+            {
+                "scenario": "fast",
+                "concurrency": 1,
+                "throughput": throughput,
+                "latency": {"p99": p99},
+            }
+        ]
+    }
+
+
+def test_compare_flags_regressions():
+    assert compare(_results(100, 0.01), _results(100, 0.01), threshold=0.2) == []
+    assert len(compare(_results(50, 0.02), _results(100, 0.01), threshold=0.2)) == 2
+
+
+def test_compare_reports_missing_baselines_as_not_applicable(capsys):
+    assert compare(_results(100, 0.01), _results(0, None), threshold=0.2) == []
+    assert compare(_results(0, None), _results(100, 0.01), threshold=0.2) == [
+        "fast c=1 throughput dropped 100.0%."
+    ]
+    assert capsys.readouterr().out.count("n/a") == 3
@@ -0,0 +1,160 @@
+"""Response cache tests."""
+
+from http.server import BaseHTTPRequestHandler
+import sqlite3
+
+import pytest
+import requests
+from requests_whaor.cache import CacheEntry, MemoryStore, parse_cache_control, ResponseCache
+from requests_whaor.core import Requestor
+
+
+def _response(status_code=200, content=b"body", **headers):
+    response = requests.models.Response()
+    response.status_code = status_code
+    response.headers = requests.structures.CaseInsensitiveDict(headers)
+    response._content = content
+    response.url = "http://example.com/"
+
+    return response
+
+
+def _entry(content=b"x" * 10):
+    return CacheEntry(
+        url="http://example.com/",
+        status_code=200,
+        headers={},
+        content=content,
+        stored_at=0,
+        expires_at=0,
+    )
+
+
+def test_parse_cache_control():
+    assert parse_cache_control('max-age=60, No-Cache, private="set-cookie"') == {
+        "max-age": "60",
+        "no-cache": None,
+        "private": "set-cookie",
+    }
+
+
+def test_freshness():
+    cache = ResponseCache()
+
+    assert cache.freshness(_response(**{"Cache-Control": "max-age=60", "Age": "10"}), None) == 50
+    assert cache.freshness(_response(**{"Cache-Control": "no-cache, max-age=60"}), None) == 0
+    assert cache.freshness(_response(**{"Cache-Control": "max-age=60"}), ttl=5) == 5
+    assert cache.freshness(_response(**{"Cache-Control": "max-age=60", "Age": "soon"}), None) == 60
+    assert cache.freshness(_response(Expires="0"), None) == 0
+
+    heuristic = _response(
+        Date="Mon, 11 Jan 2021 00:00:00 GMT", **{"Last-Modified": "Fri, 01 Jan 2021 00:00:00 GMT"}
+    )
+    assert cache.freshness(heuristic, None) == 86400
+
+
+def test_store_respects_headers():
+    cache = ResponseCache()
+
+    assert cache.store("a", _response(**{"Cache-Control": "max-age=60"}), {})
+    assert not cache.store("b", _response(**{"Cache-Control": "no-store, max-age=60"}), {})
+    assert not cache.store("c", _response(500, **{"Cache-Control": "max-age=60"}), {})
+    assert not cache.store("d", _response(), {})
+    assert cache.store("e", _response(ETag='"v1"'), {})
+    assert not cache.get("e").is_fresh()
+    assert cache.get("e").validators == {"If-None-Match": '"v1"'}
+
+
+def test_vary():
+    cache = ResponseCache()
+    response = _response(Vary="Accept", **{"Cache-Control": "max-age=60"})
+    cache.store("a", response, {"accept": "text/html"})
+
+    assert cache.get("a").matches({"Accept": "text/html"})
+    assert not cache.get("a").matches({"Accept": "application/json"})
+
+
+def test_memory_store_evicts_least_recently_used():
+    store = MemoryStore(max_bytes=25)
+    store.set("a", _entry())
+    store.set("b", _entry())
+    store.get("a")
+    store.set("c", _entry())
+
+    assert store.get("a") is not None
+    assert store.get("b") is None
+    assert store.size == 20
+
+    store.set("big", _entry(b"x" * 100))
+    assert store.get("big") is None
+
+
+def test_disk_tier_survives_restarts(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResponseCache(path=path)
+    cache.store("a", _response(content=b"\x00bytes", **{"Cache-Control": "max-age=60"}), {})
+    cache.close()
+
+    cache = ResponseCache(path=path)
+    entry = cache.get("a")
+
+    assert entry.content == b"\x00bytes"
+    assert entry.is_fresh()
+    assert len(cache.memory) == 1
+
+
+class ETagHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    sent = []
+
+    def do_GET(self):  # noqa: N802
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.sent.append(304)
+            self.send_response(304)
+            self.send_header("ETag", '"v1"')
+            self.send_header("Cache-Control", "max-age=60")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.sent.append(200)
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Content-Length", "4")
+        self.end_headers()
+        self.wfile.write(b"page")
+
+    def log_message(self, *args):
+        pass
+
+
+def test_requestor_revalidates_through_the_proxy(tmp_path, servers):
+    proxy, target = servers
+    target.RequestHandlerClass = ETagHandler
+
+    cache = ResponseCache(path=str(tmp_path / "cache.sqlite"))
+    requestor = Requestor(onions=[], onion_balancer=proxy, timeout=5, max_retries=1, cache=cache)
+
+    try:
+        first = requestor.get(target.url)
+        second = requestor.get(target.url)
+        third = requestor.get(target.url)
+
+    finally:
+        requestor.close()
+
+    assert ETagHandler.sent == [200, 304]
+    assert (first.from_cache, second.from_cache, third.from_cache) == (False, True, True)
+    assert first.text == second.text == third.text == "page"
+    assert second.status_code == 200
+    assert cache.counts.snapshot() == {
+        "miss": 1,
+        "stored": 1,
+        "stale": 1,
+        "revalidated": 1,
+        "hit": 1,
+    }
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        cache.disk._connection.execute("SELECT 1")
@@ -0,0 +1,108 @@
+"""Single flight coalescing tests."""
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import pytest
+from requests_whaor.coalesce import request_key, SingleFlight
+from requests_whaor.core import Requestor
+
+
+def test_request_key():
+    key = request_key("GET", "http://example.com/", {"params": {"a": 1}})
+
+    assert key == request_key("GET", "http://example.com/?a=1", {})
+    assert key != request_key("GET", "http://example.com/", {"params": {"a": 2}})
+    assert request_key("GET", "http://example.com/", {"headers": {"Accept": "text/html"}}) == (
+        request_key("GET", "http://example.com/", {"headers": {"accept": "text/html"}})
+    )
+    assert key != request_key("GET", "http://example.com/?a=1", {"headers": {"Range": "0-1"}})
+    assert request_key("GET", "http://example.com/", {"stream": True}) is None
+    assert request_key("GET", "http://example.com/", {"data": b"a"}) is None
+    assert request_key("GET", "http://example.com/", {"allow_redirects": False}) != (
+        request_key("GET", "http://example.com/", {})
+    )
+    assert request_key("GET", "http://example.com/", {"verify": False}) != (
+        request_key("GET", "http://example.com/", {"verify": True})
+    )
+
+
+def _concurrently(single_flight, function, callers=8):
+    """Call function through the single flight from callers threads at once."""
+    barrier = threading.Barrier(callers)
+
+    def call(_):
+        barrier.wait()
+        return single_flight.do("key", function)
+
+    with ThreadPoolExecutor(max_workers=callers) as executor:
+        return [executor.submit(call, caller) for caller in range(callers)]
+
+
+def test_concurrent_calls_share_one_result():
+    single_flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return object()
+
+    timer = threading.Timer(0.2, release.set)
+    timer.start()
+    results = [future.result() for future in _concurrently(single_flight, slow)]
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert single_flight.counts.snapshot() == {"executed": 1, "coalesced": 7}
+    assert single_flight.in_flight == 0
+
+    single_flight.do("key", slow)
+    assert len(calls) == 2
+
+
+def test_concurrent_calls_share_one_failure():
+    single_flight = SingleFlight()
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise ValueError("failed")
+
+    threading.Timer(0.2, release.set).start()
+
+    for future in _concurrently(single_flight, failing, callers=4):
+        with pytest.raises(ValueError):
+            future.result()
+
+    assert single_flight.in_flight == 0
+
+
+def test_requestor_coalesces_identical_gets(servers):
+    proxy, target = servers
+
+    single_flight = SingleFlight()
+    requestor = Requestor(
+        onions=[], onion_balancer=proxy, timeout=5, max_retries=1, single_flight=single_flight
+    )
+    url = f"{target.url}?latency=0.3"
+
+    try:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            responses = list(executor.map(lambda _: requestor.get(url), range(4)))
+
+        other = requestor.get(url, params={"size": 4})
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            sticky = list(executor.map(lambda key: requestor.get(url, sticky_key=key), "ab"))
+
+    finally:
+        requestor.close()
+
+    assert all(response is responses[0] for response in responses)
+    assert responses[0].ok
+    assert other.content == b"xxxx"
+    assert sticky[0] is not sticky[1]
+    assert single_flight.counts.snapshot() == {"executed": 2, "coalesced": 3}
+    assert requestor.metrics.snapshot()["statuses"] == {"200": 4}
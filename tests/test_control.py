@@ -0,0 +1,50 @@
+"""TOR control protocol tests."""
+
+import socket
+import threading
+
+import pytest
+from requests_whaor.control import ControlError, hash_password, TorController
+
+
+def test_hash_password_format():
+    hashed = hash_password("secret", salt=bytes(8))
+
+    assert hashed.startswith("16:" + "00" * 8 + "60")
+    assert len(hashed) == 3 + 18 + 40
+    assert hashed == hash_password("secret", salt=bytes(8))
+    assert hashed != hash_password("other", salt=bytes(8))
+
+
+def serve_control_port(replies):
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+    received = []
+
+    def handle():
+        connection, _ = server.accept()
+        with connection, connection.makefile("rwb") as stream:
+            for reply in replies:
+                received.append(stream.readline().decode().strip())
+                stream.write(reply.encode())
+                stream.flush()
+        server.close()
+
+    threading.Thread(target=handle, daemon=True).start()
+    return server.getsockname()[1], received
+
+
+def test_controller_signal():
+    port, received = serve_control_port(["250 OK\r\n", "250 OK\r\n", "250 closing connection\r\n"])
+
+    TorController("127.0.0.1", port, 'pass"word').signal("NEWNYM")
+
+    assert received == ['AUTHENTICATE "pass\\"word"', "SIGNAL NEWNYM", "QUIT"]
+
+
+def test_controller_bad_password():
+    port, _ = serve_control_port(["515 Authentication failed: Password did not match\r\n"])
+
+    with pytest.raises(ControlError):
+        TorController("127.0.0.1", port, "wrong").signal("NEWNYM")
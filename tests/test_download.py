@@ -0,0 +1,185 @@
+"""Parallel download tests."""
+
+from http.server import BaseHTTPRequestHandler
+import io
+import time
+
+import pytest
+import requests
+from requests_whaor.core import Requestor
+from requests_whaor.download import ParallelDownload
+from requests_whaor.stream import StreamError
+
+BODY = bytes(range(256)) * 4096
+
+
+class SlowRaw(io.BytesIO):
+    """Raw body which stalls before its first read."""
+
+    def __init__(self, content, stall=0.0):
+        super().__init__(content)
+        self.stall = stall
+
+    def read(self, size=-1):
+        time.sleep(self.stall)
+        self.stall = 0.0
+        return super().read(size)
+
+
+def _ranged_send(body=BODY, etag='"v1"', stall_at=None, sent=None, last_modified=None):
+    def send(headers):
+        first, last = headers["Range"][len("bytes=") :].split("-")
+        first, last = int(first), min(int(last), len(body) - 1)
+
+        if sent is not None:
+            sent.append(headers["Range"])
+
+        response = requests.models.Response()
+        response.status_code = 206
+        response.headers = requests.structures.CaseInsensitiveDict(
+            {"Content-Range": f"bytes {first}-{last}/{len(body)}"}
+        )
+
+        if etag is not None:
+            response.headers["ETag"] = etag
+
+        if last_modified is not None:
+            response.headers["Last-Modified"] = last_modified
+        stall = 1.0 if first == stall_at and headers["Range"] not in sent[:-1] else 0.0
+        response.raw = SlowRaw(body[first : last + 1], stall)
+        response.url = "http://example.com/file"
+
+        return response
+
+    return send
+
+
+def test_split_covers_the_file():
+    download = ParallelDownload("http://example.com/file", None, parts=4, min_part_size=100)
+
+    segments = download.split(1001)
+
+    assert [(segment.start, segment.end) for segment in segments] == [
+        (0, 250),
+        (251, 501),
+        (502, 752),
+        (753, 1000),
+    ]
+    assert len(download.split(150)) == 2
+    assert download.split(0) == []
+
+
+def test_download_writes_every_part(tmp_path):
+    sent = []
+    download = ParallelDownload(
+        "http://example.com/file", _ranged_send(sent=sent), parts=4, min_part_size=1024
+    )
+    path = tmp_path / "file.bin"
+
+    report = download.run(path)
+
+    assert path.read_bytes() == BODY
+    assert report.size == len(BODY)
+    assert report.parts == 4
+    assert report.reassigned == 0
+    assert report.throughput > 0
+    assert sent[0] == "bytes=0-0"
+
+
+def test_stalled_part_is_reassigned(tmp_path):
+    sent = []
+    send = _ranged_send(stall_at=len(BODY) // 2, sent=sent)
+    download = ParallelDownload(
+        "http://example.com/file", send, parts=2, min_part_size=1024, stall_timeout=0.2
+    )
+    path = tmp_path / "file.bin"
+
+    started = time.monotonic()
+    report = download.run(path)
+
+    assert path.read_bytes() == BODY
+    assert report.reassigned == 1
+    assert sent.count(f"bytes={len(BODY) // 2}-{len(BODY) - 1}") == 2
+    assert time.monotonic() - started < 10
+
+
+def test_download_refuses_a_changed_file(tmp_path):
+    etags = iter(['"v1"'] + ['"v2"'] * 10)
+
+    def send(headers):
+        return _ranged_send(etag=next(etags))(headers)
+
+    download = ParallelDownload("http://example.com/file", send, parts=2, min_part_size=1024)
+
+    with pytest.raises(StreamError):
+        download.run(tmp_path / "file.bin")
+
+
+MONDAY, TUESDAY = "Mon, 01 Jan 2024 00:00:00 GMT", "Tue, 02 Jan 2024 00:00:00 GMT"
+
+
+@pytest.mark.parametrize(
+    "first, changed, if_range",
+    [
+        ({}, {"body": BODY + b"more"}, None),
+        ({"last_modified": MONDAY}, {"last_modified": TUESDAY}, MONDAY),
+    ],
+)
+def test_download_without_etag_refuses_a_changed_file(tmp_path, first, changed, if_range):
+    versions = iter([first] + [changed] * 10)
+    sent = []
+
+    def send(headers):
+        sent.append(headers)
+        return _ranged_send(etag=None, **next(versions))(headers)
+
+    download = ParallelDownload("http://example.com/file", send, parts=2, min_part_size=1024)
+
+    with pytest.raises(StreamError):
+        download.run(tmp_path / "file.bin")
+
+    assert sent[1].get("If-Range") == if_range
+
+
+class NoRangeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # noqa: N802
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+class RangeHandler(NoRangeHandler):
+    def do_GET(self):  # noqa: N802
+        requested = self.headers["Range"][len("bytes=") :]
+        first, last = (int(value) for value in requested.split("-"))
+
+        self.send_response(206)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Range", f"bytes {first}-{last}/{len(BODY)}")
+        self.send_header("Content-Length", str(last + 1 - first))
+        self.end_headers()
+        self.wfile.write(BODY[first : last + 1])
+
+
+@pytest.mark.parametrize("handler, parts", [(RangeHandler, 3), (NoRangeHandler, 1)])
+def test_requestor_downloads_through_the_proxy(tmp_path, handler, parts, servers):
+    proxy, target = servers
+    target.RequestHandlerClass = handler
+
+    requestor = Requestor(onions=[], onion_balancer=proxy, timeout=5, max_retries=2)
+    path = tmp_path / "file.bin"
+
+    try:
+        report = requestor.download(target.url, path, parts=3, min_part_size=1024)
+
+    finally:
+        requestor.close()
+
+    assert path.read_bytes() == BODY
+    assert report.parts == parts
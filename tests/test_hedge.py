@@ -0,0 +1,150 @@
+"""Hedged request tests."""
+
+from http.server import BaseHTTPRequestHandler
+import threading
+import time
+
+from requests_whaor.core import Requestor
+from requests_whaor.hedge import HedgePolicy
+from requests_whaor.scheduler import HostLimits, Scheduler
+
+
+def test_delay_waits_for_enough_samples():
+    policy = HedgePolicy(quantile=0.5, min_delay=0.01, min_samples=10)
+
+    for _ in range(9):
+        policy.observe("http://example.com/a", 0.2)
+
+    assert policy.delay("http://example.com/b") is None
+
+    policy.observe("http://example.com/a", 0.2)
+
+    assert 0.1 < policy.delay("http://EXAMPLE.com/b") <= 0.25
+    assert policy.delay("http://other.com/") is None
+
+
+def test_delay_is_bounded():
+    policy = HedgePolicy(quantile=0.99, min_delay=0.5, max_delay=2, min_samples=1)
+
+    policy.observe("http://example.com/", 0.01)
+    assert policy.delay("http://example.com/") == 0.5
+
+    for _ in range(100):
+        policy.observe("http://example.com/", 20)
+
+    assert policy.delay("http://example.com/") == 2
+
+
+def test_budget_caps_hedges():
+    policy = HedgePolicy(budget_ratio=0.5, budget_burst=1)
+
+    assert policy.try_hedge()
+    assert not policy.try_hedge()
+
+    policy.delay("http://example.com/")
+    policy.delay("http://example.com/")
+
+    assert policy.try_hedge()
+    assert policy.counts.snapshot() == {"fired": 2, "skipped": 1}
+
+
+class SlowOnceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    lock = threading.Lock()
+    slow = False
+
+    def do_GET(self):  # noqa: N802
+        with self.lock:
+            slow, SlowOnceHandler.slow = SlowOnceHandler.slow, False
+
+        if slow:
+            time.sleep(2)
+
+        self.send_response(200)
+        self.send_header("Content-Length", "4")
+        self.end_headers()
+        self.wfile.write(b"fast" if not slow else b"slow")
+
+    def log_message(self, *args):
+        pass
+
+
+def test_slow_attempt_is_hedged(servers):
+    proxy, target = servers
+    target.RequestHandlerClass = SlowOnceHandler
+
+    hedge = HedgePolicy(quantile=0.5, min_delay=0.05, min_samples=3)
+    requestor = Requestor(onions=[], onion_balancer=proxy, timeout=5, max_retries=1, hedge=hedge)
+
+    try:
+        for _ in range(3):
+            assert requestor.get(target.url).ok
+
+        caller = requestor.sessions.session()
+        caller_get, borrowed = caller.get, []
+
+        def get(*args, **kwargs):
+            borrowed.append(threading.current_thread())
+            return caller_get(*args, **kwargs)
+
+        caller.get = get
+
+        SlowOnceHandler.slow = True
+        start = time.monotonic()
+        response = requestor.get(target.url)
+        elapsed = time.monotonic() - start
+
+    finally:
+        requestor.close()
+
+    assert response.text == "fast"
+    assert elapsed < 1.5
+    assert borrowed == []
+    assert hedge.counts.snapshot() == {"fired": 1, "won": 1}
+
+
+def test_hedge_is_skipped_without_a_free_scheduler_slot(servers):
+    proxy, target = servers
+    target.RequestHandlerClass = SlowOnceHandler
+
+    hedge = HedgePolicy(quantile=0.5, min_delay=0.05, min_samples=3)
+    scheduler = Scheduler(HostLimits(max_concurrency=1))
+    requestor = Requestor(
+        onions=[],
+        onion_balancer=proxy,
+        timeout=5,
+        max_retries=1,
+        hedge=hedge,
+        scheduler=scheduler,
+    )
+
+    try:
+        for _ in range(3):
+            assert requestor.get(target.url).ok
+
+        SlowOnceHandler.slow = True
+        response = requestor.get(target.url)
+
+    finally:
+        requestor.close()
+
+    assert response.text == "slow"
+    assert hedge.counts.snapshot() == {"busy": 1}
+    assert scheduler.snapshot()["counts"]["admitted"] == 4
+    assert scheduler.snapshot()["hosts"]["127.0.0.1"] == {"active": 0, "queued": 0}
+
+
+def test_try_slot_keeps_the_queue_order():
+    scheduler = Scheduler(HostLimits(max_concurrency=1))
+
+    slot = scheduler.try_slot("http://example.com/")
+    assert slot is not None
+    assert scheduler.try_slot("http://example.com/") is None
+
+    slot.release()
+    slot.release()
+
+    with scheduler.try_slot("http://example.com/"):
+        assert scheduler.snapshot()["hosts"]["example.com"]["active"] == 1
+
+    assert scheduler.snapshot()["hosts"]["example.com"]["active"] == 0
@@ -0,0 +1,95 @@
+"""Request metrics tests."""
+
+import time
+
+from requests_whaor.metrics import Ewma, Histogram, PhaseTimings, RequestEvent, RequestorMetrics
+
+
+def test_ewma():
+    ewma = Ewma(alpha=0.5)
+
+    assert ewma.value is None
+    assert ewma.update(2) == 2
+    assert ewma.update(4) == 3
+
+
+def test_histogram_quantiles():
+    histogram = Histogram(buckets=(1, 2, 4))
+
+    assert histogram.quantile(0.5) is None
+
+    for value in (0.5, 1.5, 1.5, 3):
+        histogram.observe(value)
+
+    assert histogram.count == 4
+    assert histogram.sum == 6.5
+    assert histogram.cumulative_counts() == [1, 3, 4, 4]
+    assert 1 <= histogram.quantile(0.5) <= 2
+    assert 2 <= histogram.quantile(0.99) <= 4
+
+
+def test_histogram_quantile_skips_leading_empty_buckets():
+    histogram = Histogram(buckets=(1, 2, 4))
+    histogram.observe(3)
+
+    assert histogram.quantile(0) == 2
+    assert 2 <= histogram.quantile(0.5) <= 4
+
+
+def test_histogram_overflow_uses_largest_bound():
+    histogram = Histogram(buckets=(1, 2))
+    histogram.observe(100)
+
+    assert histogram.quantile(0.99) == 2
+
+
+def test_requestor_metrics_snapshot_and_sinks():
+    metrics = RequestorMetrics()
+    events = []
+    metrics.add_sink(events.append)
+
+    metrics.record(
+        RequestEvent(url="http://a", status_code=200, ttfb=0.1, total=0.2, received_bytes=5)
+    )
+    metrics.record(RequestEvent(url="http://a", error="ProxyError", total=1.0))
+    metrics.record_retry("ProxyError")
+
+    snapshot = metrics.snapshot()
+
+    assert len(events) == 2
+    assert snapshot["statuses"] == {"200": 1}
+    assert snapshot["failures"] == {"ProxyError": 1}
+    assert snapshot["retries"] == {"ProxyError": 1}
+    assert snapshot["received_bytes"] == 5
+    assert snapshot["latency"]["total"]["count"] == 2
+    assert snapshot["latency"]["connect"]["count"] == 0
+
+
+def test_prometheus_text():
+    metrics = RequestorMetrics(buckets=(1,))
+    metrics.record(RequestEvent(url="http://a", status_code=404, total=0.5))
+
+    text = metrics.to_prometheus()
+
+    assert 'whaor_request_duration_seconds_bucket{phase="total",le="+Inf"} 1' in text
+    assert 'whaor_responses_total{status="404"} 1' in text
+    assert "whaor_requests_in_flight 0" in text
+
+
+def test_phase_timings():
+    timings = PhaseTimings()
+
+    with timings.phase("network"):
+        time.sleep(0.01)
+
+    with timings.phase("onions"):
+        pass
+
+    with timings.phase("network"):
+        time.sleep(0.01)
+
+    assert list(timings.phases) == ["network", "onions"]
+    assert timings.phases["network"] >= 0.02
+    assert timings.total >= timings.phases["network"]
+    summary = timings.summary()
+    assert summary.index("network ") < summary.index("onions ") < summary.index("(total ")
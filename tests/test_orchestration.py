@@ -0,0 +1,194 @@
+"""Requestor orchestration tests on the fake runtime."""
+
+from contextlib import contextmanager
+import time
+
+import pytest
+from requests_whaor.control import NEWNYM_RATE_LIMIT
+from requests_whaor.core import RequestsWhaor
+from requests_whaor.runtime import FakeRuntime
+
+BOOTSTRAPPED = "Bootstrapped 100% (done): Done"
+
+
+@contextmanager
+def _whaor(**options):
+    """Start a requestor on the fake runtime, yielding it with the runtime."""
+    runtime = FakeRuntime(output=BOOTSTRAPPED)
+    options.setdefault("ready_timeout", 1)
+
+    with RequestsWhaor(runtime=runtime, **options) as requestor:
+        yield requestor, runtime
+
+
+def _states(requestor):
+    """Return each state set on the balancer, as (server, state)."""
+    commands = requestor.onion_balancer.container.commands
+
+    return [
+        (command.split()[2].split("/")[1], command.split()[-1])
+        for command in commands
+        if command.startswith("set server") and " state " in command
+    ]
+
+
+def _statuses(requestor):
+    """Return the status of each server routing to an onion."""
+    return {
+        name: stats.status for name, stats in requestor.onion_balancer.stats(0).servers.items()
+    }
+
+
+def test_rolling_restart_goes_a_batch_at_a_time():
+    with _whaor(onion_count=4) as (requestor, runtime):
+        names = [onion.container_name for onion in requestor.onions]
+        requestor.rolling_restart_onions(batch_size=3, drain_timeout=1)
+
+        states = _states(requestor)
+        statuses = _statuses(requestor)
+
+    first, second = ["drain"] * 3 + ["maint"] * 3 + ["ready"] * 3, ["drain", "maint", "ready"]
+
+    assert [state for _, state in states] == first + second
+    assert {server for server, _ in states[:9]} == set(names[:3])
+    assert states[9][0] == names[3]
+    assert [name for action, name in runtime.events if action == "restart"][3] == names[3]
+    assert set(statuses.values()) == {"UP"}
+
+
+def test_rolling_restart_stops_waiting_for_sessions_after_drain_timeout():
+    with _whaor(onion_count=2) as (requestor, runtime):
+        busy = requestor.onions[0].container_name
+        requestor.onion_balancer.container.servers[busy]["scur"] = "3"
+
+        start = time.monotonic()
+        requestor.rolling_restart_onions(batch_size=1, drain_timeout=0.3)
+        elapsed = time.monotonic() - start
+
+        statuses = _statuses(requestor)
+
+    assert 0.3 <= elapsed < 1
+    assert [name for action, name in runtime.events if action == "restart"][0] == busy
+    assert set(statuses.values()) == {"UP"}
+
+
+def test_failed_replacement_is_put_back_into_rotation():
+    with _whaor(onion_count=3) as (requestor, runtime):
+        failing = requestor.onions[0]
+        failing.container.output = ""
+
+        with pytest.raises(TimeoutError):
+            requestor.rolling_restart_onions(batch_size=1, drain_timeout=1)
+
+        statuses = _statuses(requestor)
+
+    assert [name for action, name in runtime.events if action == "restart"] == [
+        failing.container_name
+    ]
+    assert set(statuses.values()) == {"UP"}
+
+
+def test_scaling_up_routes_through_spare_slots():
+    with _whaor(onion_count=2, max_onions=3) as (requestor, runtime):
+        requestor.scale_to(3)
+
+        added = requestor.onions[2]
+        servers = dict(requestor.onion_balancer.servers)
+        statuses = _statuses(requestor)
+        commands = requestor.onion_balancer.container.commands
+
+    port = added.container.ports[9050]
+
+    assert servers["spare1"] == added.container_name
+    assert statuses["spare1"] == "UP"
+    assert f"set server onions/spare1 addr 127.0.0.1 port {port}" in commands
+
+
+def test_scaling_past_the_spare_slots_is_refused():
+    with _whaor(onion_count=2, max_onions=3) as (requestor, runtime):
+        requestor.scale_to(3)
+
+        with pytest.raises(ValueError):
+            requestor.scale_to(4)
+
+        with pytest.raises(ValueError, match="No free server slots"):
+            requestor._add_onion()  # pylint: disable=protected-access
+
+        started = runtime.containers[-1]
+
+        assert len(requestor.onions) == 3
+        assert started.status == "exited"
+
+
+def test_removed_onions_free_their_slots():
+    with _whaor(onion_count=2, max_onions=3) as (requestor, runtime):
+        first, removed = requestor.onions
+        requestor.scale_to(3)
+        requestor.scale_to(1)
+
+        freed = dict(requestor.onion_balancer.servers)
+        states = _states(requestor)
+
+        requestor.scale_to(3)
+        servers = requestor.onion_balancer.servers
+
+        assert requestor.onions[0] is first
+        assert removed.container.status == "exited"
+        assert freed == {
+            first.container_name: first.container_name,
+            removed.container_name: None,
+            "spare1": None,
+        }
+        assert (removed.container_name, "maint") in states
+        assert None not in servers.values()
+        assert len(set(servers.values())) == 3
+
+
+def test_renew_identity_honours_the_newnym_rate_limit():
+    with _whaor(onion_count=3) as (requestor, runtime):
+        first, second, third = requestor.onions
+
+        renewed = requestor.renew_identity([first, second])
+
+        assert {onion.container_name for onion in renewed} == {
+            first.container_name,
+            second.container_name,
+        }
+        assert requestor.renew_identity() == [third]
+        assert requestor.renew_identity() == []
+
+        first.last_newnym -= NEWNYM_RATE_LIMIT
+
+        assert requestor.renew_identity() == [first]
+
+    signals = [onion.container.commands.count("SIGNAL NEWNYM") for onion in (first, second, third)]
+
+    assert signals == [2, 1, 1]
+
+
+def test_startup_times_out_when_tor_never_bootstraps():
+    runtime = FakeRuntime(output="Bootstrapped 80% (ap_conn): Connecting to a relay")
+    start = time.monotonic()
+
+    with pytest.raises(TimeoutError):
+        with RequestsWhaor(onion_count=2, runtime=runtime, ready_timeout=0.3):
+            pass
+
+    assert time.monotonic() - start < 1
+    assert all(container.status == "exited" for container in runtime.containers)
+
+
+def test_readiness_waits_for_every_server_to_be_up():
+    with _whaor(onion_count=2) as (requestor, runtime):
+        assert 0 <= requestor.time_to_ready < 1
+
+        server = requestor.onions[1].container_name
+        requestor.onion_balancer.container.servers[server]["status"] = "DOWN"
+        requestor.ready_timeout = 0.3
+
+        with pytest.raises(TimeoutError):
+            requestor.wait_until_ready()
+
+        requestor.onion_balancer.container.servers[server]["status"] = "UP 1/2"
+
+        assert requestor.wait_until_ready() < 0.3
@@ -0,0 +1,45 @@
+"""Retry policy tests."""
+
+from requests_whaor.ratelimit import TokenBucket
+from requests_whaor.retry import RetryPolicy
+
+
+def test_status_classification():
+    policy = RetryPolicy()
+
+    assert policy.is_retryable(503)
+    assert policy.is_retryable(429)
+    assert not policy.is_retryable(404)
+    assert not policy.is_retryable(410)
+
+
+def test_backoff_is_capped_full_jitter():
+    policy = RetryPolicy(backoff_base=1, backoff_max=4)
+
+    for attempt in range(1, 10):
+        delay = policy.backoff(attempt)
+        assert 0 <= delay <= min(2 ** (attempt - 1), 4)
+
+
+def test_max_attempts():
+    policy = RetryPolicy(max_attempts=3, budget_rate=None)
+
+    assert policy.should_retry(1)
+    assert policy.should_retry(2)
+    assert not policy.should_retry(3)
+
+
+def test_budget_is_shared():
+    policy = RetryPolicy(max_attempts=10, budget_rate=0.001, budget_burst=2)
+
+    assert policy.should_retry(1)
+    assert policy.should_retry(1)
+    assert not policy.should_retry(1)
+
+
+def test_token_bucket_refills():
+    bucket = TokenBucket(rate=1000, capacity=1)
+
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire(2)
+    assert bucket.tokens <= 1
@@ -0,0 +1,138 @@
+"""Client side routing tests."""
+
+import pytest
+from requests_whaor.routing import CircuitRouter
+
+
+class StubOnion:
+    def __init__(self, name):
+        self.container_name = name
+
+
+def _router(strategy="ewma", names=("a", "b")):
+    return CircuitRouter([StubOnion(name) for name in names], strategy=strategy)
+
+
+def test_unknown_strategy_is_refused():
+    with pytest.raises(ValueError):
+        _router(strategy="random")
+
+
+def test_ewma_picks_the_faster_of_two():
+    router = _router()
+    fast, slow = router.onions
+
+    router.load(fast).latency.update(0.1)
+    router.load(slow).latency.update(2)
+
+    assert all(router.pick() is fast for _ in range(20))
+
+    router.load(fast).outstanding = 30
+
+    assert all(router.pick() is slow for _ in range(20))
+
+
+def test_least_outstanding_picks_the_idlest():
+    router = _router(strategy="least_outstanding", names=("a", "b", "c"))
+    busy, idle, _ = router.onions
+
+    router.load(busy).outstanding = 2
+    router.load(router.onions[2]).outstanding = 1
+
+    assert all(router.pick() is idle for _ in range(20))
+
+
+def test_route_tracks_outstanding_and_failures():
+    router = _router(names=("a",))
+    onion = router.onions[0]
+
+    with router.route() as routed:
+        assert routed is onion
+        assert router.load(onion).outstanding == 1
+
+    assert router.load(onion).outstanding == 0
+    assert router.load(onion).latency.value < 1
+
+    with pytest.raises(ConnectionError):
+        with router.route():
+            raise ConnectionError
+
+    assert router.load(onion).outstanding == 0
+    assert router.load(onion).latency.value > 1
+
+
+def test_sticky_keys_keep_their_onion():
+    router = _router(names=("a", "b", "c", "d"))
+
+    onion = router.pick(sticky_key="user")
+
+    assert all(router.pick(sticky_key="user") is onion for _ in range(20))
+
+    router.unstick("user")
+    router.load(onion).latency.update(100)
+
+    assert router.pick(sticky_key="user") is not onion
+
+
+def test_failures_unstick_the_key():
+    router = _router(names=("a", "b"))
+    onion = router.pick(sticky_key="user")
+
+    with pytest.raises(ConnectionError):
+        with router.route(sticky_key="user"):
+            raise ConnectionError
+
+    assert router.pick(sticky_key="user") is not onion
+
+
+def test_exclude_falls_back_to_every_onion():
+    router = _router(names=("a", "b"))
+
+    assert all(router.pick(exclude={"a"}).container_name == "b" for _ in range(20))
+    assert router.pick(exclude={"a", "b"}) in router.onions
+
+
+def test_disabled_onions_are_never_picked():
+    router = _router(names=("a", "b"))
+    first, second = router.onions
+
+    router.disable(first)
+
+    assert all(router.pick(exclude={"b"}) is second for _ in range(20))
+
+    router.disable(second)
+
+    with pytest.raises(LookupError):
+        router.pick()
+
+    router.enable(first)
+
+    assert router.pick() is first
+
+
+def test_sticky_keys_are_capped_least_recently_used_first():
+    router = CircuitRouter([StubOnion(name) for name in "abcd"], max_sticky_keys=2)
+
+    first = router.pick(sticky_key=1)
+    router.pick(sticky_key=2)
+    router.pick(sticky_key=1)
+    router.pick(sticky_key=3)
+
+    assert list(router._sticky) == [1, 3]  # pylint: disable=protected-access
+    assert router.pick(sticky_key=1) is first
+
+
+def test_disabled_and_forgotten_onions_are_unstuck():
+    router = _router(names=("a", "b"))
+    first, second = router.onions
+
+    router.pick(sticky_key="disabled", exclude={"b"})
+    router.pick(sticky_key="removed", exclude={"a"})
+    router.load(second).outstanding = 1
+    router.disable(first)
+    router.disable(second)
+    router.forget(second)
+
+    assert not router._sticky  # pylint: disable=protected-access
+    assert router.load(second).outstanding == 0
+    assert router.pick() is second
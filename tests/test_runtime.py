@@ -0,0 +1,164 @@
+"""Container runtime tests, none of which need Docker."""
+
+import sys
+import time
+
+from docker.types import Mount
+import pytest
+from requests_whaor.circuit import CONTROL_PORT, OnionCircuits, SOCKS_PORT
+from requests_whaor.client import ContainerOptions
+from requests_whaor.core import RequestsWhaor
+from requests_whaor.network import WhaorNet
+from requests_whaor.runtime import (
+    FakeRuntime,
+    LocalProcessRuntime,
+    render_command,
+    tar_files,
+    untar_files,
+)
+
+
+def test_render_command():
+    options = ContainerOptions(
+        command=["tor", "--SocksPort", "{interface}:{ports[9050]}", "{data_dir}"]
+    )
+
+    assert render_command(options, {9050: 20000}, "/data", "127.0.0.1") == [
+        "tor",
+        "--SocksPort",
+        "127.0.0.1:20000",
+        "/data",
+    ]
+    assert render_command(ContainerOptions(), {}, None, "0.0.0.0") is None
+
+
+def test_tar_files_round_trip():
+    files = {"cached-certs": b"certs", "cached-microdesc-consensus": b"\x00consensus"}
+
+    assert untar_files(tar_files(files)) == files
+
+
+def test_onion_circuits_on_fake_runtime():
+    runtime = FakeRuntime(output="Bootstrapped 100% (done): Done")
+
+    with OnionCircuits(3, runtime=runtime) as onions:
+        for onion in onions:
+            onion.wait_until_ready(timeout=1)
+
+        onion = onions[0]
+        ports = onion.container.ports
+
+        assert ports[SOCKS_PORT] != ports[CONTROL_PORT]
+        assert onion.address == f"socks5://localhost:{ports[SOCKS_PORT]}"
+
+        onion.restart()
+
+    assert [action for action, _ in runtime.events] == ["run"] * 3 + ["restart"] + ["stop"] * 3
+    assert all(container.status == "exited" for container in runtime.containers)
+
+
+def test_onion_circuits_serve_isolated_socks_ports():
+    runtime = FakeRuntime()
+
+    with OnionCircuits(2, runtime=runtime, circuits_per_container=3) as onions:
+        onion = onions[0]
+        command = onion.container_options.command
+
+        assert onion.socks_ports == [SOCKS_PORT, SOCKS_PORT + 1, SOCKS_PORT + 2]
+        assert command.count("--SocksPort") == 3
+        assert "{interface}:{ports[9052]} IsolateDestAddr IsolateSOCKSAuth" in command
+        assert len(set(onion.container.ports.values())) == 4
+
+
+def test_whaornet_on_fake_runtime():
+    runtime = FakeRuntime()
+
+    with WhaorNet(runtime=runtime) as network, OnionCircuits(2, runtime=runtime) as onions:
+        for onion in onions:
+            network.connect_container(onion.container)
+
+        assert network.containers == [onion.container for onion in onions]
+        assert network.container_address(onions[1].container, SOCKS_PORT) == (
+            "127.0.0.1",
+            onions[1].container.ports[SOCKS_PORT],
+        )
+
+    assert network.containers == []
+
+
+def test_containers_start_connected_to_the_network():
+    runtime = FakeRuntime()
+
+    with WhaorNet(runtime=runtime) as network:
+        runtime.prepare(["tor:1", "haproxy:2", "tor:1"])
+
+        with OnionCircuits(4, startup_with_threads=True, max_threads=4, network=network) as onions:
+            assert all(onion.runtime is runtime for onion in onions)
+            assert len(network.containers) == 4
+            assert {container.name for container in network.containers} == {
+                onion.container_name for onion in onions
+            }
+
+    assert runtime.events[:2] == [("prepare", "tor:1"), ("prepare", "haproxy:2")]
+
+
+def test_requests_whaor_on_fake_runtime():
+    runtime = FakeRuntime(output="Bootstrapped 100% (done): Done")
+
+    with RequestsWhaor(onion_count=2, runtime=runtime, ready_timeout=5) as requestor:
+        balancer = requestor.onion_balancer
+        stats = balancer.stats()
+
+        assert sorted(stats.servers) == sorted(onion.container_name for onion in requestor.onions)
+        assert all(server.is_up for server in stats.servers.values())
+        assert len(requestor.renew_identity()) == 2
+        assert "SIGNAL NEWNYM" in requestor.onions[0].container.commands
+        assert "show stat" in balancer.container.commands
+
+        with pytest.raises(ValueError):
+            balancer.set_server_state("spare9", "ready")
+
+    assert all(container.status == "exited" for container in runtime.containers)
+
+    with pytest.raises(ConnectionRefusedError):
+        requestor.onions[0].controller.signal("NEWNYM")
+
+
+def test_local_process_runtime(tmp_path):
+    source = tmp_path / "source.conf"
+    options = ContainerOptions(
+        command=[
+            sys.executable,
+            "-c",
+            "import sys, time; print(' '.join(sys.argv[1:]), flush=True); time.sleep(30)",
+            "{interface}:{ports[80]}",
+            "{data_dir}",
+            "/etc/target.conf",
+        ],
+        mounts=[Mount(target="/etc/target.conf", source=str(source), type="bind")],
+        ports={80: ("127.0.0.1", None), 81: 8181},
+    )
+    runtime = LocalProcessRuntime(base_directory=str(tmp_path))
+    container = runtime.run(options)
+
+    try:
+        deadline = time.monotonic() + 10
+
+        while not runtime.logs(container) and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        port = runtime.host_port(container, 80)
+
+        assert runtime.status(container) == "running"
+        assert runtime.host_port(container, 81) == 8181
+        assert runtime.logs(container).split() == [
+            f"127.0.0.1:{port}",
+            str(container.data_dir),
+            str(source),
+        ]
+
+    finally:
+        runtime.stop(container, timeout=5)
+
+    assert runtime.status(container) == "exited"
+    assert not container.workdir.exists()
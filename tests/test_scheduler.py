@@ -0,0 +1,120 @@
+"""Per host scheduler tests."""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from pydantic import ValidationError
+import pytest
+import requests
+from requests_whaor.scheduler import HostLimits, retry_after, Scheduler
+
+
+def test_retry_after():
+    assert retry_after(requests.structures.CaseInsensitiveDict({"retry-after": "2"})) == 2
+    assert retry_after({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0
+    assert retry_after({"Retry-After": "soon"}) is None
+    assert retry_after({}) is None
+
+
+@pytest.mark.parametrize(
+    "limits", [{"rate": 0}, {"rate": -1}, {"burst": 0.5}, {"max_concurrency": 0}]
+)
+def test_host_limits_must_let_requests_through(limits):
+    with pytest.raises(ValidationError):
+        HostLimits(**limits)
+
+
+def test_concurrency_cap_per_host():
+    scheduler = Scheduler(hosts={"slow.com": HostLimits(max_concurrency=2)})
+    lock = threading.Lock()
+    active = {"slow.com": 0, "fast.com": 0}
+    peak = dict(active)
+
+    def request(url):
+        host = scheduler.host_of(url)
+
+        with scheduler.slot(url):
+            with lock:
+                active[host] += 1
+                peak[host] = max(peak[host], active[host])
+
+            time.sleep(0.05)
+
+            with lock:
+                active[host] -= 1
+
+    urls = ["http://slow.com/a"] * 6 + ["http://FAST.com/b"] * 6
+
+    with ThreadPoolExecutor(max_workers=12) as executor:
+        list(executor.map(request, urls))
+
+    assert peak == {"slow.com": 2, "fast.com": 6}
+    assert scheduler.snapshot()["hosts"]["slow.com"] == {"active": 0, "queued": 0}
+    assert scheduler.counts.snapshot()["admitted"] == 12
+
+
+def test_rate_and_fifo_order():
+    scheduler = Scheduler(HostLimits(rate=20, burst=1))
+    admitted = []
+
+    def request(index):
+        with scheduler.slot("http://example.com/"):
+            admitted.append((index, time.monotonic()))
+
+    threads = []
+
+    for index in range(5):
+        threads.append(threading.Thread(target=request, args=(index,)))
+        threads[-1].start()
+        time.sleep(0.005)
+
+    for thread in threads:
+        thread.join()
+
+    assert [index for index, _ in admitted] == list(range(5))
+    assert admitted[-1][1] - admitted[0][1] >= 4 / 20 * 0.9
+
+
+def test_politeness_delay_and_retry_after():
+    scheduler = Scheduler(HostLimits(delay=0.05))
+
+    start = time.monotonic()
+
+    for _ in range(3):
+        with scheduler.slot("http://example.com/"):
+            pass
+
+    assert time.monotonic() - start >= 0.1
+
+    scheduler.observe("http://example.com/", 429, {"Retry-After": "0.2"})
+    start = time.monotonic()
+
+    with scheduler.slot("http://example.com/other"):
+        assert time.monotonic() - start >= 0.15
+
+    assert scheduler.counts.snapshot()["deferred"] == 1
+
+
+def test_async_slots_share_limits_with_threads():
+    scheduler = Scheduler(HostLimits(max_concurrency=1))
+    order = []
+
+    async def request(index):
+        async with scheduler.async_slot("http://example.com/"):
+            order.append(("start", index))
+            await asyncio.sleep(0.02)
+            order.append(("end", index))
+
+    async def main():
+        with scheduler.slot("http://example.com/"):
+            tasks = [asyncio.ensure_future(request(index)) for index in range(3)]
+            await asyncio.sleep(0.05)
+            assert order == []
+
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+
+    assert order == [(event, index) for index in range(3) for event in ("start", "end")]
@@ -0,0 +1,89 @@
+"""Pooled keep-alive session tests."""
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from benchmarks.servers import serve, SOCKS5Server
+from requests_whaor.core import Requestor
+from requests_whaor.session import pop_connect_time, SessionOptions, SessionPool
+
+
+def test_sized_for():
+    options = SessionOptions.sized_for(20, 5, pool_maxsize=None, pool_block=True)
+
+    assert (options.pool_connections, options.pool_maxsize) == (20, 20)
+    assert options.pool_block
+    assert SessionOptions.sized_for(2, 50).pool_maxsize == 50
+
+
+def test_threads_get_their_own_session_with_a_shared_adapter():
+    pool = SessionPool()
+    barrier = threading.Barrier(2)
+
+    def session(_):
+        barrier.wait()
+        return pool.session()
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        sessions = list(executor.map(session, range(2)))
+
+    assert sessions[0] is not sessions[1]
+    assert pool.session() is pool.session()
+    assert all(session.get_adapter("http://") is pool.adapter for session in sessions)
+
+
+def test_adapter_is_recycled_after_keep_alive():
+    pool = SessionPool(SessionOptions(keep_alive=None))
+    adapter = pool.adapter
+
+    assert pool.adapter is adapter
+
+    pool = SessionPool(SessionOptions(keep_alive=0))
+    adapter = pool.adapter
+    time.sleep(0.01)
+    session = pool.session()
+
+    assert pool.adapter is not adapter
+    assert session.get_adapter("https://") is not adapter
+
+
+def test_connections_are_kept_alive_per_proxy(servers):
+    proxy, target = servers
+    other = SOCKS5Server()
+    serve(other)
+
+    pool = SessionPool(SessionOptions(keep_alive=None))
+
+    def get(proxy):
+        response = pool.session().get(target.url, proxies=proxy.proxies, timeout=5)
+        return response.ok, pop_connect_time()
+
+    try:
+        first, reused = get(proxy), get(proxy)
+        get(other)
+
+        pool.close_proxy(proxy.address)
+        reopened, still_open = get(proxy), get(other)
+
+    finally:
+        pool.close()
+        other.shutdown()
+
+    assert first[0] and first[1] is not None
+    assert reused == (True, None)
+    assert reopened[0] and reopened[1] is not None
+    assert still_open == (True, None)
+
+
+def test_requestor_passes_positional_params(servers):
+    proxy, target = servers
+    requestor = Requestor(onions=[], onion_balancer=proxy, timeout=5, max_retries=1)
+
+    try:
+        response = requestor.get(target.url, {"size": 4})
+
+    finally:
+        requestor.close()
+
+    assert response.content == b"xxxx"
@@ -0,0 +1,164 @@
+"""Resumable stream tests."""
+
+from http.server import BaseHTTPRequestHandler
+import io
+
+import pytest
+import requests
+from requests_whaor.core import Requestor
+from requests_whaor.stream import parse_content_range, ResumableStream, StreamError
+
+BODY = bytes(range(256)) * 1024
+
+
+class BrokenRaw(io.BytesIO):
+    """Raw body which breaks the connection after a number of bytes."""
+
+    def __init__(self, content, break_after=None):
+        super().__init__(content)
+        self.break_after = break_after
+
+    def read(self, size=-1):
+        if self.break_after is not None and self.tell() >= self.break_after:
+            raise requests.exceptions.ConnectionError("Connection reset by peer.")
+
+        if self.break_after is not None:
+            size = min(size, self.break_after - self.tell())
+
+        return super().read(size)
+
+
+def _response(status_code=200, content=BODY, break_after=None, **headers):
+    response = requests.models.Response()
+    response.status_code = status_code
+    response.headers = requests.structures.CaseInsensitiveDict(headers)
+    response.raw = BrokenRaw(content, break_after)
+    response.url = "http://example.com/file"
+
+    return response
+
+
+def test_parse_content_range():
+    assert parse_content_range("bytes 100-199/1000") == (100, 199, 1000)
+    assert parse_content_range("bytes 0-9/*") == (0, 9, None)
+    assert parse_content_range("items 0-9/10") is None
+    assert parse_content_range(None) is None
+
+
+def test_stream_resumes_with_a_range_request():
+    sent = []
+
+    def reopen(headers):
+        sent.append(headers)
+        start = int(headers["Range"][len("bytes=") : -1])
+        return _response(
+            206,
+            BODY[start:],
+            ETag='"v1"',
+            **{"Content-Range": f"bytes {start}-{len(BODY) - 1}/{len(BODY)}"},
+        )
+
+    first = _response(200, break_after=100000, ETag='"v1"', **{"Content-Length": str(len(BODY))})
+    stream = ResumableStream(first, reopen, chunk_size=4096)
+    sink = io.BytesIO()
+
+    assert stream.write_to(sink) == len(BODY)
+    assert sink.getvalue() == BODY
+    assert stream.resumes == 1
+    assert sent == [{"Range": "bytes=100000-", "If-Range": '"v1"'}]
+
+
+def test_stream_skips_what_it_read_when_the_range_is_ignored():
+    first = _response(200, break_after=5000, **{"Content-Length": str(len(BODY))})
+    second = _response(200, **{"Content-Length": str(len(BODY))})
+    stream = ResumableStream(first, lambda headers: second, chunk_size=1024)
+
+    assert b"".join(stream) == BODY
+    assert max(len(chunk) for chunk in ResumableStream(_response(), None, 1024)) == 1024
+
+
+def test_stream_refuses_a_changed_body():
+    first = _response(200, break_after=5000, ETag='"v1"')
+    stream = ResumableStream(first, lambda headers: _response(200, ETag='"v2"'))
+
+    with pytest.raises(StreamError):
+        b"".join(stream)
+
+
+def test_stream_refuses_a_body_modified_since():
+    first = _response(
+        200,
+        b"A" * 10,
+        break_after=4,
+        **{"Content-Length": "10", "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"},
+    )
+    changed = _response(
+        200,
+        b"B" * 10,
+        **{"Content-Length": "10", "Last-Modified": "Tue, 02 Jan 2024 00:00:00 GMT"},
+    )
+    sent = []
+    stream = ResumableStream(first, lambda headers: sent.append(headers) or changed)
+
+    with pytest.raises(StreamError):
+        b"".join(stream)
+
+    assert sent[0]["If-Range"] == "Mon, 01 Jan 2024 00:00:00 GMT"
+
+
+def test_unresumable_stream_raises_when_it_breaks():
+    stream = ResumableStream(_response(200, break_after=5000), lambda headers: _response())
+
+    assert not stream.resumable
+
+    with pytest.raises(StreamError):
+        b"".join(stream)
+
+
+class FlakyRangeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    ranges = []
+
+    def do_GET(self):  # noqa: N802
+        requested = self.headers.get("Range")
+        self.ranges.append(requested)
+        start = 0 if requested is None else int(requested[len("bytes=") : -1])
+
+        self.send_response(200 if requested is None else 206)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(BODY) - start))
+
+        if requested is not None:
+            self.send_header("Content-Range", f"bytes {start}-{len(BODY) - 1}/{len(BODY)}")
+
+        self.end_headers()
+
+        if requested is None:
+            self.wfile.write(BODY[: len(BODY) // 2])
+            self.close_connection = True
+            return
+
+        self.wfile.write(BODY[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+def test_requestor_stream_resumes_through_the_proxy(tmp_path, servers):
+    proxy, target = servers
+    target.RequestHandlerClass = FlakyRangeHandler
+
+    requestor = Requestor(onions=[], onion_balancer=proxy, timeout=5, max_retries=2)
+    path = tmp_path / "body.bin"
+
+    try:
+        with requestor.stream(target.url, chunk_size=8192) as stream:
+            written = stream.write_to(path)
+
+    finally:
+        requestor.close()
+
+    assert written == len(BODY)
+    assert path.read_bytes() == BODY
+    assert FlakyRangeHandler.ranges == [None, f"bytes={len(BODY) // 2}-"]
+    assert requestor.metrics.retries.snapshot() == {"resume": 1}
@@ -0,0 +1,75 @@
+"""Adaptive timeout tests."""
+
+from requests_whaor.core import Requestor
+from requests_whaor.timeouts import AdaptiveTimeouts
+
+
+def test_default_until_enough_samples():
+    timeouts = AdaptiveTimeouts(min_samples=5)
+
+    for _ in range(4):
+        timeouts.observe("http://example.com/", connect=0.5, read=1)
+
+    assert timeouts.timeout("http://example.com/", default=7) == (7, 7)
+
+    timeouts.observe("http://example.com/", connect=0.5, read=1)
+
+    connect, read = timeouts.timeout("http://EXAMPLE.com/a", default=7)
+    assert 1 <= connect <= 1.5
+    assert 2 <= read <= 3
+    assert timeouts.timeout("http://other.com/", default=7) == (7, 7)
+
+
+def test_timeouts_are_bounded():
+    timeouts = AdaptiveTimeouts(connect_bounds=(2, 10), read_bounds=(3, 20), min_samples=1)
+
+    timeouts.observe("http://example.com/", connect=0.01, read=0.01)
+    assert timeouts.timeout("http://example.com/") == (2, 3)
+
+    for _ in range(100):
+        timeouts.observe("http://example.com/", connect=60, read=60)
+
+    assert timeouts.timeout("http://example.com/") == (10, 20)
+
+
+def test_circuit_connect_times_come_first():
+    timeouts = AdaptiveTimeouts(factor=1, connect_bounds=(0, 100), min_samples=3)
+
+    for _ in range(3):
+        timeouts.observe("http://example.com/", "tor-fast", connect=0.04)
+        timeouts.observe("http://example.com/", "tor-slow", connect=8)
+
+    assert timeouts.timeout("http://example.com/", "tor-fast")[0] <= 0.05
+    assert timeouts.timeout("http://example.com/", "tor-slow")[0] >= 5
+    assert 0.05 < timeouts.timeout("http://example.com/", "tor-new")[0] < 10
+
+
+def test_static_host_timeouts_override():
+    timeouts = AdaptiveTimeouts(min_samples=1, hosts={"Slow.example.com": (10, 60)})
+
+    timeouts.observe("http://slow.example.com/", connect=0.01, read=0.01)
+
+    assert timeouts.timeout("http://slow.example.com/") == (10, 60)
+
+
+def test_effective_timeouts_are_in_the_metrics(servers):
+    proxy, target = servers
+
+    timeouts = AdaptiveTimeouts(min_samples=2)
+    requestor = Requestor(
+        onions=[], onion_balancer=proxy, timeout=5, max_retries=1, adaptive_timeouts=timeouts
+    )
+
+    try:
+        for _ in range(3):
+            assert requestor.get(target.url).ok
+
+        snapshot = requestor.metrics.snapshot()
+        exposition = requestor.metrics.to_prometheus()
+
+    finally:
+        requestor.close()
+
+    assert timeouts.read_by_host.get("127.0.0.1").count == 3
+    assert snapshot["timeouts"]["127.0.0.1"]["read"] == timeouts.read_bounds[0]
+    assert 'phase="read"' in exposition
@@ -0,0 +1,74 @@
+"""TOR directory cache tests."""
+
+import os
+import time
+
+from requests_whaor.circuit import OnionCircuits, TORRC_PATH, TorrcMountPoint
+from requests_whaor.runtime import FakeRuntime
+from requests_whaor.tor_cache import CONSENSUS_FILE, consensus_valid_until, TorCache
+
+
+def _consensus(valid_until):
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(valid_until))
+    return f"network-status-version 3 microdesc\nvalid-until {stamp}\n".encode()
+
+
+def test_consensus_valid_until():
+    assert consensus_valid_until(_consensus(1600000000)) == 1600000000
+    assert consensus_valid_until(b"not a consensus") is None
+
+
+def test_store_keeps_the_newest_consensus(tmp_path):
+    cache = TorCache(tmp_path)
+    now = time.time()
+
+    assert cache.load() == {}
+    assert not cache.store({"cached-certs": b"certs"})
+    assert cache.store({CONSENSUS_FILE: _consensus(now + 60), "cached-certs": b"certs"})
+    assert not cache.store({CONSENSUS_FILE: _consensus(now + 30)})
+    assert cache.load()["cached-certs"] == b"certs"
+
+    assert cache.store({CONSENSUS_FILE: _consensus(now + 120)})
+    assert list(cache.load()) == [CONSENSUS_FILE]
+    assert not [path for path in os.listdir(tmp_path) if path.startswith(".")]
+
+
+def test_size_and_staleness_are_bounded(tmp_path):
+    consensus = _consensus(time.time() - 120)
+    cache = TorCache(tmp_path, max_bytes=len(consensus) + 10, max_stale=60)
+
+    files = {CONSENSUS_FILE: consensus, "cached-certs": b"certs", "cached-microdescs": b"x" * 64}
+    assert cache.store(files)
+    assert cache.size == len(consensus) + 5
+
+    assert not cache.is_usable()
+    assert cache.load() == {}
+    assert cache.size == 0
+
+
+def test_torrc_mount_point():
+    with TorrcMountPoint({"ExitNodes": "{de}"}) as torrc:
+        with open(torrc.source_path) as file:
+            content = file.read()
+
+    assert torrc.mount["Target"] == TORRC_PATH
+    assert "Log notice stdout" in content
+    assert "ExitNodes {de}" in content
+
+
+def test_circuits_are_seeded_from_and_update_the_cache(tmp_path):
+    runtime = FakeRuntime()
+    cache = TorCache(tmp_path)
+    cache.store({CONSENSUS_FILE: _consensus(time.time() + 60)})
+
+    with OnionCircuits(2, runtime=runtime, tor_cache=cache) as onions:
+        for onion in onions:
+            assert onion.container.files == cache.load()
+            assert onion.container_options.files == {}
+            assert [mount["Target"] for mount in onion.container_options.mounts] == [TORRC_PATH]
+
+        newer = {CONSENSUS_FILE: _consensus(time.time() + 3600), "cached-certs": b"certs"}
+        onions[0].container.files.update(newer)
+
+        assert cache.update_from(onions[0])
+        assert cache.load() == newer